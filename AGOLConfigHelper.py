@@ -127,5 +127,49 @@ def readConfig():
         print("No maxRecordCount chosen.")
         sys.exit()
         
-    dictAGOLConfig["overwriteService"] = 0
+    #Checks the optional number of simultaneous chunk uploads and retries of failed chunks
+    try:
+        dictAGOLConfig["uploadWorkers"] = int(data.get("uploadWorkers", 4))
+        dictAGOLConfig["uploadRetries"] = int(data.get("uploadRetries", 3))
+        if dictAGOLConfig["uploadWorkers"] < 1 or dictAGOLConfig["uploadRetries"] < 0:
+            raise ValueError
+    except:
+        print("uploadWorkers must be at least 1 and uploadRetries must not be negative.")
+        sys.exit()
+        
+    #Checks the optional settings of the adaptive chunk sizes of uploads
+    try:
+        uploadBatch = {"initialSize": 500, "minSize": 10, "maxSize": 2000, "maxBytes": 10000000, "maxVertices": 250000, "targetSeconds": 15}
+        uploadBatch.update(data.get("uploadBatch", {}))
+        for key in ["initialSize", "minSize", "maxSize", "maxBytes", "maxVertices"]:
+            uploadBatch[key] = int(uploadBatch[key])
+        uploadBatch["targetSeconds"] = float(uploadBatch["targetSeconds"])
+        if not 1 <= uploadBatch["minSize"] <= uploadBatch["initialSize"] <= uploadBatch["maxSize"] or uploadBatch["maxBytes"] < 1 or uploadBatch["maxVertices"] < 1 or uploadBatch["targetSeconds"] <= 0:
+            raise ValueError
+        dictAGOLConfig["uploadBatch"] = uploadBatch
+    except:
+        print("uploadBatch is invalid, the sizes must satisfy 1 <= minSize <= initialSize <= maxSize, maxBytes, maxVertices and targetSeconds must be positive.")
+        sys.exit()
+        
+    #Checks the optional folder of the upload journal
+    try:
+        dictAGOLConfig["journalDirectory"] = str(data.get("journalDirectory", "upload_journal"))
+        if len(dictAGOLConfig["journalDirectory"].strip()) == 0:
+            raise ValueError
+    except:
+        print("No journalDirectory chosen.")
+        sys.exit()
+        
+    #Checks the optional settings of the incremental synchronization of an existing service
+    try:
+        deltaSync = {"isEnabled": "no", "stateFile": "sync_state.json", "overlapMinutes": 60}
+        deltaSync.update(data.get("deltaSync", {}))
+        deltaSync["overlapMinutes"] = int(deltaSync["overlapMinutes"])
+        if deltaSync["isEnabled"] not in ["yes", "no"] or len(deltaSync["stateFile"]) == 0 or deltaSync["overlapMinutes"] < 0:
+            raise ValueError
+        dictAGOLConfig["deltaSync"] = deltaSync
+    except:
+        print("deltaSync is invalid, isEnabled must be yes or no, a stateFile must be chosen and overlapMinutes must not be negative.")
+        sys.exit()
+        
     return dictAGOLConfig
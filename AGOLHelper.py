@@ -12,26 +12,39 @@ publish the Feature Collection.
 '''
 
 import datetime
+import time
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from arcgis import features as fs
 from arcgis.gis import GIS
 import progressbar
-p = 0
-t_resultlist = []
-t_list = []
+import JournalHelper
 
-def prepareLayerUpload(ftLC, featSetList, i):
+runMetrics = {}
+
+def prepareLayerUpload(layer, featSet, i, agolConfig, journal):
     '''
     Function to prepare upload to ArcGIS Online or another Portal and to react on upload errors.
-    @param ftLC: Contains the layer item on the portal, where the new feature data is stored.
-    @param featSetList: Contains the new features, which are stored in the layer.
+    Only the features, which are not yet committed in the journal, are uploaded, every uploaded chunk is committed to the journal.
+    @param layer: Contains the layer item on the portal, where the new feature data is stored.
+    @param featSet: Contains the Esri JSON featureset with the new features, which are stored in the layer.
     @param i: Contains the layer number.
+    @param agolConfig: A dictionary object containing the AGOL configuration defined in the file agolconfig.json.
+    @param journal: A dictionary with the journal of the upload, see JournalHelper.
     '''
-    status = addFeaturesToLayer(ftLC.layers[i],featSetList[i])
+    ranges = JournalHelper.getUncommittedRanges(journal, i, len(featSet['features']))
+    if len(ranges) == 0:
+        print('All Items in layer '+layer.properties.name+' already uploaded')
+        return
+    onCommit = lambda start, results: JournalHelper.appendJournalCommit(journal, i, start, results)
+    status = addFeaturesToLayer(layer,featSet,agolConfig['uploadWorkers'],agolConfig['uploadRetries'],agolConfig['uploadBatch'],'adds',ranges,onCommit)
     successlist = [elem['success'] for elem in status]
-    if 'False' not in successlist:
-        print('All Items in layer '+ftLC.layers[i].properties.name+' uploaded sucessfully')
+    if False not in successlist and 'False' not in successlist:
+        print('All Items in layer '+layer.properties.name+' uploaded sucessfully')
     else:
-        print('There was an error uploading items in layer '+ftLC.layers[i].properties.name)
+        print('There was an error uploading items in layer '+layer.properties.name)
         raise ValueError("Upload error to portal")      
 
 def createpbar(total):
@@ -54,42 +67,227 @@ def updatepbar(progress, pbar):
         pbar.finish()
     return progress
 
-def addFeaturesToLayer(layer, featlist):
+class AdaptiveBatcher(object):
+    '''
+    Batcher to size the chunks of an upload by the estimated payload size and vertex count of the features.
+    The number of features per chunk grows while the server responds quickly and shrinks on slow responses and errors.
+    '''
+    def __init__(self, batchConfig):
+        '''
+        @param batchConfig: A dictionary with the items "initialSize", "minSize", "maxSize", "maxBytes", "maxVertices" and "targetSeconds".
+        '''
+        self.size = batchConfig['initialSize']
+        self.minSize = batchConfig['minSize']
+        self.maxSize = batchConfig['maxSize']
+        self.maxBytes = batchConfig['maxBytes']
+        self.maxVertices = batchConfig['maxVertices']
+        self.targetSeconds = batchConfig['targetSeconds']
+        self.lock = threading.Lock()
+        self.chunks = []
+
+    def nextChunkEnd(self, features, start, stop=None):
+        '''
+        Function to determine the end of the next chunk, the chunk is limited by the current size, the payload size and the vertex count.
+        Returns the index of the first feature after the chunk.
+        @param features: The list of features to be uploaded.
+        @param start: The index of the first feature of the chunk.
+        @param stop: The index after the last feature the chunk may contain, defaults to the end of the list.
+        '''
+        if stop is None:
+            stop = len(features)
+        with self.lock:
+            size = self.size
+        payload = 0
+        vertices = 0
+        end = start
+        while end < stop and end - start < size:
+            fbytes, fvertices = estimateFeatureSize(features[end])
+            if end > start and (payload + fbytes > self.maxBytes or vertices + fvertices > self.maxVertices):
+                break
+            payload += fbytes
+            vertices += fvertices
+            end += 1
+        with self.lock:
+            self.chunks.append({'features': end - start, 'bytes': payload, 'vertices': vertices})
+        return end
+
+    def report(self, count, seconds, success):
+        '''
+        Function to adapt the chunk size to the response of the server.
+        @param count: The number of features of the uploaded chunk.
+        @param seconds: The response time of the server.
+        @param success: Specifies if the chunk was uploaded successfully.
+        '''
+        with self.lock:
+            if not success:
+                self.size = max(self.minSize, min(self.size, count) // 2)
+            elif seconds > self.targetSeconds:
+                self.size = max(self.minSize, int(count * self.targetSeconds / seconds))
+            elif seconds < self.targetSeconds / 2 and count >= self.size:
+                self.size = min(self.maxSize, int(self.size * 1.5) + 1)
+
+    def metrics(self):
+        '''
+        Function to summarize the chosen chunk sizes, returns a dictionary with the run metrics.
+        '''
+        with self.lock:
+            sizes = [chunk['features'] for chunk in self.chunks]
+            return {'chunks': len(sizes),
+                    'minChunkSize': min(sizes) if sizes else 0,
+                    'maxChunkSize': max(sizes) if sizes else 0,
+                    'meanChunkSize': sum(sizes) / len(sizes) if sizes else 0,
+                    'estimatedBytes': sum(chunk['bytes'] for chunk in self.chunks),
+                    'vertices': sum(chunk['vertices'] for chunk in self.chunks),
+                    'chunkSizes': sizes}
+
+def estimateFeatureSize(feature):
+    '''
+    Function to estimate the serialized size of a feature, returns a tuple with the estimated bytes and the vertex count.
+    @param feature: A feature object or a feature dictionary.
+    '''
+    if not isinstance(feature, dict):
+        feature = {'geometry': feature.geometry, 'attributes': feature.attributes}
+    geometry = feature.get('geometry') or {}
+    vertices = 1
+    for key in ['rings', 'paths']:
+        if key in geometry:
+            vertices = sum(len(part) for part in geometry[key])
+    attributes = feature.get('attributes') or {}
+    attrbytes = sum(len(str(k)) + len(str(v)) + 6 for k, v in attributes.items())
+    return 64 + 40 * vertices + attrbytes, vertices
+
+def addFeaturesToLayer(layer, featlist, workers=1, retries=0, batchConfig=None, operation='adds', ranges=None, onCommit=None):
     '''
-    Function to split featurelist into server processable chunks, calls the upload function, returns a list of upload results.
+    Function to split featurelist into server processable chunks, uploads the chunks simultaneously, returns a list of upload results in the order of the features.
+    The chunk sizes are adapted to the payload size of the features and the response times of the server.
     @param layer: Contains the layer item on the portal, where the new feature data is stored.
-    @param featlist: Contains an existing progressbar object.
-    '''
-    global t_resultlist 
-    global t_list
-    n = 500
-    featlistchunks = list(featlist.features[i:i+n] for i in range(0, len(featlist.features), n))
-    print('Uploading layer '+layer.properties.name+' to Portal . . .')
-    pbar = createpbar(len(featlistchunks))
-    arglist = [(chunk, layer, pbar) for chunk in featlistchunks]
+    @param featlist: Contains the Esri JSON featureset to be uploaded.
+    @param workers: The number of chunks uploaded simultaneously.
+    @param retries: The number of retries of a failed chunk.
+    @param batchConfig: A dictionary with the settings of the adaptive batcher, see AdaptiveBatcher.
+    @param operation: The edit operation, either "adds" or "updates". Updated features contain the object id of the existing feature.
+    @param ranges: Optional list of (start, end) index ranges of the features to be uploaded, defaults to all features.
+    @param onCommit: Optional function called with the index of the first feature and the results of every finished chunk.
+    '''
+    if batchConfig is None:
+        batchConfig = {"initialSize": 500, "minSize": 10, "maxSize": 2000, "maxBytes": 10000000, "maxVertices": 250000, "targetSeconds": 15}
+    features = featlist['features']
+    ranges = [(start, end) for start, end in (ranges if ranges is not None else [(0, len(features))]) if start < end]
+    total = sum(end - start for start, end in ranges)
+    batcher = AdaptiveBatcher(batchConfig)
+    print(('Uploading layer ' if operation == 'adds' else 'Updating features of layer ')+layer.properties.name+' to Portal . . .')
+    pbar = createpbar(max(total, 1))
+    resultchunks = {}
+    inflight = {}
     p=0
-    for chunk in arglist:
-        feataddHelper(chunk)
-        p = updatepbar(p,pbar)
-    resultlist = t_resultlist
-    t_resultlist = []
-    t_list = []
-    return resultlist
+    timeStart = time.time()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while ranges or inflight:
+            # The next chunks are sized when a worker is free, so they profit from the latest response times
+            while ranges and len(inflight) < workers:
+                start, stop = ranges[0]
+                end = batcher.nextChunkEnd(features, start, stop)
+                future = executor.submit(feataddHelper, (features[start:end], layer, retries, batcher, operation))
+                inflight[future] = (start, end)
+                if end < stop:
+                    ranges[0] = (end, stop)
+                else:
+                    ranges.pop(0)
+            done, _ = wait(inflight, return_when=FIRST_COMPLETED)
+            for future in done:
+                chunkstart, chunkend = inflight.pop(future)
+                resultchunks[chunkstart] = future.result()
+                if onCommit is not None:
+                    onCommit(chunkstart, resultchunks[chunkstart])
+                p += chunkend - chunkstart
+                pbar.update(p)
+    pbar.finish()
+    metrics = batcher.metrics()
+    metrics['features'] = total
+    metrics['seconds'] = time.time() - timeStart
+    runMetrics[layer.properties.name if operation == 'adds' else layer.properties.name+' ('+operation+')'] = metrics
+    print('Uploaded '+str(total)+' features in '+str(metrics['chunks'])+' chunks of '+str(metrics['minChunkSize'])+' to '+str(metrics['maxChunkSize'])+' features')
+    return [result for chunkstart in sorted(resultchunks) for result in resultchunks[chunkstart]]
 
 def feataddHelper(args):
     '''
-    Function to upload a chunk of features to the layer.
-    @param args: Two-dimensional list, containing a chunk of features and a reference to the layer in the portal.
+    Function to upload a chunk of features to the layer, returns the list of upload results of the chunk.
+    The chunk is rolled back on failure, so a retry does not duplicate features. A failed chunk is split into halves,
+    which are retried separately, single features are retried after a waiting time. If the retries are exhausted,
+    the features of the chunk are reported as failed, so the results of the already committed halves are kept.
+    @param args: Tuple, containing a chunk of features, a reference to the layer in the portal, the number of retries, the adaptive batcher and optionally the edit operation.
     '''
-    global t_resultlist
     chunk = args[0]
     layer = args[1]
-    t_resultlist+=layer.edit_features(adds = chunk)['addResults']
+    retries = args[2]
+    batcher = args[3]
+    operation = args[4] if len(args) > 4 else 'adds'
+    timeStart = time.time()
+    try:
+        resultlist = layer.edit_features(rollback_on_failure = True, **{operation: chunk})[operation[:-1]+'Results']
+        success = all(elem['success'] for elem in resultlist)
+    except Exception as e:
+        resultlist = [{'success': False, 'error': str(e)} for feat in chunk]
+        success = False
+    batcher.report(len(chunk), time.time() - timeStart, success)
+    if success or retries == 0:
+        return resultlist
+    print('Upload of a chunk to layer '+layer.properties.name+' failed, retrying . . .')
+    if len(chunk) > 1:
+        half = len(chunk) // 2
+        return feataddHelper((chunk[:half], layer, retries - 1, batcher, operation)) + feataddHelper((chunk[half:], layer, retries - 1, batcher, operation))
+    time.sleep(2 ** (3 - min(retries, 3)))
+    return feataddHelper((chunk, layer, retries - 1, batcher, operation))
 
-def updateFieldDefn(ftrs):
+def coerceValue(value, field):
+    '''
+    Function to convert a value to the type of an existing layer field, the field types of a layer are inferred from the values of the first upload.
+    Returns a tuple with the converted value and a flag, which is False if the value had to be shortened or cleared.
+    @param value: The value of an attribute.
+    @param field: The field definition of the layer.
+    '''
+    if value is None:
+        return value, True
+    fieldType = field.get('type')
+    try:
+        if fieldType == 'esriFieldTypeString':
+            value = str(value)
+            length = field.get('length') or len(value)
+            return value[:length], len(value) <= length
+        if fieldType in ['esriFieldTypeSmallInteger', 'esriFieldTypeInteger']:
+            number = int(float(value))
+            limit = 32768 if fieldType == 'esriFieldTypeSmallInteger' else 2147483648
+            if float(value) != number or not -limit <= number < limit:
+                return None, False
+            return number, True
+        if fieldType in ['esriFieldTypeDouble', 'esriFieldTypeSingle']:
+            return float(value), True
+        if fieldType == 'esriFieldTypeDate' and not isinstance(value, str):
+            return value, True
+    except (TypeError, ValueError):
+        return None, False
+    if fieldType == 'esriFieldTypeDate':
+        return None, False
+    return value, True
+
+def printRunSummary():
+    '''
+    Function to print the summary of the uploads of this run, one line with the metrics of the adaptive chunk sizes per layer and operation.
+    '''
+    if not runMetrics:
+        return
+    print('Upload summary:')
+    for name, metrics in sorted(runMetrics.items()):
+        rate = metrics['features'] / metrics['seconds'] if metrics['seconds'] > 0 else 0
+        print('  '+name+': '+str(metrics['features'])+' features in '+str(metrics['chunks'])+' chunks of '+str(metrics['minChunkSize'])+' to '
+              +str(metrics['maxChunkSize'])+' (mean '+str(round(metrics['meanChunkSize'], 1))+') features, about '
+              +str(round(metrics['estimatedBytes'] / 1048576.0, 1))+' MB and '+str(metrics['vertices'])+' vertices, '
+              +str(round(metrics['seconds'], 1))+' s ('+str(round(rate, 1))+' features/s)')
+
+def updateFieldDefn(fields):
     '''
     Function to update field definition for GlobalID and OBJECTID fields, needed for correctly working layers.
-    @param ftrs: The featureset, where the field definition is appended.
+    @param fields: The list of field definitions, where the field definitions are appended.
     '''
     dictFieldGlobalID = {}
     dictFieldGlobalID["alias"] = "GlobalID"
@@ -111,55 +309,8 @@ def updateFieldDefn(ftrs):
     dictFieldOBJECTID["editable"] = False
     dictFieldOBJECTID["domain"] = None
     dictFieldOBJECTID["defaultValue"] = None
-    ftrs.fields.append(dictFieldGlobalID)
-    ftrs.fields.append(dictFieldOBJECTID)
-
-def checkStringInNumericField(ftrs, fld):
-    '''
-    Function to check if a string is inside a numeric field, returns the boolean types True or False.
-    @param ftrs: The featureset containing the field, that should be checked.
-    @param fld: The field to be checked for strings.
-    '''
-    templist = []
-    for val in ftrs.features:
-        cols = val.attributes
-        templist.append(type(cols[fld]))
-    
-    if type('str') in templist:
-        return True
-    else:
-        return False
-
-
-def repairDateFields(fields, ftrs):
-    '''
-    Function to perform inplace repairs for date type related fields.
-    @param fields: The list of fields to be repaired.
-    @param ftrs: The featureset containing the fields to be repaired.
-    '''
-    for fldname in fields:
-        dictField = {}
-        dictField["alias"] = fldname
-        dictField["name"] = dictField["alias"]
-        dictField["type"] = "esriFieldTypeDate"
-        dictField["length"] = 20
-        dictField["sqlType"] = "sqlTypeOther"
-        ftrs.fields[fields[fldname]] = dictField     
-
-def repairBigIntFields(fields, ftrs):
-    '''
-    Function to perform inplace repairs for big integer type related fields.
-    @param fields: The list of fields to be repaired.
-    @param ftrs: The featureset containing the fields to be repaired. 
-    '''
-    for fldname in fields:
-        dictField = {}
-        dictField["alias"] = fldname
-        dictField["name"] = dictField["alias"].replace(":",u"\u005F")
-        dictField["sqlType"] = "sqlTypeBigInt"
-        dictField["type"] = "esriFieldTypeInteger"
-        dictField["length"] = 15
-        ftrs.fields[fields[fldname]] = dictField 
+    fields.append(dictFieldGlobalID)
+    fields.append(dictFieldOBJECTID)
 
 def createLayerDefintion(fieldDef, osmConfig, geometry, idx):
     '''
@@ -221,73 +372,241 @@ def createFeatureServiceLayerCollection(agolConfig, osmConfig):
 
 
 
-def uploadToPortal(agolConfig, osmConfig, osmdata):
+def uploadToPortal(agolConfig, osmConfig, osmdata, syncTime=None, discardJournal=False):
     '''
-    Function to upload osm-data to ArcGIS Online or another Portal.
+    Function to upload osm-data to ArcGIS Online or another Portal, returns the feature layer collection of the new service or None if the upload failed.
+    The prepared layers are written to the upload journal first, so an interrupted upload can be resumed.
     @param agolConfig: Contains user credentials and information on the portal where the data is uploaded
     @param osmConfig: Contains information on the OSM-configuration
-    @param osmdata: Contains the downloaded data from osm as list of SpatialDataFrames
+    @param osmdata: Contains the downloaded data from osm as list of Esri JSON featuresets
+    @param syncTime: The time the OSM data was requested, kept in the journal for the synchronization state.
+    @param discardJournal: Specifies if the journal of an unfinished upload is discarded, otherwise the upload is refused.
     '''
     layerList = []
     featSetList = []
     i=-1
-    for df in osmdata:
+    for featSet in osmdata:
         i+=1
         print("Preparing layer "+str(i+1)+" for upload to Portal")
-        p=0
-        pbar = createpbar(10)
-        p = updatepbar(p, pbar)
-        cols = {k:df.columns.get_loc(k) for k in dict(df.dtypes) if dict(df.dtypes)[k] in ['int64']}
-        dcols = {k:df.columns.get_loc(k) for k in dict(df.dtypes) if dict(df.dtypes)[k] in ['datetime64[ns]']}
-        ftrs = df.to_featureset()
-        cntr=0
-        fielddict={}
-        p = updatepbar(p, pbar)
-        for f in ftrs.fields:
-            if f['name'] != 'timestamp':
-                cntr+=1
-                f['alias'] = f['name']
-                f['name'] = "f_"+str(cntr)
-                fielddict[f['alias']] = f['name']
-                f['length'] = 1000
-                f['sqlType'] = "sqlTypeOther"
-                f['type'] = "esriFieldTypeString" 
-        p = updatepbar(p, pbar)
-        for feat in ftrs.features:
-            for f in fielddict:
-                feat.attributes[fielddict[f]] = feat.attributes.pop(f)
-        p = updatepbar(p, pbar)                
-        for feat in ftrs.features:
-            if ftrs.global_id_field_name in feat.attributes:
-                feat.attributes.pop(ftrs.global_id_field_name)
-            if ftrs.object_id_field_name in feat.attributes:
-                feat.attributes.pop(ftrs.object_id_field_name)
-        p = updatepbar(p, pbar)
-        ftrs.fields = [field for field in ftrs.fields if field['name'] != ftrs.global_id_field_name]
-        p = updatepbar(p, pbar)
-        updateFieldDefn(ftrs)
-        repairBigIntFields(cols, ftrs)
-        p = updatepbar(p, pbar)
-        repairDateFields(dcols, ftrs)
-        fieldlist = list(ftrs.fields)
-        p = updatepbar(p, pbar)
-        layerDef = createLayerDefintion(fieldlist, osmConfig, ftrs.geometry_type, osmConfig['enabledCategories'][i])
-        p = updatepbar(p, pbar)
+        fieldlist = list(featSet['fields'])
+        updateFieldDefn(fieldlist)
+        layerDef = createLayerDefintion(fieldlist, osmConfig, featSet['geometryType'], osmConfig['enabledCategories'][i])
         layerList.append(layerDef)
-        featSetList.append(ftrs)
-        p = updatepbar(p, pbar)
+        featSetList.append(featSet)
+    try:
+        journal = JournalHelper.createJournal(agolConfig['journalDirectory'], layerList, featSetList, syncTime, discardJournal)
+    except FileExistsError as e:
+        print('Upload refused !, Detailed information: '+str(e))
+        return None
+    return publishToPortal(agolConfig, osmConfig, journal)
+
+def resumeUpload(agolConfig, osmConfig):
+    '''
+    Function to continue an interrupted upload from the upload journal, without requesting the OSM data again.
+    Returns a tuple with the feature layer collection of the service or None if the upload failed, and the time the OSM data was requested.
+    @param agolConfig: A dictionary object containing the AGOL configuration defined in the file agolconfig.json.
+    @param osmConfig: A dictionary object containing the OSM configuration defined in the file osmconfig.json.
+    '''
+    journal = JournalHelper.loadJournal(agolConfig['journalDirectory'])
+    if journal is None:
+        print('No interrupted upload found in '+agolConfig['journalDirectory']+'.')
+        return None, None
+    return publishToPortal(agolConfig, osmConfig, journal), journal['syncTime']
+
+def publishToPortal(agolConfig, osmConfig, journal):
+    '''
+    Function to create the feature service of the journal, if it does not exist yet, and to upload the uncommitted features.
+    Returns the feature layer collection of the service or None if the upload failed, the journal is removed after a complete upload.
+    @param agolConfig: A dictionary object containing the AGOL configuration defined in the file agolconfig.json.
+    @param osmConfig: A dictionary object containing the OSM configuration defined in the file osmconfig.json.
+    @param journal: A dictionary with the journal of the upload, see JournalHelper.
+    '''
     try:
         print("Preparing feature service")
         p=0
         pbar = createpbar(4)
         p = updatepbar(p, pbar)
-        ftLC = createFeatureServiceLayerCollection(agolConfig, osmConfig)
+        if journal['itemId'] is None:
+            ftLC = createFeatureServiceLayerCollection(agolConfig, osmConfig)
+            JournalHelper.setJournalService(journal, ftLC.properties.serviceItemId)
+        else:
+            print('Resuming upload to feature service '+journal['itemId'])
+            gis = GIS(agolConfig['portal'], agolConfig['user'], agolConfig['password'])
+            item = gis.content.get(journal['itemId'])
+            if item is None:
+                raise ValueError('Feature service '+journal['itemId']+' of the journal not found')
+            ftLC = fs.FeatureLayerCollection.fromitem(item)
         p = updatepbar(p, pbar)
-        layerDict = {"layers" : layerList}
+        if journal['layerIds'] is None:
+            if journal.get('layersPending') and ftLC.layers:
+                # The layers were added before the interruption, but their ids were not recorded
+                if len(ftLC.layers) != len(journal['layers']):
+                    raise ValueError('Feature service '+journal['itemId']+' has '+str(len(ftLC.layers))+' layers instead of '+str(len(journal['layers'])))
+                print('Taking the layers added to feature service '+journal['itemId']+' before the interruption')
+            else:
+                # The pending add is recorded first, so a resumed upload never adds the layers twice
+                JournalHelper.setJournalLayersPending(journal)
+                layerDict = {"layers" : journal['layers']}
+                ftLC.manager.add_to_definition(layerDict)
+            JournalHelper.setJournalService(journal, journal['itemId'], [layer.properties.id for layer in ftLC.layers])
         p = updatepbar(p, pbar)
-        ftLC.manager.add_to_definition(layerDict)
         p = updatepbar(p, pbar)
-        for i in range(len(ftLC.layers)):
-            prepareLayerUpload(ftLC, featSetList, i)
+        layers = {layer.properties.id: layer for layer in ftLC.layers}
+        for i, layerId in enumerate(journal['layerIds']):
+            prepareLayerUpload(layers[layerId], journal['featureSets'][i], i, agolConfig, journal)
+        JournalHelper.removeJournal(journal)
+        return ftLC
     except Exception as e:
         print('Service creation failed !, Detailed information: '+str(e))
+        print('The upload can be continued by starting MainModule.py with the argument --resume.')
+        return None
+
+def getSyncCategories(osmConfig):
+    '''
+    Function to describe the enabled categories of the OSM configuration, returns a list of [name, geometry type, values] items in the order of the layers.
+    @param osmConfig: A dictionary object containing the OSM configuration defined in the file osmconfig.json.
+    '''
+    return [[elem['categoryName'], elem['geometryType'], elem['categoryValues']] for elem in osmConfig['categories'] if elem['isEnabled'] == 'yes']
+
+def loadSyncState(agolConfig, osmConfig):
+    '''
+    Function to read the state of the last synchronization from the state file, returns the state or None if a new service has to be published.
+    A new service is published, if the state file is missing or the bounding box or the categories changed since the last synchronization.
+    @param agolConfig: A dictionary object containing the AGOL configuration defined in the file agolconfig.json.
+    @param osmConfig: A dictionary object containing the OSM configuration defined in the file osmconfig.json.
+    '''
+    stateFile = agolConfig['deltaSync']['stateFile']
+    try:
+        with open(stateFile) as f:
+            state = json.load(f)
+    except (IOError, ValueError):
+        print('No valid synchronization state found in '+stateFile+', a new service is published.')
+        return None
+    if state.get('boundingBox') != osmConfig['boundingBox'] or state.get('categories') != getSyncCategories(osmConfig):
+        print('The bounding box or the categories changed since the last synchronization, a new service is published.')
+        return None
+    return state
+
+def saveSyncState(agolConfig, osmConfig, itemId, layerIds, syncTime):
+    '''
+    Function to write the state of a successful synchronization to the state file.
+    @param agolConfig: A dictionary object containing the AGOL configuration defined in the file agolconfig.json.
+    @param osmConfig: A dictionary object containing the OSM configuration defined in the file osmconfig.json.
+    @param itemId: The item id of the feature service.
+    @param layerIds: The ids of the layers of the feature service in the order of the enabled categories.
+    @param syncTime: The time the OSM data was requested, e.g. "2018-06-01T00:00:00Z".
+    '''
+    stateFile = agolConfig['deltaSync']['stateFile']
+    state = {"itemId": itemId,
+             "layerIds": layerIds,
+             "lastSync": syncTime,
+             "boundingBox": osmConfig['boundingBox'],
+             "categories": getSyncCategories(osmConfig)}
+    with open(stateFile+'.tmp', 'w') as f:
+        json.dump(state, f, indent=4)
+    os.replace(stateFile+'.tmp', stateFile)
+
+def syncToPortal(agolConfig, osmConfig, deltaList, state):
+    '''
+    Function to apply the changes of the OSM data since the last synchronization to the layers of the existing feature service.
+    Returns True if all layers were synchronized, otherwise False.
+    @param agolConfig: A dictionary object containing the AGOL configuration defined in the file agolconfig.json.
+    @param osmConfig: A dictionary object containing the OSM configuration defined in the file osmconfig.json.
+    @param deltaList: A list of tuples (layer, changed_ids, current_ids) in the order of the enabled categories.
+    @param state: The state of the last synchronization as returned by loadSyncState.
+    '''
+    try:
+        gis = GIS(agolConfig['portal'], agolConfig['user'], agolConfig['password'])
+        item = gis.content.get(state['itemId'])
+        if item is None:
+            raise ValueError('Feature service '+state['itemId']+' of the last synchronization not found, delete '+agolConfig['deltaSync']['stateFile']+' to publish a new service.')
+        ftLC = fs.FeatureLayerCollection.fromitem(item)
+        layers = {layer.properties.id: layer for layer in ftLC.layers}
+        for layerId, delta in zip(state['layerIds'], deltaList):
+            syncLayer(layers[layerId], delta, agolConfig)
+        return True
+    except Exception as e:
+        print('Synchronization failed !, Detailed information: '+str(e))
+        return False
+
+def syncLayer(layer, delta, agolConfig):
+    '''
+    Function to translate the changes of a category into adds, updates and deletes of the features of a layer, keyed by the osm_type and osm_id fields,
+    because a way and a relation of a polygon layer can have the same id.
+    Tags, which are new to the layer, are added as fields to the layer definition.
+    @param layer: The layer of the category in the portal.
+    @param delta: A tuple (layer, changed_ids, current_ids) of the category, layer is an Esri JSON featureset or None if no element changed,
+                  the ids are tuples (osm_type, osm_id), current_ids is None if the current elements are unknown.
+    @param agolConfig: A dictionary object containing the AGOL configuration defined in the file agolconfig.json.
+    '''
+    featSet, changedIds, currentIds = delta
+    print('Synchronizing layer '+layer.properties.name+' . . .')
+    layerFields = {f['alias']: f['name'] for f in layer.properties.fields}
+    fieldDefs = {f['name']: dict(f) for f in layer.properties.fields}
+    if 'osm_type' not in layerFields:
+        raise ValueError('Layer '+layer.properties.name+' has no osm_type field, publish a new service to synchronize it.')
+    idField = layerFields['osm_id']
+    typeField = layerFields['osm_type']
+    objectIdField = layer.properties.objectIdField
+    objectIds = {}
+    for feat in layer.query(where='1=1', out_fields=idField+','+typeField, return_geometry=False).features:
+        objectIds.setdefault((feat.attributes[typeField], str(feat.attributes[idField])), []).append(feat.attributes[objectIdField])
+
+    adds = []
+    updates = []
+    builtIds = set()
+    if featSet is not None:
+        # The fields of the featureset are numbered by the emitter, they are mapped to the layer fields by their aliases
+        newFields = []
+        fieldNumber = max([int(name[2:]) for name in layerFields.values() if name.startswith('f_') and name[2:].isdigit()] + [0])
+        fieldNames = {}
+        for f in featSet['fields']:
+            alias = f.get('alias') or f['name']
+            if alias not in layerFields:
+                fieldNumber += 1
+                newFields.append(dict(f, name='f_'+str(fieldNumber)))
+                layerFields[alias] = 'f_'+str(fieldNumber)
+                fieldDefs['f_'+str(fieldNumber)] = newFields[-1]
+            fieldNames[f['name']] = layerFields[alias]
+        if newFields:
+            print('Adding '+str(len(newFields))+' new fields to layer '+layer.properties.name)
+            layer.manager.add_to_definition({"fields": newFields})
+
+        invalid = 0
+        for feat in featSet['features']:
+            attributes = {}
+            for name, value in feat['attributes'].items():
+                if name in fieldNames:
+                    attributes[fieldNames[name]], valid = coerceValue(value, fieldDefs[fieldNames[name]])
+                    invalid += not valid
+            osmId = (attributes[typeField], str(attributes[idField]))
+            builtIds.add(osmId)
+            if osmId in objectIds:
+                # Tags removed from the element are cleared, fields missing in the attributes would keep their old values
+                cleared = dict.fromkeys(name for name in layerFields.values() if name.startswith('f_') or name == 'timestamp')
+                cleared.update(attributes)
+                cleared[objectIdField] = objectIds[osmId][0]
+                updates.append({'geometry': feat['geometry'], 'attributes': cleared})
+            else:
+                adds.append({'geometry': feat['geometry'], 'attributes': attributes})
+
+        if invalid:
+            print(str(invalid)+' values do not fit the field types of layer '+layer.properties.name+' and were shortened or cleared, publish a new service to infer the field types again.')
+
+    # Deleted features are no longer returned by OSM, changed elements without a valid geometry are deleted as well.
+    # Without the current elements, e.g. after an empty response, only the changed elements are deleted.
+    deletedIds = changedIds - builtIds
+    if currentIds is not None:
+        deletedIds |= set(objectIds) - currentIds
+    deletes = [objectId for osmId in deletedIds if osmId in objectIds for objectId in objectIds[osmId]]
+
+    results = []
+    if adds:
+        results += addFeaturesToLayer(layer, {'features': adds}, agolConfig['uploadWorkers'], agolConfig['uploadRetries'], agolConfig['uploadBatch'], 'adds')
+    if updates:
+        results += addFeaturesToLayer(layer, {'features': updates}, agolConfig['uploadWorkers'], agolConfig['uploadRetries'], agolConfig['uploadBatch'], 'updates')
+    for i in range(0, len(deletes), 1000):
+        results += layer.edit_features(deletes=','.join(str(objectId) for objectId in deletes[i:i+1000]), rollback_on_failure=True)['deleteResults']
+    if not all(elem['success'] for elem in results):
+        raise ValueError('Synchronization error of layer '+layer.properties.name)
+    print('Layer '+layer.properties.name+' synchronized: '+str(len(adds))+' added, '+str(len(updates))+' updated, '+str(len(deletes))+' deleted')
@@ -0,0 +1,217 @@
+__version__ = "1.4"
+'''
+__author__ = "Simon Geigenberger, Lukas Bug"
+__copyright__ = "Copyright 2018, Esri Deutschland GmbH"
+__license__ = "Apache-2.0"
+__version__ = "1.4"
+__email__ = "simon@geigenberger.info, lukas.bug@aol.de"
+
+This python module is used to keep a checkpoint journal of an upload to ArcGIS Online or Portal on local disk. The journal contains the prepared layer definitions
+and featuresets, the item id and the layer ids of the feature service and the committed chunks of every layer with their object ids. An interrupted upload
+can be continued from the first uncommitted chunk without requesting the OSM data again or creating another feature service.
+'''
+
+import glob
+import gzip
+import json
+import os
+
+def getJournalPath(journal, name):
+    '''
+    Function to get the path of a file of the journal, returns the path.
+    @param journal: A dictionary with the journal as returned by createJournal or loadJournal.
+    @param name: The file name.
+    '''
+    return os.path.join(journal['directory'], name)
+
+def writeJournalHeader(journal):
+    '''
+    Function to write the service information of the journal, the file is replaced atomically.
+    @param journal: A dictionary with the journal as returned by createJournal or loadJournal.
+    '''
+    header = {"itemId": journal['itemId'],
+              "layerIds": journal['layerIds'],
+              "syncTime": journal['syncTime'],
+              "layersPending": journal.get('layersPending', False),
+              "layers": journal['layers']}
+    path = getJournalPath(journal, 'journal.json')
+    with open(path+'.tmp', 'w') as f:
+        json.dump(header, f)
+    os.replace(path+'.tmp', path)
+
+def getJournalFiles(directory):
+    '''
+    Function to list the files of the journal in its folder, other files of the folder are never touched. Returns a list of file paths.
+    @param directory: The folder of the journal.
+    '''
+    names = ['journal.json', 'journal.json.tmp', 'commits.jsonl']
+    files = [os.path.join(directory, name) for name in names if os.path.isfile(os.path.join(directory, name))]
+    return files + sorted(glob.glob(os.path.join(glob.escape(directory), 'featureset_*.json.gz')))
+
+def removeJournalFiles(directory):
+    '''
+    Function to remove the files of the journal, the folder is removed as well if it is empty afterwards.
+    @param directory: The folder of the journal.
+    '''
+    for path in getJournalFiles(directory):
+        os.remove(path)
+    try:
+        os.rmdir(directory)
+    except OSError:
+        pass
+
+def hasJournal(directory):
+    '''
+    Function to check if the folder contains the journal of an unfinished upload, returns the boolean values True or False.
+    @param directory: The folder of the journal.
+    '''
+    return os.path.isfile(os.path.join(directory, 'journal.json'))
+
+def getJournalConflict(directory, discard=False):
+    '''
+    Function to check if a new journal can be started in the folder. The journal of an unfinished upload is only discarded on request
+    and a non-empty folder without a journal is refused, because it is not owned by the journal.
+    Returns the reason, why no journal can be started, or None.
+    @param directory: The folder of the journal.
+    @param discard: Specifies if the journal of an unfinished upload is discarded.
+    '''
+    if hasJournal(directory):
+        if not discard:
+            return 'The journal of an unfinished upload exists in '+directory+', continue it with the argument --resume or discard it with the argument --discard-journal.'
+    elif os.path.isdir(directory) and os.listdir(directory):
+        return 'The journal folder '+directory+' is not empty and contains no journal, choose an empty or a new folder for "journalDirectory".'
+    return None
+
+def createJournal(directory, layerList, featSetList, syncTime=None, discard=False):
+    '''
+    Function to start a new journal, the prepared layer definitions and featuresets are written to disk.
+    The journal of an unfinished upload is only discarded, if this is requested explicitly, because resuming the upload depends on it.
+    Returns a dictionary with the journal.
+    @param directory: The folder of the journal.
+    @param layerList: The list of layer definitions of the feature service.
+    @param featSetList: The list of Esri JSON featuresets in the order of the layers.
+    @param syncTime: The time the OSM data was requested, e.g. "2018-06-01T00:00:00Z".
+    @param discard: Specifies if the journal of an unfinished upload is discarded.
+    '''
+    conflict = getJournalConflict(directory, discard)
+    if conflict is not None:
+        raise FileExistsError(conflict)
+    if hasJournal(directory):
+        print('Discarding the journal of an interrupted upload in '+directory)
+    removeJournalFiles(directory)
+    os.makedirs(directory, exist_ok=True)
+    journal = {"directory": directory,
+               "itemId": None,
+               "layerIds": None,
+               "syncTime": syncTime,
+               "layersPending": False,
+               "layers": layerList,
+               "featureSets": featSetList,
+               "committed": {i: [] for i in range(len(layerList))}}
+    for i, ftrs in enumerate(featSetList):
+        with gzip.open(getJournalPath(journal, 'featureset_'+str(i)+'.json.gz'), 'wt') as f:
+            json.dump(ftrs, f)
+    writeJournalHeader(journal)
+    return journal
+
+def loadJournal(directory):
+    '''
+    Function to read the journal of an interrupted upload, returns a dictionary with the journal or None if no journal exists.
+    @param directory: The folder of the journal.
+    '''
+    journal = {"directory": directory}
+    try:
+        with open(getJournalPath(journal, 'journal.json')) as f:
+            journal.update(json.load(f))
+    except (IOError, ValueError):
+        return None
+    journal['featureSets'] = []
+    for i in range(len(journal['layers'])):
+        with gzip.open(getJournalPath(journal, 'featureset_'+str(i)+'.json.gz'), 'rt') as f:
+            journal['featureSets'].append(json.load(f))
+    journal['committed'] = {i: [] for i in range(len(journal['layers']))}
+    try:
+        with open(getJournalPath(journal, 'commits.jsonl')) as f:
+            for line in f:
+                try:
+                    commit = json.loads(line)
+                except ValueError:
+                    # The last line is incomplete, if the upload was interrupted while writing it
+                    continue
+                journal['committed'][commit['layer']].append([commit['start'], commit['end'], commit['objectIds']])
+    except IOError:
+        pass
+    return journal
+
+def setJournalService(journal, itemId, layerIds=None):
+    '''
+    Function to record the feature service of the upload in the journal.
+    @param journal: A dictionary with the journal as returned by createJournal or loadJournal.
+    @param itemId: The item id of the feature service.
+    @param layerIds: The ids of the layers of the feature service in the order of the layer definitions.
+    '''
+    journal['itemId'] = itemId
+    journal['layerIds'] = layerIds
+    if layerIds is not None:
+        journal['layersPending'] = False
+    writeJournalHeader(journal)
+
+def setJournalLayersPending(journal):
+    '''
+    Function to record in the journal, that the layers are about to be added to the feature service. If the upload is interrupted
+    before their ids are recorded, a resumed upload takes the layers of the service instead of adding them again.
+    @param journal: A dictionary with the journal as returned by createJournal or loadJournal.
+    '''
+    journal['layersPending'] = True
+    writeJournalHeader(journal)
+
+def appendJournalCommit(journal, layerIdx, start, results):
+    '''
+    Function to record the committed features of an uploaded chunk. Every run of successfully added features is appended
+    as a separate commit, because failed parts of a chunk were rolled back by the server.
+    @param journal: A dictionary with the journal as returned by createJournal or loadJournal.
+    @param layerIdx: The index of the layer.
+    @param start: The index of the first feature of the chunk.
+    @param results: The list of add results of the chunk.
+    '''
+    commits = []
+    runStart = None
+    for k, result in enumerate(list(results) + [None]):
+        success = result is not None and result['success'] in [True, 'True', 'true']
+        if success and runStart is None:
+            runStart = k
+        elif not success and runStart is not None:
+            commits.append([start + runStart, start + k, [elem['objectId'] for elem in results[runStart:k]]])
+            runStart = None
+    if not commits:
+        return
+    with open(getJournalPath(journal, 'commits.jsonl'), 'a') as f:
+        for commit in commits:
+            f.write(json.dumps({"layer": layerIdx, "start": commit[0], "end": commit[1], "objectIds": commit[2]})+'\n')
+        f.flush()
+        os.fsync(f.fileno())
+    journal['committed'][layerIdx] += commits
+
+def getUncommittedRanges(journal, layerIdx, total):
+    '''
+    Function to determine the features of a layer, which are not yet committed, returns a list of (start, end) index ranges.
+    @param journal: A dictionary with the journal as returned by createJournal or loadJournal.
+    @param layerIdx: The index of the layer.
+    @param total: The number of features of the layer.
+    '''
+    ranges = []
+    position = 0
+    for start, end, objectIds in sorted(journal['committed'][layerIdx]):
+        if start > position:
+            ranges.append((position, start))
+        position = max(position, end)
+    if position < total:
+        ranges.append((position, total))
+    return ranges
+
+def removeJournal(journal):
+    '''
+    Function to remove the journal after a completed upload.
+    @param journal: A dictionary with the journal as returned by createJournal or loadJournal.
+    '''
+    removeJournalFiles(journal['directory'])
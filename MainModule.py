@@ -13,23 +13,81 @@ import OSMConfigHelper
 import AGOLConfigHelper
 import OSMHelper
 import AGOLHelper
+import JournalHelper
+import argparse
 import datetime
-print(datetime.datetime.now())
 
-# The AGOL configuration is read in and validated.
-agolConfig = AGOLConfigHelper.readConfig()
-print('ArcGIS Online / Portal configuration read in.')
+def main():
+    '''
+    Function to read the configurations, load the OSM data and upload it to ArcGIS Online or Portal.
+    '''
+    # The command line arguments are read in.
+    parser = argparse.ArgumentParser(description='Loads OpenStreetMap data and publishes it to ArcGIS Online or Portal.')
+    parser.add_argument('--no-cache', action='store_true', help='Bypass the local cache of OpenStreetMap responses.')
+    parser.add_argument('--resume', action='store_true', help='Continue an interrupted upload from the upload journal without requesting the OpenStreetMap data again.')
+    parser.add_argument('--discard-journal', action='store_true', help='Discard the journal of an unfinished upload and publish a new service.')
+    parser.add_argument('--offline', action='store_true', help='Validate the OpenStreetMap configuration against the last snapshot of the taginfo key and tag list.')
+    args = parser.parse_args()
+    print(datetime.datetime.now())
 
-# The OSM configuration is read in and validated.
-osmConfig = OSMConfigHelper.readConfig(agolConfig)
-print('OpenStreetMap configuration read in.')
+    # The AGOL configuration is read in and validated.
+    agolConfig = AGOLConfigHelper.readConfig()
+    print('ArcGIS Online / Portal configuration read in.')
 
-# The OSM data of the requested categories and geometries is loaded as point data with the requested attributes if available. The data is returned as a data frame.
-OSMDataFrameList = OSMHelper.getDataFrameList(osmConfig)
-print('OpenStreetMap data loaded.')
+    # The OSM configuration is read in and validated.
+    osmConfig = OSMConfigHelper.readConfig(agolConfig, args.offline)
+    if args.no_cache:
+        osmConfig['cache']['isEnabled'] = 'no'
+    print('OpenStreetMap configuration read in.')
 
-# The data of the data frame with the OSM data is uploaded as a Feature Collection to the ArcGIS Online or Portal account.
-AGOLHelper.uploadToPortal(agolConfig, osmConfig, OSMDataFrameList)
-print('Upload to ArcGIS Online / Portal finished.')
+    # An interrupted upload is continued from the upload journal.
+    if args.resume:
+        ftLC, syncTime = AGOLHelper.resumeUpload(agolConfig, osmConfig)
+        print('Upload to ArcGIS Online / Portal finished.')
+        if ftLC is not None and agolConfig['deltaSync']['isEnabled'] == 'yes':
+            AGOLHelper.saveSyncState(agolConfig, osmConfig, ftLC.properties.serviceItemId, [layer.properties.id for layer in ftLC.layers], syncTime)
+        AGOLHelper.printRunSummary()
+        print(datetime.datetime.now())
+        return
 
-print(datetime.datetime.now())
+    # The state of the last synchronization is read in, if the incremental synchronization is enabled.
+    syncState = None
+    if agolConfig['deltaSync']['isEnabled'] == 'yes':
+        syncState = AGOLHelper.loadSyncState(agolConfig, osmConfig)
+    syncTime = datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
+
+    if syncState is not None:
+        # Only the changes since the last synchronization are loaded, the overlap covers the replication delay of the Overpass API.
+        since = datetime.datetime.strptime(syncState['lastSync'], '%Y-%m-%dT%H:%M:%SZ') - datetime.timedelta(minutes=agolConfig['deltaSync']['overlapMinutes'])
+        OSMDeltaList = OSMHelper.getDeltaList(osmConfig, since.strftime('%Y-%m-%dT%H:%M:%SZ'))
+        print('OpenStreetMap changes loaded.')
+
+        # The changes are applied to the layers of the existing feature service.
+        if AGOLHelper.syncToPortal(agolConfig, osmConfig, OSMDeltaList, syncState):
+            AGOLHelper.saveSyncState(agolConfig, osmConfig, syncState['itemId'], syncState['layerIds'], syncTime)
+            print('Synchronization with ArcGIS Online / Portal finished.')
+    else:
+        # The journal of an unfinished upload is kept for --resume, unless it is discarded explicitly, and foreign folders are never used.
+        conflict = JournalHelper.getJournalConflict(agolConfig['journalDirectory'], args.discard_journal)
+        if conflict is not None:
+            print(conflict)
+            print(datetime.datetime.now())
+            return
+
+        # The OSM data of the requested categories and geometries is loaded with the requested attributes if available. The data is returned as Esri JSON features.
+        OSMLayerList = OSMHelper.getLayerList(osmConfig)
+        print('OpenStreetMap data loaded.')
+
+        # The features with the OSM data are uploaded as a Feature Collection to the ArcGIS Online or Portal account.
+        ftLC = AGOLHelper.uploadToPortal(agolConfig, osmConfig, OSMLayerList, syncTime, args.discard_journal)
+        print('Upload to ArcGIS Online / Portal finished.')
+        if ftLC is not None and agolConfig['deltaSync']['isEnabled'] == 'yes':
+            AGOLHelper.saveSyncState(agolConfig, osmConfig, ftLC.properties.serviceItemId, [layer.properties.id for layer in ftLC.layers], syncTime)
+
+    AGOLHelper.printRunSummary()
+    print(datetime.datetime.now())
+
+
+# The guard is required by the worker processes of the geometry construction, which import this module on Windows.
+if __name__ == '__main__':
+    main()
@@ -9,6 +9,8 @@ __email__ = "simon@geigenberger.info, lukas.bug@aol.de"
 
 import json
 import sys
+import os
+import time
 import requests
 from arcgis.geometry import Polygon
 import arcgis.geometry
@@ -23,33 +25,64 @@ def getbBoxArea(bBox):
     return abs(geom.area)
 
 
-def readConfig(agolConfig):
-    dictOSMConfig = {}
-        
-    # Try to load the OSM keys
-    try:
-        keys = requests.get("https://taginfo.openstreetmap.org/api/4/projects/keys")
-        keys = json.loads(keys.text)
-        data = keys["data"]
-        keyList = []
-        for element in data:
-            keyList.append(element["key"])
-    except:
-        print("Cannot load OSM key list.")
-        sys.exit()
-        
-    # Try to load the OSM tags        
+def downloadTagCatalogue():
+    '''
+    Function to download the OSM keys and tags from taginfo.
+    Returns a dictionary with the download time and the sorted lists of keys and tags ("key:value").
+    '''
+    keys = requests.get("https://taginfo.openstreetmap.org/api/4/projects/keys", timeout=60)
+    keys = json.loads(keys.text)
+    tags = requests.get("https://taginfo.openstreetmap.org/api/4/projects/tags", timeout=60)
+    tags = json.loads(tags.text)
+    catalogue = {}
+    catalogue["timestamp"] = time.time()
+    catalogue["keys"] = sorted(set(element["key"] for element in keys["data"]))
+    catalogue["tags"] = sorted(set(element["key"] + ":" + element["value"] for element in tags["data"]))
+    return catalogue
+
+
+def loadTagCatalogue(catalogueConfig, offline):
+    '''
+    Function to load the OSM keys and tags from the local catalogue file. The catalogue is downloaded from taginfo,
+    if the file does not exist or is older than the refresh interval. In offline mode the last snapshot is used.
+    Returns a set of keys and a set of tags ("key:value") for validation.
+    @param catalogueConfig: A dictionary with the items "file", "refreshHours" and "offline" of the OSM configuration.
+    @param offline: Specifies if the catalogue must not be downloaded.
+    '''
+    path = catalogueConfig["file"]
+    catalogue = None
     try:
-        tags = requests.get("https://taginfo.openstreetmap.org/api/4/projects/tags")
-        tags = json.loads(tags.text)
-        data = tags["data"]
-        tagList = []
-        for element in data:
-            tagString = element["key"] + ":" + element["value"]
-            tagList.append(tagString)
+        with open(path) as f:
+            catalogue = json.load(f)
+        if not {"timestamp", "keys", "tags"} <= set(catalogue):
+            raise ValueError
     except:
-        print("Cannot load OSM tag list.")
+        catalogue = None
+
+    offline = offline or catalogueConfig["offline"] == "yes"
+    expired = catalogue is None or time.time() - catalogue["timestamp"] > float(catalogueConfig["refreshHours"]) * 3600
+    if expired and not offline:
+        try:
+            catalogue = downloadTagCatalogue()
+            tmppath = path + ".tmp"
+            with open(tmppath, "w") as f:
+                json.dump(catalogue, f)
+            os.replace(tmppath, path)
+        except:
+            if catalogue is None:
+                print("Cannot load OSM key and tag list.")
+                sys.exit()
+            print("Cannot refresh OSM key and tag list, the snapshot of " + time.ctime(catalogue["timestamp"]) + " is used.")
+
+    if catalogue is None:
+        print("No snapshot of the OSM key and tag list available in offline mode.")
         sys.exit()
+
+    return set(catalogue["keys"]), set(catalogue["tags"])
+
+
+def readConfig(agolConfig, offline=False):
+    dictOSMConfig = {}
     
     # Try to open the config file
     try:
@@ -64,6 +97,20 @@ def readConfig(agolConfig):
     except:
         print("JSON file cannot be read.")
         sys.exit()
+
+    # Validates the optional configuration of the local OSM key and tag catalogue
+    try:
+        catalogueConfig = {"file": "taginfo_catalogue.json", "refreshHours": 168, "offline": "no"}
+        catalogueConfig.update(data.get("tagCatalogue", {}))
+        catalogueConfig["refreshHours"] = float(catalogueConfig["refreshHours"])
+        if catalogueConfig["offline"] not in ["yes", "no"] or catalogueConfig["refreshHours"] < 0:
+            raise ValueError
+    except:
+        print("Tag catalogue configuration is invalid, offline must be \"yes\" or \"no\" and refreshHours >= 0.")
+        sys.exit()
+
+    # Load the OSM keys and tags from the local catalogue, which is refreshed from taginfo if required
+    keySet, tagSet = loadTagCatalogue(catalogueConfig, offline)
         
     # Validates if categories are selected and all selected categories exist as tags.
     try:
@@ -76,7 +123,7 @@ def readConfig(agolConfig):
             for val in cat["categoryValues"]:
                 categorieExists = False
                 categorieStr = cat["categoryName"] + ":" + val
-                if categorieStr in tagList:
+                if categorieStr in tagSet:
                     categorieExists = True
                     break
                 if not categorieExists:
@@ -95,7 +142,7 @@ def readConfig(agolConfig):
             attributes = cat["attributeFieldsToExclude"]
             for key in attributes:
                 attributeExists = False
-                if key in keyList:
+                if key in keySet:
                     attributeExists = True
                     break
                 if not attributeExists:
@@ -105,6 +152,37 @@ def readConfig(agolConfig):
         print(e)
         print("No attributes chosen.")    
         sys.exit()
+
+    # Validates the optional layout of the tag fields, the global layout is overwritten by the layout of a category.
+    try:
+        defaultLayout = {"maxFields": 0, "allowList": [], "overflowField": "other_tags", "overflowFormat": "json"}
+        defaultLayout.update(data.get("tagLayout", {}))
+        for cat in data["categories"]:
+            tagLayout = dict(defaultLayout)
+            tagLayout.update(cat.get("tagLayout", {}))
+            tagLayout["maxFields"] = int(tagLayout["maxFields"])
+            if tagLayout["maxFields"] < 0 or not isinstance(tagLayout["allowList"], list) or len(tagLayout["overflowField"]) == 0 \
+                or tagLayout["overflowFormat"] not in ["json", "hstore"]:
+                raise ValueError
+            cat["tagLayout"] = tagLayout
+    except:
+        print("Tag layout configuration is invalid, maxFields must be >= 0, allowList a list, overflowField not empty and overflowFormat \"json\" or \"hstore\".")
+        sys.exit()
+
+    # Validates the optional pruning of sparse tag fields, the global setting is overwritten by the setting of a category.
+    try:
+        defaultPruning = {"isEnabled": "no", "minDensity": 0.01}
+        defaultPruning.update(data.get("fieldPruning", {}))
+        for cat in data["categories"]:
+            fieldPruning = dict(defaultPruning)
+            fieldPruning.update(cat.get("fieldPruning", {}))
+            fieldPruning["minDensity"] = float(fieldPruning["minDensity"])
+            if fieldPruning["isEnabled"] not in ["yes", "no"] or not 0 <= fieldPruning["minDensity"] <= 1:
+                raise ValueError
+            cat["fieldPruning"] = fieldPruning
+    except:
+        print("Field pruning configuration is invalid, isEnabled must be \"yes\" or \"no\" and minDensity between 0 and 1.")
+        sys.exit()
     
     # Validates if a bounding box and all required coordinates are selected
     try:
@@ -164,12 +242,123 @@ def readConfig(agolConfig):
         print("Maximum latitude is not greater than minimum latitude.")    
 
 
-    # Validates if the bounding box extent is not to large for OSM server
+    # Validates the optional tiling configuration, tiled requests are not limited by the bounding box area.
+    try:
+        tiling = {"isEnabled": "no", "maxTileArea": 1.7, "maxDepth": 4, "maxWorkers": 4}
+        tiling.update(data.get("tiling", {}))
+        tiling["maxTileArea"] = float(tiling["maxTileArea"])
+        tiling["maxDepth"] = int(tiling["maxDepth"])
+        tiling["maxWorkers"] = int(tiling["maxWorkers"])
+        if tiling["maxTileArea"] <= 0 or tiling["maxTileArea"] > 1.7 or tiling["maxDepth"] < 0 or tiling["maxWorkers"] < 1:
+            raise ValueError
+        dictOSMConfig["tiling"] = tiling
+    except:
+        print("Tiling configuration is invalid, maxTileArea must be in range (0, 1.7], maxDepth >= 0 and maxWorkers >= 1.")
+        sys.exit()
+
+    # Validates if the categories are requested with a single union query or with one query per category.
+    coalesceQueries = data.get("coalesceQueries", "no")
+    if coalesceQueries not in ["yes", "no"]:
+        print("coalesceQueries must be either \"yes\" or \"no\".")
+        sys.exit()
+    dictOSMConfig["coalesceQueries"] = coalesceQueries
+
+    # Validates the optional cache configuration for responses of the OSM server.
+    try:
+        cache = {"isEnabled": "no", "directory": "osm_cache", "ttlMinutes": 60, "maxSizeMB": 512}
+        cache.update(data.get("cache", {}))
+        cache["ttlMinutes"] = float(cache["ttlMinutes"])
+        cache["maxSizeMB"] = float(cache["maxSizeMB"])
+        if cache["isEnabled"] not in ["yes", "no"] or cache["ttlMinutes"] < 0 or cache["maxSizeMB"] <= 0:
+            raise ValueError
+        dictOSMConfig["cache"] = cache
+    except:
+        print("Cache configuration is invalid, isEnabled must be \"yes\" or \"no\", ttlMinutes >= 0 and maxSizeMB > 0.")
+        sys.exit()
+
+    # Validates the optional streaming configuration, streamed responses are decoded element by element.
+    try:
+        streaming = {"isEnabled": "no", "chunkSize": 65536, "spoolDirectory": "", "keepSpool": "no"}
+        streaming.update(data.get("streaming", {}))
+        streaming["chunkSize"] = int(streaming["chunkSize"])
+        if streaming["isEnabled"] not in ["yes", "no"] or streaming["keepSpool"] not in ["yes", "no"] or streaming["chunkSize"] < 1 \
+                or (streaming["spoolDirectory"] and streaming["keepSpool"] == "no" and not os.path.isdir(streaming["spoolDirectory"])):
+            raise ValueError
+        dictOSMConfig["streaming"] = streaming
+    except:
+        print("Streaming configuration is invalid, isEnabled and keepSpool must be \"yes\" or \"no\", chunkSize > 0 and spoolDirectory an existing folder.")
+        sys.exit()
+
+    # Validates the optional output configuration, the metadata of the elements is only requested if "meta" is "yes".
+    try:
+        output = {"meta": "no"}
+        output.update(data.get("output", {}))
+        if output["meta"] not in ["yes", "no"]:
+            raise ValueError
+        dictOSMConfig["output"] = output
+    except:
+        print("Output configuration is invalid, meta must be \"yes\" or \"no\".")
+        sys.exit()
+
+    # Validates the optional local extract, which replaces the requests to the Overpass API.
+    try:
+        extract = {"isEnabled": "no", "file": "", "nodeStore": "sparse", "nodeStoreDirectory": ""}
+        extract.update(data.get("extract", {}))
+        if extract["isEnabled"] not in ["yes", "no"] or (extract["isEnabled"] == "yes" and not os.path.isfile(extract["file"])) \
+            or extract["nodeStore"] not in ["dense", "sparse"] or (extract["nodeStoreDirectory"] and not os.path.isdir(extract["nodeStoreDirectory"])):
+            raise ValueError
+        dictOSMConfig["extract"] = extract
+    except:
+        print("Extract configuration is invalid, isEnabled must be \"yes\" or \"no\", file an existing .osm.pbf file, nodeStore \"dense\" or \"sparse\" and nodeStoreDirectory empty or an existing folder.")
+        sys.exit()
+
+    # Validates the optional configuration of the Overpass endpoints and the request scheduling.
+    try:
+        overpass = {"endpoints": ["https://lz4.overpass-api.de/api/interpreter", "https://z.overpass-api.de/api/interpreter"],
+                    "requestsPerMinute": 20, "maxRetries": 5, "backoffSeconds": 5, "maxBackoffSeconds": 300, "timeout": 900, "poolSize": 8}
+        overpass.update(data.get("overpass", {}))
+        for key in ["requestsPerMinute", "backoffSeconds", "maxBackoffSeconds", "timeout"]:
+            overpass[key] = float(overpass[key])
+        overpass["maxRetries"] = int(overpass["maxRetries"])
+        overpass["poolSize"] = int(overpass["poolSize"])
+        if not overpass["endpoints"] or overpass["requestsPerMinute"] <= 0 or overpass["maxRetries"] < 0 or overpass["poolSize"] < 1:
+            raise ValueError
+        dictOSMConfig["overpass"] = overpass
+    except:
+        print("Overpass configuration is invalid, at least one endpoint is required, requestsPerMinute > 0, maxRetries >= 0 and poolSize >= 1.")
+        sys.exit()
+
+    # Validates the optional configuration of the worker processes for the geometry construction.
+    try:
+        processPool = {"isEnabled": "no", "maxWorkers": 4, "batchSize": 500}
+        processPool.update(data.get("processPool", {}))
+        processPool["maxWorkers"] = int(processPool["maxWorkers"])
+        processPool["batchSize"] = int(processPool["batchSize"])
+        if processPool["isEnabled"] not in ["yes", "no"] or processPool["maxWorkers"] < 1 or processPool["batchSize"] < 1:
+            raise ValueError
+        dictOSMConfig["processPool"] = processPool
+    except:
+        print("Process pool configuration is invalid, isEnabled must be \"yes\" or \"no\", maxWorkers >= 1 and batchSize >= 1.")
+        sys.exit()
+
+    # Validates the optional configuration of the field type inference.
+    try:
+        schemaInference = {"isEnabled": "yes", "minStringLength": 1}
+        schemaInference.update(data.get("schemaInference", {}))
+        schemaInference["minStringLength"] = int(schemaInference["minStringLength"])
+        if schemaInference["isEnabled"] not in ["yes", "no"] or not 1 <= schemaInference["minStringLength"] <= 1000:
+            raise ValueError
+        dictOSMConfig["schemaInference"] = schemaInference
+    except:
+        print("Schema inference configuration is invalid, isEnabled must be \"yes\" or \"no\" and minStringLength between 1 and 1000.")
+        sys.exit()
+
+    # Validates if the bounding box extent is not to large for OSM server, the size is not limited when reading from the local extract
     try:
         bBox = {k:float(v) for (k,v) in data["boundingBox"].items()}
         area = getbBoxArea(bBox)
-        if area > 1.7:
-            raise Exception("Bounding box area to large for OSM server, please select a smaller extent.")
+        if area > 1.7 and tiling["isEnabled"] != "yes" and extract["isEnabled"] != "yes":
+            raise Exception("Bounding box area to large for OSM server, please select a smaller extent or enable tiling.")
     except Exception as e:
         print(str(e))
         sys.exit()   
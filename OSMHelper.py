@@ -7,79 +7,99 @@ __version__ = "1.4"
 __email__ = "lukas.bug@aol.de"
 '''
 
-from osm_runner import gen_osm_sdf
-from osm_runner_utils import Filters
+from osm_runner import request_geom_elements, build_osm_layer_list, gen_osm_layer_list, gen_osm_delta_list
+from osm_runner_utils import Filters, Tiling, Cache, Streaming, Output, Overpass, Extract, ProcessPool, Schema
 from threading import Thread
 from ExceptionHelper import OSMHelperExceptions as osmh_excps
 import os,traceback
 threadlist = []
-sdflist = []
-def requestOSMData(osmconfig, elem, sdflist):
+def requestOSMData(osmconfig, elem, layerlist, idx):
     '''
     Function to prepare request of an OSM data item using osm-runner
     @param osmconfig: A dictionary containing the OSM configuration defined in the file osmconfig.json. 
     @param elem: OSM-configuration item (category) defined in the file osmconfig.json
-    @param sdflist: List of spatial dataframes needed for upload to portal.
+    @param layerlist: List of the requested elements of the categories, converted to Esri JSON featuresets after all requests finished.
+    @param idx: The position of the category in the list of layers.
     '''
-    if elem['isEnabled'] == 'yes':
-        geom = elem['geometryType']
-        bbox = osmconfig['boundingBox']
-        category = elem['categoryName']
-        excludedattributes = elem['attributeFieldsToExclude']
-        Filters[elem['categoryName']] = elem['categoryValues']
-        osmdata = fetchOSMData(geom, bbox, category, excludedattributes)
-        sdflist.append(osmdata)
+    geom = elem['geometryType']
+    bbox = osmconfig['boundingBox']
+    category = elem['categoryName']
+    Filters[elem['categoryName']] = elem['categoryValues']
+    osmdata = fetchOSMData(geom, bbox, category)
+    layerlist[idx] = osmdata
 
-def getDataFrameList(osmconfig):
+def configureRunner(osmconfig):
+    '''
+    Function to pass the request and processing settings of the OSM configuration to osm-runner.
+    @param osmConfig: A dictionary containing the OSM configuration defined in the file osmconfig.json. 
+    '''
+    Tiling.update(osmconfig['tiling'])
+    Cache.update(osmconfig['cache'])
+    Streaming.update(osmconfig['streaming'])
+    Output.update(osmconfig['output'])
+    Overpass.update(osmconfig['overpass'])
+    Extract.update(osmconfig['extract'])
+    ProcessPool.update(osmconfig['processPool'])
+    Schema.update(osmconfig['schemaInference'])
+
+def getLayerList(osmconfig):
     '''
     Function to initiate simulatenous (Thread-based) requests to OSM using osm-runner.
+    Returns the list of Esri JSON featuresets in the order of the enabled categories.
     @param osmConfig: A dictionary containing the OSM configuration defined in the file osmconfig.json. 
     '''
-    for elem in osmconfig['categories']:
-        t = Thread(target=requestOSMData, args=[osmconfig, elem, sdflist])
+    configureRunner(osmconfig)
+    # The local extract is read once for all categories, a request per category would decode the whole file again
+    if osmconfig['coalesceQueries'] == 'yes' or Extract['isEnabled'] == 'yes':
+        return fetchOSMDataList(osmconfig)
+    categories = [elem for elem in osmconfig['categories'] if elem['isEnabled'] == 'yes']
+    layerlist = [None] * len(categories)
+    for idx, elem in enumerate(categories):
+        t = Thread(target=requestOSMData, args=[osmconfig, elem, layerlist, idx])
         threadlist.append(t)
         t.start()
     for t in threadlist:
         t.join()
-    return sdflist
+    # The layers are built after all requests finished, so elements of overlapping categories are only emitted by the first category
+    layers = build_osm_layer_list(categories, layerlist)
+    for idx, (layer, elem) in enumerate(zip(layers, categories)):
+        if not layer['features'] and not isOverlapping(categories, idx):
+            print('OSM request could not be completed. \n Cause: OSM returned empty result for geometry '+elem['geometryType']+' , \
+            the scripts exits now. Additional configuration information: Category: '+elem['categoryName']+', excluded attributes: \
+            '+str(elem['attributeFieldsToExclude'])+', \n Disable this configuration and try again.')
+            os._exit(-1)
+    return layers
+
+def isOverlapping(categories, idx):
+    '''
+    Function to check if a category overlaps a preceding category, its elements are emitted by the preceding one and its layer may be empty.
+    Returns True if a preceding category has the same name and geometry type.
+    @param categories: The list of enabled category items defined in the file osmconfig.json.
+    @param idx: The position of the category in the list.
+    '''
+    elem = categories[idx]
+    return any(c['categoryName'] == elem['categoryName'] and c['geometryType'] == elem['geometryType'] for c in categories[:idx])
 
-def fetchOSMData(geom, bbox, category, excludedattributes):
+def fetchOSMData(geom, bbox, category):
     '''
-    Function to create layer definitions for upload to portal.
+    Function to request the elements of a category, returns a tuple with the node or way elements and the relation elements.
     @param geom: The geometry type of the requested data.
     @param bbox: The extent of the requested data defined by a bounding box. 
     @param category: The category name of the requested data.
-    @param excludedattributes: The attributes to be excluded from the current layer.
     '''
     try:
         print('Fetching '+geom+' data from OpenStreetMap on category: '+category+' . . .')
-        if geom != 'polygon':
-            sdf = gen_osm_sdf(geom, bbox, excludedattributes, category)
-            if not sdf.empty:
-                return sdf
-            else:
-                if FileNotFoundError:
-                    raise FileNotFoundError
-                if ConnectionRefusedError:
-                    raise ConnectionRefusedError
-                if RuntimeError:
-                    raise RuntimeError
-        else:
-            sdf = gen_osm_sdf(geom, bbox, excludedattributes, category, 1)
-            if not sdf.empty:
-                return sdf
-            else:
-                if FileNotFoundError:
-                    raise FileNotFoundError
-                if ConnectionRefusedError:
-                    raise ConnectionRefusedError
-                if RuntimeError:
-                    raise RuntimeError
+        return request_geom_elements(geom.lower(), bbox, category, None, None, False)
     except FileNotFoundError:
         tb = traceback.format_exc()
         print('OSM request could not be completed. \n Cause: OSM returned empty result for geometry '+geom+' , \
-        the scripts exits now. Additional configuration information: Category: '+category+', excluded attributes: \
-        '+excludedattributes+', \n Disable this configuration and try again. Detailed information: '+tb)
+        the scripts exits now. Additional configuration information: Category: '+category+', \
+        \n Disable this configuration and try again. Detailed information: '+tb)
+        os._exit(-1)
+    except TimeoutError:
+        tb = traceback.format_exc()
+        print('OSM request could not be completed. \n Cause: '+osmh_excps.osm_extenttolarge.description+' \
+        Alternatively enable tiling or lower "maxTileArea" in the OSM-configfile (osmconfig.json). Detailed information: '+tb)
         os._exit(-1)
     except ConnectionRefusedError:
         tb = traceback.format_exc()
@@ -89,4 +109,67 @@ def fetchOSMData(geom, bbox, category, excludedattributes):
     except RuntimeError:
         tb = traceback.format_exc()
         print('OSM request could not be completed. \n Cause: OSM returned an unknown error. Detailed information: '+tb)
-        os._exit(-1)
\ No newline at end of file
+        os._exit(-1)
+
+def fetchOSMDataList(osmconfig):
+    '''
+    Function to request the data of all enabled categories with a single union query, returns the list of Esri JSON featuresets.
+    @param osmConfig: A dictionary containing the OSM configuration defined in the file osmconfig.json. 
+    '''
+    categories = [elem for elem in osmconfig['categories'] if elem['isEnabled'] == 'yes']
+    try:
+        if Extract['isEnabled'] == 'yes':
+            print('Reading data of '+str(len(categories))+' categories from the extract '+Extract['file']+' . . .')
+        else:
+            print('Fetching data of '+str(len(categories))+' categories from OpenStreetMap with a single request . . .')
+        layers = gen_osm_layer_list(categories, osmconfig['boundingBox'])
+        for idx, (layer, elem) in enumerate(zip(layers, categories)):
+            if not layer['features'] and not isOverlapping(categories, idx):
+                raise FileNotFoundError('OSM returned empty result for geometry '+elem['geometryType']+' on category: '+elem['categoryName'])
+        return layers
+    except FileNotFoundError:
+        tb = traceback.format_exc()
+        print('OSM request could not be completed. \n Cause: '+osmh_excps.osm_emptyresponse.description+' \
+        Disable the configuration and try again. Detailed information: '+tb)
+        os._exit(-1)
+    except TimeoutError:
+        tb = traceback.format_exc()
+        print('OSM request could not be completed. \n Cause: '+osmh_excps.osm_extenttolarge.description+' \
+        Alternatively enable tiling or lower "maxTileArea" in the OSM-configfile (osmconfig.json). Detailed information: '+tb)
+        os._exit(-1)
+    except ConnectionRefusedError:
+        tb = traceback.format_exc()
+        print('OSM request could not be completed. \n Cause: OSM refused the connection due to too many requests, \
+        try again later. Detailed information: '+tb)
+        os._exit(-1)
+    except RuntimeError:
+        tb = traceback.format_exc()
+        print('OSM request could not be completed. \n Cause: OSM returned an unknown error. Detailed information: '+tb)
+        os._exit(-1)
+
+def getDeltaList(osmconfig, since):
+    '''
+    Function to request the changes of all enabled categories since the last synchronization, returns a list of tuples
+    (layer, changed_ids, current_ids) in the order of the categories, layer is an Esri JSON featureset or None if no element of the category changed.
+    @param osmConfig: A dictionary containing the OSM configuration defined in the file osmconfig.json. 
+    @param since: The timestamp of the last synchronization, e.g. "2018-06-01T00:00:00Z".
+    '''
+    configureRunner(osmconfig)
+    categories = [elem for elem in osmconfig['categories'] if elem['isEnabled'] == 'yes']
+    try:
+        print('Fetching changes of '+str(len(categories))+' categories since '+since+' from OpenStreetMap . . .')
+        return gen_osm_delta_list(categories, osmconfig['boundingBox'], since)
+    except TimeoutError:
+        tb = traceback.format_exc()
+        print('OSM request could not be completed. \n Cause: '+osmh_excps.osm_extenttolarge.description+' \
+        Alternatively enable tiling or lower "maxTileArea" in the OSM-configfile (osmconfig.json). Detailed information: '+tb)
+        os._exit(-1)
+    except ConnectionRefusedError:
+        tb = traceback.format_exc()
+        print('OSM request could not be completed. \n Cause: OSM refused the connection due to too many requests, \
+        try again later. Detailed information: '+tb)
+        os._exit(-1)
+    except RuntimeError:
+        tb = traceback.format_exc()
+        print('OSM request could not be completed. \n Cause: OSM returned an unknown error. Detailed information: '+tb)
+        os._exit(-1)
@@ -13,23 +13,30 @@ This is the main module of osm_runner, parts of the configuration for this modul
 Copyright for parts of this version of osm_runner belongs to Jeffrey Scarmazzi.
 '''
 
-from osm_runner_utils import Format, Output, Filters, Elements
+from osm_runner_utils import Format, Output, OutputProfiles, Filters, Elements, GeometryTypes, Tiling, Streaming, Extract, ProcessPool, Schema
+from osm_runner_cache import get_cache_key, read_cached_response, open_cached_response, write_cached_response
+from osm_runner_client import get_client
+from osm_runner_elements import OSMElements, ElementLoader, load_elements
+from osm_runner_pbf import read_pbf_elements
 from arcgis.geometry import Point, Polyline, Polygon
 from arcgis.features import SpatialDataFrame
 from arcgis import geometry as geom
 from datetime import datetime as dt
-import requests,time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from collections import deque
+from itertools import islice
+from array import array
+import numpy as np
+import pandas as pd
+import re,json,io,os,gzip,mmap,tempfile,threading
 import progressbar,traceback,operator
+try:
+    import ijson
+except ImportError:
+    ijson = None
 
-def merge_sublist_items(sublist):
-    '''
-    Function to merge sublist items, returns the merged list.
-    @param sublist: A sublist to merge
-    '''
-    total = []
-    for sublistitem in sublist:
-        total += sublistitem
-    return total
+process_pool = None
+process_pool_lock = threading.Lock()
 
 def createpbar(total):
     '''
@@ -51,144 +58,662 @@ def updatepbar(progress, pbar):
         pbar.finish()
     return progress
 
-def checkrings_connected(lst,r):
+def assemble_rings(paths):
     '''
-    Function to check if all rings in the list are connected, returns the boolean values True or False.
-    @param lst: A list of rings.
+    Function to assemble closed rings from the coordinate paths of member ways, e.g. the outer ways of a multipolygon relation.
+    The endpoints of all paths are indexed in a hash map, so that every chain of connected paths is walked in linear time.
+    Paths are reversed, if they are connected end to end. Chains which cannot be closed are dropped.
+    Returns a list of closed rings, every ring is a list of coordinate tuples with the same first and last coordinate.
+    @param paths: A list of paths, every path is a list of coordinate tuples.
     '''
-    connectedlist = []
-    for ring in range(len(lst)):
-        try:
-            if lst[ring][0] == lst[ring-1][-1]:
-                connectedlist.append(ring) 
-        except:
-            break
-    if len(connectedlist) == len(lst):
-        return True 
-    else:
-        return False
+    rings = []
+    endpoints = {}
+    paths = [path for path in paths if len(path) > 1]
+    for idx, path in enumerate(paths):
+        if path[0] == path[-1]:
+            continue
+        endpoints.setdefault(path[0], []).append(idx)
+        endpoints.setdefault(path[-1], []).append(idx)
 
-def checkrings_closed(lst,r):
+    used = [False] * len(paths)
+    for idx, path in enumerate(paths):
+        if used[idx]:
+            continue
+        used[idx] = True
+        chain = list(path)
+        while chain[0] != chain[-1]:
+            candidates = endpoints.get(chain[-1], [])
+            nextidx = next((c for c in candidates if not used[c]), None)
+            if nextidx is None:
+                break
+            used[nextidx] = True
+            nextpath = paths[nextidx]
+            if nextpath[0] == chain[-1]:
+                chain.extend(nextpath[1:])
+            else:
+                chain.extend(reversed(nextpath[:-1]))
+        if chain[0] == chain[-1] and len(chain) > 3:
+            rings.append(chain)
+    return rings
+
+def ring_signed_area(ring):
     '''
-    Function to check if all rings in the list are closed (valid), returns the boolean values True or False.
-    @param lst: A list of rings.
+    Function to compute the signed area of a closed ring with the shoelace formula.
+    Returns the area, positive for counterclockwise and negative for clockwise rings.
+    @param ring: A closed ring, a packed coordinate array of shape (n, 2).
     '''
-    newlst = []
-    for ring in range(len(lst)):
-        if lst[ring][0] == lst[ring][-1]:
-            newlst.append(ring)
-    if len(lst) == len(newlst):            
-        return True
-    else:
-        return False
+    x = ring[:, 0]
+    y = ring[:, 1]
+    return 0.5 * (np.dot(x[:-1], y[1:]) - np.dot(x[1:], y[:-1]))
+
+def ring_is_closed(ring):
+    '''
+    Function to check if a ring is closed and has at least three distinct vertices, returns the boolean values True or False.
+    @param ring: A packed coordinate array of shape (n, 2).
+    '''
+    return len(ring) > 3 and bool(np.all(ring[0] == ring[-1]))
 
-def detect_rings(lst):
+def ring_self_intersects(ring, max_pairs=5000000):
     '''
-    Function to identify polygon rings in a ring-ordered geometry list, returns the identified rings containing geometries.
-    @param lst: A list with ring-ordered geometries.
+    Function to check if two non-adjacent segments of a closed ring cross each other, returns the boolean values True or False.
+    The segments are sorted by their minimum x coordinate, so that only pairs with overlapping x ranges are tested.
+    The pairs are tested vectorized in chunks of at most max_pairs pairs, so the memory stays bounded for large rings,
+    touching and collinear segments are not reported.
+    @param ring: A closed ring, a packed coordinate array of shape (n, 2).
+    @param max_pairs: The maximum number of segment pairs tested at once.
     '''
-    ringlist = []
+    n = len(ring) - 1
+    if n < 4:
+        return False
+    a = ring[:-1]
+    b = ring[1:]
+    xmin = np.minimum(a[:, 0], b[:, 0])
+    xmax = np.maximum(a[:, 0], b[:, 0])
+    order = np.argsort(xmin, kind='stable')
+    xmin_sorted = xmin[order]
+    # For every segment, all segments later in the sorted order starting left of its maximum x are candidates
+    hi = np.searchsorted(xmin_sorted, xmax[order], side='right')
+    counts = np.maximum(hi - np.arange(n) - 1, 0)
+    cumulated = np.cumsum(counts)
     start = 0
-    end = -1
-    for e in range(len(lst)):
-        if lst[e] == lst[start] and e > start:
-            end = e
-            ringlist.append(lst[start:end+1])
-            start = e+1           
-    return ringlist
-
-def l_ordered_remove_duplicates(lst):
-    '''
-    Function to remove duplicates in a ring-ordered geometry list, appends start element to close the polygon ring.
-    Returns a duplicate-free (except start and end) list -> a valid polygon ring.
-    @param lst: A list with ring-ordered geometries.
-    '''
-    if lst:
-        present = set()
-        present_add = present.add
-        duplicate_free_l = [x for x in lst if not (x in present or present_add(x))]
-        duplicate_free_l.append(lst[0])
-        return duplicate_free_l
-
-def lget (l, idx, default=[]):
-    '''
-    Function to implement a get-method, known from dictionaries, for lists. 
-    Returns either the element at the index position or the default value, an empty list.
-    @param l: A list.
-    @param idx: A list index.
-    @param default: A value to be returned by the function if index does not exist.
+    while start < n:
+        # The chunk contains the candidates of the following sorted segments up to max_pairs pairs, at least of one segment
+        end = max(int(np.searchsorted(cumulated, cumulated[start] - counts[start] + max_pairs, side='right')), start + 1)
+        if segments_cross(a, b, order, counts, start, end):
+            return True
+        start = end
+    return False
+
+def segments_cross(a, b, order, counts, start, end):
     '''
-    try:
-        return l[idx]
-    except IndexError:
-        return default
+    Function to test the candidate pairs of a chunk of segments of a ring, see ring_self_intersects. Returns the boolean values True or False.
+    @param a: The start vertices of the segments.
+    @param b: The end vertices of the segments.
+    @param order: The indices of the segments sorted by their minimum x coordinate.
+    @param counts: The number of candidates of every segment in the sorted order.
+    @param start: The first position of the chunk in the sorted order.
+    @param end: The position after the chunk in the sorted order.
+    '''
+    n = len(a)
+    counts = counts[start:end]
+    total = int(counts.sum())
+    if total == 0:
+        return False
+    first = np.repeat(np.arange(start, end), counts)
+    offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    i = order[first]
+    j = order[first + 1 + offsets]
+    # Adjacent segments share a vertex, the last segment is adjacent to the first one
+    gap = np.abs(i - j)
+    keep = (gap > 1) & (gap != n - 1)
+    i = i[keep]
+    j = j[keep]
+    ymin_i = np.minimum(a[i, 1], b[i, 1])
+    ymax_i = np.maximum(a[i, 1], b[i, 1])
+    ymin_j = np.minimum(a[j, 1], b[j, 1])
+    ymax_j = np.maximum(a[j, 1], b[j, 1])
+    keep = (ymin_i <= ymax_j) & (ymin_j <= ymax_i)
+    i = i[keep]
+    j = j[keep]
+    di = b[i] - a[i]
+    dj = b[j] - a[j]
+    o1 = di[:, 0] * (a[j, 1] - a[i, 1]) - di[:, 1] * (a[j, 0] - a[i, 0])
+    o2 = di[:, 0] * (b[j, 1] - a[i, 1]) - di[:, 1] * (b[j, 0] - a[i, 0])
+    o3 = dj[:, 0] * (a[i, 1] - a[j, 1]) - dj[:, 1] * (a[i, 0] - a[j, 0])
+    o4 = dj[:, 0] * (b[i, 1] - a[j, 1]) - dj[:, 1] * (b[i, 0] - a[j, 0])
+    return bool(np.any((o1 * o2 < 0) & (o3 * o4 < 0)))
+
+def ring_is_valid(ring):
+    '''
+    Function to check if a ring is closed, has an area and does not intersect itself, returns the boolean values True or False.
+    @param ring: A packed coordinate array of shape (n, 2).
+    '''
+    return ring_is_closed(ring) and ring_signed_area(ring) != 0.0 and not ring_self_intersects(ring)
 
-def lfindgetsingleidx(l, val, excl):
+def orient_ring(ring, clockwise):
     '''
-    Function to get the position of a value in a list of lists e.g. geometries in a polygon ring list. 
-    A known index can be excluded from search results, to find the appropriate index, not the first one.
-    Returns the sublist index, where the value is located and the index of the value in the sublist.
-    @param l: A list containing a sublist with values.
-    @param val: A value e.g. a geometry tuple.
-    @param excl: An excluded index e.g. a known index, in cases an element is provided, which is also inside a known sublist.
+    Function to orient a closed ring.
+    Returns the ring in the requested orientation.
+    @param ring: A closed ring, a packed coordinate array of shape (n, 2).
+    @param clockwise: Specifies if the ring is oriented clockwise (outer rings) or counterclockwise (inner rings).
     '''
-    try:
-        validx = [idx for idx,item in enumerate(l) if idx != excl and val in item][0]
-        result = [validx, l[validx].index(val)]
-        return result
-    except:
-        return []
+    if (ring_signed_area(ring) < 0) != clockwise:
+        return ring[::-1]
+    return ring
 
-def merge_dict_lists(dict_list1, dict_list2):
+def assemble_multipolygon(outerpaths, innerpaths):
     '''
-    Function to merge lists in a dictionary.
-    Returns a dictionary with merged lists.
-    @param dict_list1: First list.
-    @param dict_list2: Second list.
+    Function to assemble the rings of a multipolygon relation, oriented as required for Esri polygons.
+    Rings which are not closed, have no area or intersect themselves are dropped.
+    Returns a tuple with the list of clockwise outer rings and the list of counterclockwise inner rings,
+    every ring is a packed coordinate array of shape (n, 2).
+    @param outerpaths: The paths of the outer member ways, every path is a list of coordinate tuples.
+    @param innerpaths: The paths of the inner member ways, every path is a list of coordinate tuples.
     '''
-    keys = set(dict_list1).union(dict_list2)
-    empty1 = ['' for i in range(len(dict_list1['osm_id']))]
-    empty2 = ['' for i in range(len(dict_list2['osm_id']))]
-    return dict((k, dict_list1.get(k, empty1) + dict_list2.get(k, empty2)) for k in keys)
+    outerrings = [np.asarray(ring, dtype=np.float64) for ring in assemble_rings(outerpaths)]
+    innerrings = [np.asarray(ring, dtype=np.float64) for ring in assemble_rings(innerpaths)]
+    outerrings = [orient_ring(ring, True) for ring in outerrings if ring_is_valid(ring)]
+    innerrings = [orient_ring(ring, False) for ring in innerrings if ring_is_valid(ring)]
+    return outerrings, innerrings
 
-def gen_osm_sdf(geom_type, bound_box, excludedattributes, osm_tag=None, relation=None, time_one=None, time_two=None, present=False):
+def gen_osm_sdf(geom_type, bound_box, excludedattributes, osm_tag=None, relation=None, time_one=None, time_two=None, present=False, tag_layout=None, field_pruning=None):
     '''
     Function to send requests to OpenStreetMap.
     Returns an Esri SpatialDataFrame.
     @param geom_type: Specifies input geometry. Value must be either "point", "line", or "polygon".
     @param bound_box: A bounding box specified.
     @param subdict: A boolean value, True or False. Controls if subdictionaries are included into searches or not.
+    @param tag_layout: Optional layout of the tag fields, see pack_overflow_tags.
+    @param field_pruning: Optional pruning of sparse tag fields, see prune_sparse_tags.
+    '''
+
+    geom_type = geom_type.lower()
+
+    osm_response, osm_r_response = request_geom_elements(geom_type, bound_box, osm_tag, time_one, time_two, present)
+
+    return build_osm_sdf(geom_type, osm_response, excludedattributes, osm_r_response, tag_layout, field_pruning)
+
+
+def gen_osm_layer(geom_type, bound_box, excludedattributes, osm_tag=None, time_one=None, time_two=None, present=False, tag_layout=None, field_pruning=None):
+    '''
+    Function to send requests to OpenStreetMap.
+    Returns an Esri JSON featureset dictionary, see emit_esri_featureset.
+    @param geom_type: Specifies input geometry. Value must be either "point", "line", or "polygon".
+    @param bound_box: A bounding box specified.
+    @param excludedattributes: The attributes exluded in the configuration file osmconfig.json
+    @param osm_tag: Specifies the OpenStreetMap tag / category element.
+    @param time_one: Minimum timestamp of the returned OSM content.
+    @param time_two: Maximum timestamp of the returned OSM content.
+    @param present: Specifies if the time until or from now is used to define the minimum or maximum timestamp.
+    @param tag_layout: Optional layout of the tag fields, see pack_overflow_tags.
+    @param field_pruning: Optional pruning of sparse tag fields, see prune_sparse_tags.
     '''
 
     geom_type = geom_type.lower()
 
+    osm_response, osm_r_response = request_geom_elements(geom_type, bound_box, osm_tag, time_one, time_two, present)
+
+    return build_osm_layer(geom_type, osm_response, excludedattributes, osm_r_response, tag_layout, field_pruning)
+
+
+def request_geom_elements(geom_type, bound_box, osm_tag, time_one, time_two, present):
+    '''
+    Function to request the elements of a geometry type, polygons are requested as ways and relations.
+    Returns a tuple with the node or way elements and the relation elements, the relation elements are None for points and lines.
+    @param geom_type: Specifies input geometry. Value must be either "point", "line", or "polygon".
+    @param bound_box: A bounding box specified.
+    @param osm_tag: Specifies the OpenStreetMap tag / category element.
+    @param time_one: Minimum timestamp of the returned OSM content.
+    @param time_two: Maximum timestamp of the returned OSM content.
+    @param present: Specifies if the time until or from now is used to define the minimum or maximum timestamp.
+    '''
     if geom_type not in ['point', 'line', 'polygon']:
         raise Exception('Geometry Type "{0}" Does Not Match Input Options: point|line|polygon'.format(geom_type))
 
+    osm_element = Elements.get(geom_type)
+
+    if Extract['isEnabled'] == 'yes':
+        clauses = [(osm_element, osm_tag, Filters.get(osm_tag.lower()) if osm_tag else None)]
+        if geom_type == 'polygon':
+            clauses.append(('relation', osm_tag, Filters.get(osm_tag.lower()) if osm_tag else None))
+        elements = request_extract_elements(clauses, bound_box, time_one, time_two)
+        osm_r_response = elements.select('relation', elements.relations) if geom_type == 'polygon' else None
+        return elements.select(osm_element, elements.get_records(osm_element)), osm_r_response
+
+    osm_response = request_osm_elements(osm_element, bound_box, osm_tag, time_one, time_two, present)
+
+    osm_r_response = None
+
+    if geom_type == 'polygon':
+
+        osm_r_response = request_osm_elements("relation", bound_box, osm_tag, time_one, time_two, present)
+
+    return osm_response, osm_r_response
+
+
+def build_osm_sdf(geom_type, osm_response, excludedattributes, osm_r_response=None, tag_layout=None, field_pruning=None):
+    '''
+    Function to convert OSM elements of a geometry type to an Esri SpatialDataFrame.
+    Returns an Esri SpatialDataFrame.
+    @param geom_type: Specifies input geometry. Value must be either "point", "line", or "polygon".
+    @param osm_response: The OSMElements set with the node or way elements as returned by the request_osm_query function.
+    @param excludedattributes: The attributes exluded in the configuration file osmconfig.json
+    @param osm_r_response: The OSMElements set with the relation elements, only used for polygons.
+    @param tag_layout: Optional layout of the tag fields, see pack_overflow_tags.
+    @param field_pruning: Optional pruning of sparse tag fields, see fields_cleaner.
+    '''
+    columns = build_osm_columns(geom_type, osm_response, excludedattributes, osm_r_response, tag_layout)
+
+    base_sdf = build_sdf_from_columns(columns, geom_type)
+
+    sdf = fields_cleaner(base_sdf, field_pruning, get_overflow_fields(tag_layout))
+
+    return sdf
+
+
+def build_osm_layer(geom_type, osm_response, excludedattributes, osm_r_response=None, tag_layout=None, field_pruning=None):
+    '''
+    Function to convert OSM elements of a geometry type directly to upload-ready Esri JSON features.
+    Returns an Esri JSON featureset dictionary, see emit_esri_featureset.
+    @param geom_type: Specifies input geometry. Value must be either "point", "line", or "polygon".
+    @param osm_response: The OSMElements set with the node or way elements as returned by the request_osm_query function.
+    @param excludedattributes: The attributes exluded in the configuration file osmconfig.json
+    @param osm_r_response: The OSMElements set with the relation elements, only used for polygons.
+    @param tag_layout: Optional layout of the tag fields, see pack_overflow_tags.
+    @param field_pruning: Optional pruning of sparse tag fields, see prune_sparse_tags.
+    '''
+    columns = build_osm_columns(geom_type, osm_response, excludedattributes, osm_r_response, tag_layout)
+
+    columns['tags'] = prune_sparse_tags(columns['tags'], len(columns['osm_id']), field_pruning, get_overflow_fields(tag_layout))
+
+    return emit_esri_featureset(columns, geom_type)
+
+
+def build_osm_columns(geom_type, osm_response, excludedattributes, osm_r_response=None, tag_layout=None):
+    '''
+    Function to convert OSM elements of a geometry type to columns, see pack_element_columns.
+    Returns a dictionary of columns.
+    @param geom_type: Specifies input geometry. Value must be either "point", "line", or "polygon".
+    @param osm_response: The OSMElements set with the node or way elements as returned by the request_osm_query function.
+    @param excludedattributes: The attributes exluded in the configuration file osmconfig.json
+    @param osm_r_response: The OSMElements set with the relation elements, only used for polygons.
+    @param tag_layout: Optional layout of the tag fields, see pack_overflow_tags.
+    '''
+    if geom_type == 'polygon':
+        columns = build_polygon_columns(osm_response, excludedattributes, osm_r_response)
+
+    if geom_type == 'point':
+        columns = build_node_columns(osm_response.nodes, excludedattributes)
+
+    if geom_type == 'line':
+        columns = build_line_columns(osm_response, excludedattributes)
+
+    columns['tags'] = pack_overflow_tags(columns['tags'], tag_layout)
+
+    return columns
+
+
+def gen_osm_sdf_list(categories, bound_box, time_one=None, time_two=None, present=False):
+    '''
+    Function to send a single union request for all categories to OpenStreetMap. The returned elements
+    are split into the categories by element type and tag match.
+    Returns a list of Esri SpatialDataFrames in the order of the categories.
+    @param categories: The list of category items defined in the file osmconfig.json.
+    @param bound_box: A bounding box specified.
+    @param time_one: Minimum timestamp of the returned OSM content.
+    @param time_two: Maximum timestamp of the returned OSM content.
+    @param present: Specifies if the time until or from now is used to define the minimum or maximum timestamp.
+    '''
+    sdf_list = []
+    responses = request_category_elements(categories, bound_box, time_one, time_two, present)
+    for cat, (osm_response, osm_r_response) in zip(categories, dedup_category_elements(categories, responses)):
+        geom_type = cat['geometryType'].lower()
+        print('Building '+geom_type+' data of category: '+cat['categoryName']+' . . .')
+        sdf_list.append(build_osm_sdf(geom_type, osm_response, cat['attributeFieldsToExclude'], osm_r_response, cat.get('tagLayout'), cat.get('fieldPruning')))
+
+    return sdf_list
+
+
+def gen_osm_layer_list(categories, bound_box, time_one=None, time_two=None, present=False):
+    '''
+    Function to send a single union request for all categories to OpenStreetMap. The returned elements
+    are split into the categories by element type and tag match.
+    Returns a list of Esri JSON featureset dictionaries in the order of the categories, see emit_esri_featureset.
+    @param categories: The list of category items defined in the file osmconfig.json.
+    @param bound_box: A bounding box specified.
+    @param time_one: Minimum timestamp of the returned OSM content.
+    @param time_two: Maximum timestamp of the returned OSM content.
+    @param present: Specifies if the time until or from now is used to define the minimum or maximum timestamp.
+    '''
+    return build_osm_layer_list(categories, request_category_elements(categories, bound_box, time_one, time_two, present))
+
+
+def build_osm_layer_list(categories, responses):
+    '''
+    Function to convert the elements of all categories to Esri JSON featuresets, elements of overlapping categories
+    are only emitted by the first category, see dedup_category_elements.
+    Returns a list of Esri JSON featureset dictionaries in the order of the categories, see emit_esri_featureset.
+    @param categories: The list of category items defined in the file osmconfig.json.
+    @param responses: A list of tuples with the node or way elements and the relation elements in the order of the categories,
+                      as returned by the request_geom_elements or the split_category_elements function.
+    '''
+    layer_list = []
+    for cat, (osm_response, osm_r_response) in zip(categories, dedup_category_elements(categories, responses)):
+        geom_type = cat['geometryType'].lower()
+        print('Building '+geom_type+' data of category: '+cat['categoryName']+' . . .')
+        layer_list.append(build_osm_layer(geom_type, osm_response, cat['attributeFieldsToExclude'], osm_r_response, cat.get('tagLayout'), cat.get('fieldPruning')))
+
+    return layer_list
+
+
+def request_category_elements(categories, bound_box, time_one, time_two, present):
+    '''
+    Function to send a single union request for all categories to OpenStreetMap and to split the elements into the categories.
+    Returns a list of tuples with the node or way elements and the relation elements in the order of the categories,
+    the relation elements are None for points and lines.
+    @param categories: The list of category items defined in the file osmconfig.json.
+    @param bound_box: A bounding box specified.
+    @param time_one: Minimum timestamp of the returned OSM content.
+    @param time_two: Maximum timestamp of the returned OSM content.
+    @param present: Specifies if the time until or from now is used to define the minimum or maximum timestamp.
+    '''
+    clauses = get_category_clauses(categories)
+
+    if Extract['isEnabled'] == 'yes':
+        elements = request_extract_elements(clauses, bound_box, time_one, time_two)
     else:
-        osm_element = Elements.get(geom_type)
+        elements = request_osm_query(lambda bbox: get_union_query(clauses, bbox, time_one, time_two, present), bound_box)
 
-        query = get_query(osm_element, bound_box, osm_tag, time_one, time_two, present)
+    return [split_category_elements(elements, cat) for cat in categories]
+
+
+def dedup_category_elements(categories, responses):
+    '''
+    Function to drop the elements of a category, which are already emitted by a preceding category, so overlapping categories
+    do not upload the same feature twice. The elements are identified by type and id, a way is only emitted by a category
+    of its geometry type, closed ways by polygon categories and open ways by line categories, the other ways are dropped
+    without claiming them. The same index is used for the union request, the requests per category and the delta synchronization.
+    Returns a list of tuples with the node or way elements and the relation elements in the order of the categories.
+    @param categories: The list of category items defined in the file osmconfig.json.
+    @param responses: A list of tuples with the node or way elements and the relation elements, see split_category_elements.
+    '''
+    claimed = set()
+    result = []
+    for cat, (osm_response, osm_r_response) in zip(categories, responses):
+        geom_type = cat['geometryType'].lower()
+        osm_el = Elements.get(geom_type)
+        records = []
+        dropped = 0
+        for e in osm_response.get_records(osm_el):
+            if e.type == 'way' and e.closed != (geom_type == 'polygon'):
+                continue
+            if (e.type, e.id) in claimed:
+                dropped += 1
+                continue
+            records.append(e)
+            claimed.add((e.type, e.id))
+        osm_response = osm_response.select(osm_el, records)
+        if osm_r_response is not None:
+            relations = [r for r in osm_r_response.relations if ('relation', r.id) not in claimed]
+            dropped += len(osm_r_response.relations) - len(relations)
+            claimed.update(('relation', r.id) for r in relations)
+            osm_r_response = osm_r_response.select('relation', relations)
+        if dropped:
+            print('Dropped '+str(dropped)+' elements of category '+cat['categoryName']+' already emitted by a preceding category . . .')
+        result.append((osm_response, osm_r_response))
+    return result
+
+
+def split_category_elements(elements, cat):
+    '''
+    Function to select the elements of a category from the result of a union query.
+    Returns a tuple with the node or way elements and the relation elements, the relation elements are None for points and lines.
+    @param elements: The OSMElements set as returned by the request_osm_query function.
+    @param cat: A category item defined in the file osmconfig.json.
+    '''
+    geom_type = cat['geometryType'].lower()
+    osm_response = get_category_elements(elements, Elements.get(geom_type), cat['categoryName'], cat['categoryValues'])
+    osm_r_response = None
+    if geom_type == 'polygon':
+        osm_r_response = get_category_elements(elements, 'relation', cat['categoryName'], cat['categoryValues'])
+    return osm_response, osm_r_response
+
+
+def gen_osm_delta_list(categories, bound_box, since):
+    '''
+    Function to request the changes of all categories since a timestamp from OpenStreetMap. A union request returns the changed elements,
+    a second union request returns the ids and tags of all current elements, to detect deleted elements and elements which lost their tags.
+    If the local extract is enabled, the changed elements are the elements of the extract edited after the timestamp.
+    Ways consumed by the current relations of a polygon category are neither changed nor current elements, like in the published layer,
+    every current relation is taken as assembled, see get_consumed_ways. The member ways of changed relations are changed elements as well,
+    so ways no longer consumed by a relation are rebuilt.
+    Returns a list of tuples (layer, changed_ids, current_ids) in the order of the categories, layer is an Esri JSON featureset dictionary
+    or None if no element of the category changed. The ids are tuples (osm_type, osm_id) like the "osm_type" and "osm_id" attributes
+    of the features, because a way and a relation of a polygon layer can have the same id. The current ids are None, if the request
+    of the current elements returned no elements, so a failed request is never taken for the deletion of all elements.
+    @param categories: The list of category items defined in the file osmconfig.json.
+    @param bound_box: A bounding box specified.
+    @param since: The timestamp of the last synchronization, e.g. "2018-06-01T00:00:00Z".
+    '''
+    clauses = get_category_clauses(categories)
 
-        osm_response = get_osm_elements(query, 0)
-        
+    if Extract['isEnabled'] == 'yes':
+        # An extract has no history, the changes are the elements edited after the timestamp
+        try:
+            current = request_extract_elements(clauses, bound_box)
+        except FileNotFoundError:
+            current = None
+        if current is None:
+            changed = load_elements([])
+        else:
+            # Like the delta query, relations with a changed member way and the member ways of changed relations are changed as well
+            changed_ways = {w.id for w in current.ways if w.timestamp and w.timestamp >= since}
+            changed_relations = [r for r in current.relations if (r.timestamp and r.timestamp >= since) or
+                                 any(m_type == 'way' and ref in changed_ways for m_type, ref, role in r.members)]
+            changed_ways.update(ref for r in changed_relations for m_type, ref, role in r.members if m_type == 'way')
+            changed = OSMElements([n for n in current.nodes if n.timestamp and n.timestamp >= since],
+                                  [w for w in current.ways if w.id in changed_ways], changed_relations, current.coords, current.offsets)
+    else:
+        # Both results depend on the time of the request, so the cache is bypassed
+        try:
+            changed = request_osm_query(lambda bbox: get_delta_query(clauses, bbox, since), bound_box, False)
+        except FileNotFoundError:
+            changed = load_elements([])
+        try:
+            current = request_osm_query(lambda bbox: get_ids_query(clauses, bbox), bound_box, False)
+        except FileNotFoundError:
+            current = None
+
+    if current is None:
+        print('OSM returned no current elements, deleted elements are not synchronized in this run . . .')
+
+    # The changed and the current elements are deduplicated like the published elements, so a duplicate is never added to a later category
+    changed_responses = dedup_category_elements(categories, [split_category_elements(changed, cat) for cat in categories])
+    current_responses = [(None, None)] * len(categories)
+    if current is not None:
+        current_responses = dedup_category_elements(categories, [split_category_elements(current, cat) for cat in categories])
+
+    delta_list = []
+    for cat, (osm_response, osm_r_response), (current_response, current_r_response) in zip(categories, changed_responses, current_responses):
+        geom_type = cat['geometryType'].lower()
+        changed_ids = {(e.type, str(e.id)) for response in [osm_response, osm_r_response or []] for e in response}
+        current_ids = None
+        if current_response is not None:
+            current_ids = {(e.type, str(e.id)) for response in [current_response, current_r_response or []] for e in response}
+            if current_r_response is not None:
+                relations = get_polygon_relations(current_r_response)
+                consumed = get_consumed_ways(relations, {r.id for r in relations}, current_response)
+                # Consumed ways are deleted, if they were published before
+                current_ids -= {('way', str(ref)) for ref in consumed}
+                osm_response = osm_response.select('way', [w for w in osm_response.ways if w.id not in consumed])
+        layer = None
+        if changed_ids:
+            # The changed elements are not representative for the density of the tags, so sparse fields are not pruned
+            print('Building changed '+geom_type+' data of category: '+cat['categoryName']+' . . .')
+            layer = build_osm_layer(geom_type, osm_response, cat['attributeFieldsToExclude'], osm_r_response, cat.get('tagLayout'))
+        delta_list.append((layer, changed_ids, current_ids))
+
+    return delta_list
+
+
+def get_category_clauses(categories):
+    '''
+    Function to collect the element types and tag filters of the categories.
+    Returns a list of tuples (osm_el, o_tag, filters), polygon categories contain a way and a relation clause.
+    @param categories: The list of category items defined in the file osmconfig.json.
+    '''
+    clauses = []
+    for cat in categories:
+        geom_type = cat['geometryType'].lower()
+        if geom_type not in ['point', 'line', 'polygon']:
+            raise Exception('Geometry Type "{0}" Does Not Match Input Options: point|line|polygon'.format(geom_type))
+        clauses.append((Elements.get(geom_type), cat['categoryName'], cat['categoryValues']))
         if geom_type == 'polygon':
-            
-            r_query = get_query("relation", bound_box, osm_tag, time_one, time_two, present)
+            clauses.append(('relation', cat['categoryName'], cat['categoryValues']))
+    return clauses
+
+
+def request_extract_elements(clauses, b_box, t1=None, t2=None):
+    '''
+    Function to read the elements of a union of clauses from the local .osm.pbf extract instead of the Overpass API.
+    Returns the elements as an OSMElements set, see osm_runner_elements.
+    @param clauses: A list of tuples (osm_el, o_tag, filters), o_tag is None if every element matches.
+    @param b_box: Specifies the bounding box as string e.g. "(minLat,minLon,maxLat,maxLon)".
+    @param t1: Minimum timestamp of the returned OSM content, not supported by extracts.
+    @param t2: Maximum timestamp of the returned OSM content, not supported by extracts.
+    '''
+    if t1 or t2:
+        raise Exception('Invalid Parameters - Timestamps Are Not Supported When Reading From An Extract')
 
-            osm_r_response = get_osm_elements(r_query, 0)
+    print('Reading data from the extract '+Extract['file']+' . . .')
+    elements = read_pbf_elements(Extract['file'], parse_bbox(b_box), clauses, Extract['nodeStore'], Extract['nodeStoreDirectory'])
+    if not elements:
+        raise FileNotFoundError('Extract Contains Zero Results for Bounding Box: {}'.format(b_box))
+    return elements
 
-            base_sdf = build_ways_sdf_topoly(osm_response, excludedattributes, osm_r_response)
 
-        if geom_type == 'point':
-            base_sdf = build_node_sdf(osm_response, excludedattributes)
+def request_osm_elements(osm_el, b_box, o_tag, t1, t2, present_flag):
+    '''
+    Function to request an OSM element type either with a single query or tile by tile, depending on the tiling configuration.
+    Returns the requested elements.
+    @param osm_el: Specifies the OpenStreetMap element. Valid values are "node", "way" or "relation"
+    @param b_box: Specifies the bounding box as string e.g. "(minLat,minLon,maxLat,maxLon)".
+    @param o_tag: Specifies the OpenStreetMap tag / category element.
+    @param t1: Minimum timestamp of the returned OSM content.
+    @param t2: Maximum timestamp of the returned OSM content.
+    @param present_flag: Specifies if the time until or from now is used to define the minimum or maximum timestamp.
+    '''
+    return request_osm_query(lambda bbox: get_query(osm_el, bbox, o_tag, t1, t2, present_flag), b_box)
 
-        if geom_type == 'line':
-            base_sdf = build_ways_sdf_toline(osm_response, excludedattributes)
 
-        sdf = fields_cleaner(base_sdf)
+def request_osm_query(query_func, b_box, use_cache=True):
+    '''
+    Function to request a query either for the whole bounding box or tile by tile, depending on the tiling configuration.
+    Returns the requested elements as an OSMElements set, see osm_runner_elements.
+    @param query_func: A function returning the query for a bounding box string.
+    @param b_box: Specifies the bounding box as string e.g. "(minLat,minLon,maxLat,maxLon)".
+    @param use_cache: Specifies if responses are read from and written to the cache.
+    '''
+    if Tiling['isEnabled'] == 'yes':
+        return get_osm_elements_tiled(query_func, b_box, use_cache)
+    return load_elements(get_osm_elements(query_func(b_box), use_cache))
 
-        return sdf
+
+def parse_bbox(b_box):
+    '''
+    Function to convert a bounding box string into a tuple of coordinates.
+    Returns a tuple (minLat, minLon, maxLat, maxLon).
+    @param b_box: A bounding box string e.g. "(48.0558,11.2723,48.2539,11.8113)".
+    '''
+    return tuple(float(c) for c in b_box.strip('() ').split(','))
+
+
+def format_bbox(b_box):
+    '''
+    Function to convert a bounding box tuple into the string format used in queries.
+    Returns a bounding box string e.g. "(48.0558,11.2723,48.2539,11.8113)".
+    @param b_box: A tuple (minLat, minLon, maxLat, maxLon).
+    '''
+    return '(' + ','.join(str(c) for c in b_box) + ')'
+
+
+def split_bbox(b_box):
+    '''
+    Function to split a bounding box into four quadrants.
+    Returns a list of four bounding box tuples.
+    @param b_box: A tuple (minLat, minLon, maxLat, maxLon).
+    '''
+    s, w, n, e = b_box
+    mlat = (s + n) / 2.0
+    mlon = (w + e) / 2.0
+    return [(s, w, mlat, mlon), (s, mlon, mlat, e), (mlat, w, n, mlon), (mlat, mlon, n, e)]
+
+
+def get_bbox_tiles(b_box, max_area):
+    '''
+    Function to split a bounding box into quadtree tiles, which are not larger than the maximum area.
+    Returns a list of bounding box tuples.
+    @param b_box: A tuple (minLat, minLon, maxLat, maxLon).
+    @param max_area: The maximum area of a tile in square degrees.
+    '''
+    tiles = [b_box]
+    result = []
+    while tiles:
+        tile = tiles.pop()
+        if (tile[2] - tile[0]) * (tile[3] - tile[1]) > max_area:
+            tiles += split_bbox(tile)
+        else:
+            result.append(tile)
+    return result
+
+
+def get_tile_elements(query_func, tile, use_cache=True):
+    '''
+    Function to request the elements of a single tile, an empty tile is a valid result.
+    Returns the requested elements.
+    @param query_func: A function returning the query for a bounding box string.
+    @param tile: A tuple (minLat, minLon, maxLat, maxLon).
+    @param use_cache: Specifies if responses are read from and written to the cache.
+    '''
+    try:
+        return list(get_osm_elements(query_func(format_bbox(tile)), use_cache))
+    except FileNotFoundError:
+        return []
+
+
+def get_osm_elements_tiled(query_func, b_box, use_cache=True):
+    '''
+    Function to request data from the OpenStreetMap Server tile by tile. Tiles are requested simultaneously,
+    tiles which time out or exceed the memory of the server are split into quadrants and requested again.
+    Elements crossing tile edges are returned once, identified by their type and OSM id.
+    Returns the requested elements as an OSMElements set, see osm_runner_elements.
+    @param query_func: A function returning the query for a bounding box string.
+    @param b_box: Specifies the bounding box as string e.g. "(minLat,minLon,maxLat,maxLon)".
+    @param use_cache: Specifies if responses are read from and written to the cache.
+    '''
+    pending = [(tile, 0) for tile in get_bbox_tiles(parse_bbox(b_box), float(Tiling['maxTileArea']))]
+    loader = ElementLoader()
+    print('Requesting data from OpenStreetMap in '+str(len(pending))+' tiles . . .')
+    with ThreadPoolExecutor(max_workers=int(Tiling['maxWorkers'])) as executor:
+        while pending:
+            futures = {executor.submit(get_tile_elements, query_func, tile, use_cache): (tile, depth) for tile, depth in pending}
+            pending = []
+            for future in as_completed(futures):
+                tile, depth = futures[future]
+                try:
+                    for e in future.result():
+                        loader.add(e)
+                except TimeoutError:
+                    if depth >= int(Tiling['maxDepth']):
+                        raise
+                    print('Tile '+format_bbox(tile)+' too large for OSM server, splitting it into quadrants . . .')
+                    pending += [(quadrant, depth + 1) for quadrant in split_bbox(tile)]
+
+    elements = loader.finish()
+    if not elements:
+        raise FileNotFoundError('OSM Returned Zero Results for Bounding Box: {}'.format(b_box))
+
+    return elements
 
 
 def get_query(osm_el, b_box, o_tag, t1, t2, present_flag):
@@ -221,26 +746,168 @@ def get_query(osm_el, b_box, o_tag, t1, t2, present_flag):
             return ';'.join([
                 head,
                 ''.join([str(osm_el), f_clause, str(b_box)]),
-                Output
+                get_output([osm_el])
             ])
-            # E.G. [out:json];way["highway"~"primary|residential"](bounding_box);(._;>;);out geom qt;
+            # E.G. [out:json];way["highway"~"primary|residential"](bounding_box);out geom qt;
 
         else:
             f_clause = '["' + o_tag + '"]'
             return ';'.join([
                 head,
                 ''.join([str(osm_el), f_clause, str(b_box)]),
-                Output
+                get_output([osm_el])
             ])
-            # E.G. [out:json];way["highway"](bounding_box);(._;>;);out geom qt;
+            # E.G. [out:json];way["highway"](bounding_box);out geom qt;
 
     else:
         return ';'.join([
             head,
             ''.join([str(osm_el), str(b_box)]),
-            Output
+            get_output([osm_el])
         ])
-        # E.G. [out:json];way(bounding_box);(._;>;);out geom qt;
+        # E.G. [out:json];way(bounding_box);out geom qt;
+
+
+def get_output(osm_els):
+    '''
+    Function to construct the output statements of a query with the leanest output profile of each element type, see OutputProfiles.
+    If the query returns several element types, its result set is stored and every element type is output with its own profile.
+    Returns the output statements.
+    @param osm_els: The list of OpenStreetMap elements returned by the query. Valid values are "node", "way" or "relation"
+    '''
+    profiles = OutputProfiles['meta' if Output['meta'] == 'yes' else 'body']
+    osm_els = [osm_el for osm_el in ['node', 'way', 'relation'] if osm_el in [e.lower() for e in osm_els]]
+    if len(osm_els) == 1:
+        return profiles[osm_els[0]]
+    return '._->.result;' + ''.join([osm_el + '.result;' + profiles[osm_el] for osm_el in osm_els])
+    # E.G. ._->.result;way.result;out geom qt;relation.result;out body geom qt;
+
+
+def get_filter_clause(o_tag, filters):
+    '''
+    Function to construct the tag filter of a query statement.
+    Returns the filter clause.
+    @param o_tag: Specifies the OpenStreetMap tag / category element.
+    @param filters: Specifies the values of the OpenStreetMap tag, an empty list matches every value.
+    '''
+    o_tag = o_tag.lower()
+    if filters:
+        return '["' + o_tag + '"~"' + '|'.join([f.lower() for f in filters]) + '"]'
+    return '["' + o_tag + '"]'
+
+
+def get_union_query(clauses, b_box, t1, t2, present_flag):
+    '''
+    Function to construct a single union query for multiple element types and categories.
+    Returns the assembled query.
+    @param clauses: A list of tuples (osm_el, o_tag, filters), duplicate tuples are requested once.
+    @param b_box: Specifies the bounding box as string e.g. "(minLat,minLon,maxLat,maxLon)".
+    @param t1: Minimum timestamp of the returned OSM content.
+    @param t2: Maximum timestamp of the returned OSM content.
+    @param present_flag: Specifies if the time until or from now is used to define the minimum or maximum timestamp.
+    '''
+    head = get_query_head(Format, t1, t2, present_flag)
+    statements = []
+    for osm_el, o_tag, filters in clauses:
+        if osm_el.lower() not in ['node', 'way', 'relation']:
+            raise Exception('OSM Element {0} Does Not Match Configuration Options: node|way|relation'.format(osm_el))
+        statement = ''.join([str(osm_el), get_filter_clause(o_tag, filters), str(b_box), ';'])
+        if statement not in statements:
+            statements.append(statement)
+    return ';'.join([
+        head,
+        '(' + ''.join(statements) + ')',
+        get_output([osm_el for osm_el, o_tag, filters in clauses])
+    ])
+    # E.G. [out:json];(way["highway"~"primary"](bounding_box);relation["landuse"](bounding_box););
+    #      ._->.result;way.result;out geom qt;relation.result;out body geom qt;
+
+
+def get_delta_query(clauses, b_box, since):
+    '''
+    Function to construct a union query for the elements of multiple element types and categories, which changed since a timestamp.
+    Ways are also returned if one of their nodes moved or if they are members of a changed relation, relations if one of their member ways changed.
+    Returns the assembled query.
+    @param clauses: A list of tuples (osm_el, o_tag, filters), duplicate tuples are requested once.
+    @param b_box: Specifies the bounding box as string e.g. "(minLat,minLon,maxLat,maxLon)".
+    @param since: The timestamp of the last synchronization, e.g. "2018-06-01T00:00:00Z".
+    '''
+    newer = '(newer:"' + since + '")'
+    statements = []
+    relation_statements = []
+    for osm_el, o_tag, filters in clauses:
+        if osm_el.lower() not in ['node', 'way', 'relation']:
+            raise Exception('OSM Element {0} Does Not Match Configuration Options: node|way|relation'.format(osm_el))
+        f_clause = get_filter_clause(o_tag, filters)
+        if osm_el == 'relation':
+            statement = ''.join(['relation', f_clause, str(b_box), newer, ';relation(bw.changedways)', f_clause, ';'])
+            if statement not in relation_statements:
+                relation_statements.append(statement)
+            continue
+        if osm_el == 'node':
+            statement = 'node.changednodes' + f_clause + ';'
+        else:
+            statement = 'way.changedways' + f_clause + ';'
+            if any(clause[0] == 'relation' for clause in clauses):
+                # The member ways of changed relations are rebuilt, so ways no longer consumed by a relation are emitted again
+                statement += 'way(r.changedrelations)' + f_clause + ';'
+        if statement not in statements:
+            statements.append(statement)
+    sets = ['node' + str(b_box) + newer + '->.changednodes', '(way' + str(b_box) + newer + ';way(bn.changednodes);)->.changedways']
+    if relation_statements:
+        sets.append('(' + ''.join(relation_statements) + ')->.changedrelations')
+        statements.append('.changedrelations;')
+    return ';'.join([Format] + sets + [
+        '(' + ''.join(statements) + ')',
+        get_output([osm_el for osm_el, o_tag, filters in clauses])
+    ])
+    # E.G. [out:json];node(bounding_box)(newer:"2018-06-01T00:00:00Z")->.changednodes;(way(bounding_box)(newer:"...");way(bn.changednodes);)->.changedways;
+    #      (relation["building"](bounding_box)(newer:"...");relation(bw.changedways)["building"];)->.changedrelations;
+    #      (way.changedways["building"];way(r.changedrelations)["building"];.changedrelations;);._->.result;way.result;out geom qt;...
+
+
+def get_ids_query(clauses, b_box):
+    '''
+    Function to construct a union query for the ids and tags of the current elements of multiple element types and categories, without geometries.
+    The node references of the ways are returned as well, so closed and open ways are told apart like in the published layers.
+    Returns the assembled query.
+    @param clauses: A list of tuples (osm_el, o_tag, filters), duplicate tuples are requested once.
+    @param b_box: Specifies the bounding box as string e.g. "(minLat,minLon,maxLat,maxLon)".
+    '''
+    statements = []
+    for osm_el, o_tag, filters in clauses:
+        if osm_el.lower() not in ['node', 'way', 'relation']:
+            raise Exception('OSM Element {0} Does Not Match Configuration Options: node|way|relation'.format(osm_el))
+        statement = ''.join([str(osm_el), get_filter_clause(o_tag, filters), str(b_box), ';'])
+        if statement not in statements:
+            statements.append(statement)
+    return ';'.join([
+        Format,
+        '(' + ''.join(statements) + ')',
+        'out body qt;'
+    ])
+    # E.G. [out:json];(way["highway"](bounding_box););out body qt;
+
+
+def get_category_elements(elements, osm_el, o_tag, filters):
+    '''
+    Function to select the elements of a category from the result of a union query by element type and tag match.
+    Returns an OSMElements set with the matching elements.
+    @param elements: The OSMElements set as returned by the request_osm_query function.
+    @param osm_el: Specifies the OpenStreetMap element. Valid values are "node", "way" or "relation"
+    @param o_tag: Specifies the OpenStreetMap tag / category element.
+    @param filters: Specifies the values of the OpenStreetMap tag, an empty list matches every value.
+    '''
+    o_tag = o_tag.lower()
+    pattern = re.compile('|'.join([f.lower() for f in filters])) if filters else None
+    result = []
+    for e in elements.get_records(osm_el):
+        value = e.tags.get(o_tag)
+        if value is None:
+            continue
+        if pattern is None or pattern.search(value):
+            result.append(e)
+    return elements.select(osm_el, result)
 
 
 def get_query_head(f, t_1, t_2, p_flag):
@@ -282,439 +949,747 @@ def get_query_head(f, t_1, t_2, p_flag):
     return ''.join([f, d])
 
 
-def get_osm_elements(osm_query, retry_once, response=None):
+def get_osm_elements(osm_query, use_cache=True):
     '''
-    Function to request data from the OpenStreetMap Server.
+    Function to request data from the OpenStreetMap Server through the shared Overpass client.
+    The compressed response body is spooled to disk and parsed from a memory-mapped buffer, see spool_response.
     Returns the requested data or raises an exception after a few unsuccessful tries.
     @param osm_query: Specifies the OSM query as returned by the get_query function" 
-    @param retry_once: Specifies if a request to OSM has already been send. The value at first runtime should be 0.
-    @param response: Specifies the answer from the server, default is None. 
-                     Has no None value if a previous request to the server failed and the function is recalled internally only.
-    @param present_flag: Specifies if the time until or from now is used to define the minimum or maximum timestamp. 
-                         Only t1 or t2 and the present_flag are valid combinations. 
-                         Present_flag can be any positive value e.g. True, 1...
+    @param use_cache: Specifies if the response is read from and written to the cache.
     '''
 
-    osm_api = 'https://lz4.overpass-api.de/api/interpreter'
+    stream = Streaming['isEnabled'] == 'yes'
 
-    if retry_once == 0:
+    if stream and use_cache:
+        cached = open_cached_response(osm_query)
+        if cached is not None:
+            return iter_osm_elements(cached, osm_query, False)
+    elif use_cache:
+        cached = read_cached_response(osm_query)
+        if cached is not None:
+            return cached['elements']
 
-        r = requests.get(osm_api, data=osm_query)
-    
-    elif retry_once == 1:
-        r = requests.get(osm_api, data=osm_query) 
+    r = get_client().request(osm_query, True)
 
     if r.status_code == 200:
 
-        if len(r.json()['elements']) == 0:
+        spool, compressed = spool_response(r, osm_query)
 
-            try:
-                raise FileNotFoundError('OSM Returned Zero Results with Remark: {}'.format(r.json()['remark']))
+        if stream:
+            return iter_osm_elements(open_spool_body(spool, compressed), osm_query, use_cache, spool, compressed)
 
-            except KeyError:
-                raise FileNotFoundError('OSM Returned Zero Results for Query: {}'.format(osm_query))
+        try:
+            data = json.loads(open_spool_body(spool, compressed).read().decode('utf-8'))
 
-        else:
-            result = r.json()['elements']
-            return result
+            if 'runtime error' in data.get('remark', ''):
+                raise TimeoutError('OSM Returned Remark: {}'.format(data['remark']))
+
+            if len(data['elements']) == 0:
+
+                try:
+                    raise FileNotFoundError('OSM Returned Zero Results with Remark: {}'.format(data['remark']))
+
+                except KeyError:
+                    raise FileNotFoundError('OSM Returned Zero Results for Query: {}'.format(osm_query))
+
+            else:
+                result = data['elements']
+                if use_cache:
+                    write_cached_response(osm_query, open_spool_body(spool, compressed, True), compressed)
+                return result
+
+        finally:
+            spool.close()
+
+    if r.status_code == 504:
+        raise TimeoutError('OSM Returned Status Code: {0}'.format(r.status_code))
 
     if r.status_code == 429:
-        print("OSM Request Limit Reached. We are waiting 60 seconds and retry afterwards...")
-        time.sleep(60)
-        get_osm_elements(osm_query, 1)
+        raise ConnectionRefusedError('OSM Request Limit Reached. Please Try Again in a Few Minutes . . .')
+
+    raise RuntimeError('OSM Returned Status Code: {0}'.format(r.status_code))
 
-    if r.status_code == 429 and retry_once == 1:
-            get_osm_elements(osm_query, 2, r)       
+
+def spool_response(r, osm_query):
+    '''
+    Function to write the body of a streamed response in chunks to a spool file, a gzip compressed body is written without decoding it.
+    The spool file is a temporary file or, if "keepSpool" is enabled, a file in the "spoolDirectory" next to a file with the query,
+    which can be read again with the read_spooled_elements function.
+    Returns a tuple with the memory-mapped spool file and a boolean value, which is True if the spool is gzip compressed.
+    @param r: A response requested with stream=True.
+    @param osm_query: Specifies the OSM query as returned by the get_query function.
+    '''
+    encoding = r.headers.get('Content-Encoding', '').lower()
+    compressed = encoding == 'gzip'
+    directory = Streaming['spoolDirectory'] or None
+    if Streaming['keepSpool'] == 'yes':
+        os.makedirs(directory or '.', exist_ok=True)
+        name = os.path.join(directory or '.', dt.now().strftime('%Y%m%d-%H%M%S-%f') + '_' + get_cache_key(osm_query)[:16])
+        with open(name + '.overpassql', 'w', encoding='utf-8') as q:
+            q.write(osm_query)
+        f = open(name + ('.json.gz' if compressed else '.json'), 'w+b')
     else:
-            result = r.json()['elements']
-            return result
-    
-    if response.status_code == 429 and retry_once == 2:
-        raise ConnectionRefusedError('OSM Request Limit Reached. Please Try Again in a Few Minutes . . .')
+        f = tempfile.TemporaryFile(dir=directory)
+    try:
+        # Other encodings than gzip are decoded while spooling
+        for chunk in r.raw.stream(Streaming['chunkSize'], decode_content=encoding not in ['', 'identity', 'gzip']):
+            f.write(chunk)
+        f.flush()
+        return map_spool(f), compressed
+    finally:
+        r.close()
+        f.close()
+
+
+def map_spool(f):
+    '''
+    Function to map a spool file into memory, the mapping stays valid after the file is closed.
+    Returns the read-only memory map or an empty buffer, if the file is empty.
+    @param f: A binary file object of the spool file.
+    '''
+    f.seek(0, io.SEEK_END)
+    if f.tell() == 0:
+        return io.BytesIO(b'')
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def open_spool_body(spool, compressed, raw=False):
+    '''
+    Function to read the response body from the start of a memory-mapped spool file.
+    Returns a binary file object of the decoded body or of the spool itself.
+    @param spool: The memory-mapped spool file, see map_spool.
+    @param compressed: Specifies if the spool is gzip compressed.
+    @param raw: Specifies if the spool is read without decoding it.
+    '''
+    spool.seek(0)
+    if compressed and not raw:
+        return gzip.GzipFile(fileobj=spool, mode='rb')
+    return spool
+
+
+def read_spooled_elements(path):
+    '''
+    Function to read the elements of a kept spool file again without requesting the OSM server, e.g. to debug the construction of a layer:
+    build_osm_layer("polygon", elements, [], elements)
+    Returns an OSMElements set, see osm_runner_elements.
+    @param path: The path of a spool file written with "keepSpool" enabled, ending with ".json" or ".json.gz".
+    '''
+    compressed = path.endswith('.gz')
+    with open(path, 'rb') as f:
+        spool = map_spool(f)
+    return load_elements(iter_osm_elements(open_spool_body(spool, compressed), path, False, spool, compressed))
+
+
+def iter_osm_elements(f, osm_query, cache_response, spool=None, compressed=False):
+    '''
+    Generator to decode the elements of a spooled response one by one with the event-based parser ijson.
+    If ijson is not installed, the response is decoded at once. Raises the same exceptions as get_osm_elements,
+    after the last element has been returned. The file and the spool are closed, when the generator is exhausted.
+    Yields the elements of the response.
+    @param f: A binary file object containing the response body.
+    @param osm_query: Specifies the OSM query as returned by the get_query function.
+    @param cache_response: Specifies if the response is stored in the cache, after it has been decoded successfully.
+    @param spool: The optional memory-mapped spool file, which f is reading, see spool_response.
+    @param compressed: Specifies if the spool is gzip compressed.
+    '''
+    count = 0
+    remark = ''
+    try:
+        if ijson is not None:
+            builder = None
+            for prefix, event, value in ijson.parse(f, use_float=True):
+                if builder is not None:
+                    builder.event(event, value)
+                    if prefix == 'elements.item' and event == 'end_map':
+                        count += 1
+                        yield builder.value
+                        builder = None
+                elif prefix == 'elements.item' and event == 'start_map':
+                    builder = ijson.ObjectBuilder()
+                    builder.event(event, value)
+                elif prefix == 'remark' and event == 'string':
+                    remark = value
+        else:
+            data = json.loads(f.read().decode('utf-8'))
+            remark = data.get('remark', '')
+            for e in data['elements']:
+                count += 1
+                yield e
+
+        if 'runtime error' in remark:
+            raise TimeoutError('OSM Returned Remark: {}'.format(remark))
+
+        if count == 0:
+            if remark:
+                raise FileNotFoundError('OSM Returned Zero Results with Remark: {}'.format(remark))
+            raise FileNotFoundError('OSM Returned Zero Results for Query: {}'.format(osm_query))
+
+        if cache_response:
+            if spool is not None:
+                write_cached_response(osm_query, open_spool_body(spool, compressed, True), compressed)
+            else:
+                f.seek(0)
+                write_cached_response(osm_query, f)
+
+    finally:
+        f.close()
+        if spool is not None:
+            spool.close()
+
+
+def iter_with_pbar(elements):
+    '''
+    Generator to iterate over elements and to update a progressbar, if the number of elements is known.
+    Yields the elements.
+    @param elements: A list or an iterator of elements.
+    '''
+    if not hasattr(elements, '__len__'):
+        yield from elements
+        return
+    p=0
+    pbar = createpbar(len(elements))
+    for e in elements:
+        p = updatepbar(p, pbar)
+        yield e
+
+
+def build_tag_columns(tag_matrix, n_rows):
+    '''
+    Function to convert a sparse tag matrix into dense categorical tag columns, missing values are filled with empty strings.
+    Every distinct value is stored once per column and the rows only keep its integer code.
+    Returns a dictionary with a pandas Categorical per tag.
+    @param tag_matrix: A dictionary with a tuple (row indices, values) per tag.
+    @param n_rows: The number of rows of the columns.
+    '''
+    columns = {}
+    for tag, (rows, values) in tag_matrix.items():
+        value_codes, categories = pd.factorize(pd.Series(values, dtype=object))
+        categories = list(categories)
+        if '' not in categories:
+            categories.append('')
+        codes = np.full(n_rows, categories.index(''), dtype=value_codes.dtype)
+        codes[np.frombuffer(rows, dtype=np.int64)] = value_codes
+        columns[tag] = pd.Categorical.from_codes(codes, pd.Index(categories, dtype=object))
+    return columns
+
+
+def tags_to_matrix(tag_list, excludedattributes):
+    '''
+    Function to collect the tags of elements in a sparse tag matrix. Repeated values like "platform" are interned,
+    so all rows share one string object per distinct value.
+    Returns a dictionary with a tuple (row indices, values) per tag.
+    @param tag_list: A list with the tag dictionary of every element.
+    @param excludedattributes: The attributes exluded in the configuration file osmconfig.json
+    '''
+    excluded = set(excludedattributes) | {'osm_id', 'osm_type', 'timestamp'}
+    tag_matrix = {}
+    interned = {}
+    for row, tags in enumerate(tag_list):
+        for tag, value in tags.items():
+            if tag not in excluded:
+                entry = tag_matrix.get(tag)
+                if entry is None:
+                    entry = tag_matrix[tag] = (array('q'), [])
+                entry[0].append(row)
+                entry[1].append(interned.setdefault(value, value))
+    return tag_matrix
+
+
+def pack_overflow_tags(tag_matrix, tag_layout):
+    '''
+    Function to limit the tag fields of a layer. The tags of the "allowList" or, if the list is empty, the "maxFields" most frequent tags
+    are kept as fields, all other tags of an element are packed into the single text field "overflowField" in the "overflowFormat"
+    "json" e.g. {"name":"A","ref":"1"} or "hstore" e.g. "name"=>"A","ref"=>"1". Without a layout or allowList and maxFields 0 all tags are kept.
+    Returns a sparse tag matrix with the kept tags and the overflow field.
+    @param tag_matrix: A dictionary with a tuple (row indices, values) per tag.
+    @param tag_layout: A dictionary with the items "maxFields", "allowList", "overflowField" and "overflowFormat".
+    '''
+    if not tag_layout:
+        return tag_matrix
 
+    if tag_layout.get('allowList'):
+        kept = [tag for tag in tag_layout['allowList'] if tag in tag_matrix]
+    elif int(tag_layout.get('maxFields', 0)) > 0:
+        kept = sorted(tag_matrix, key=lambda tag: len(tag_matrix[tag][0]), reverse=True)[:int(tag_layout['maxFields'])]
     else:
-        raise RuntimeError('OSM Returned Status Code: {0}'.format(r.status_code))
+        return tag_matrix
+
+    packed = {tag: tag_matrix[tag] for tag in kept}
+    overflow_field = tag_layout.get('overflowField', 'other_tags')
+    overflow_rows = {}
+    for tag, (rows, values) in tag_matrix.items():
+        if tag in packed:
+            continue
+        for row, value in zip(rows, values):
+            entry = overflow_rows.get(row)
+            if entry is None:
+                entry = overflow_rows[row] = {}
+            entry[tag] = value
+
+    if overflow_rows:
+        rows = sorted(overflow_rows)
+        if tag_layout.get('overflowFormat', 'json') == 'hstore':
+            escape = lambda text: '"' + text.replace('\\', '\\\\').replace('"', '\\"') + '"'
+            values = [','.join(escape(k) + '=>' + escape(v) for k, v in overflow_rows[row].items()) for row in rows]
+        else:
+            values = [json.dumps(overflow_rows[row], ensure_ascii=False, separators=(',', ':')) for row in rows]
+        packed[overflow_field] = (array('q', rows), values)
+    return packed
 
 
-def build_node_sdf(n_list, excludedattributes):
+def get_overflow_fields(tag_layout):
     '''
-    Function to convert returned OSM point data to Esri SpatialDataFrame.
-    Returns an ESRI SpatialDataFrame.
-    @param n_list: The list of nodes as returned by th get_osm_elements function 
+    Function to get the name of the overflow field of a tag layout, which is never pruned.
+    Returns a list with the name or an empty list, if the tags are not packed.
+    @param tag_layout: A dictionary with the layout of the tag fields, see pack_overflow_tags.
+    '''
+    if tag_layout and (tag_layout.get('allowList') or int(tag_layout.get('maxFields', 0)) > 0):
+        return [tag_layout.get('overflowField', 'other_tags')]
+    return []
+
+
+def report_pruned_fields(pruned, total, min_density):
+    '''
+    Function to print the tag fields dropped by the density pruning.
+    @param pruned: A list of tuples (field name, density).
+    @param total: The number of tag fields before the pruning.
+    @param min_density: The minimum share of filled values of a field.
+    '''
+    if pruned:
+        print('Pruned '+str(len(pruned))+' of '+str(total)+' tag fields filled in less than '+format(min_density, '.2%')+' of the features: '
+              + ', '.join(name+' ('+format(density, '.2%')+')' for name, density in pruned))
+
+
+def prune_sparse_tags(tag_matrix, n_rows, field_pruning, exempt=()):
+    '''
+    Function to drop the tags, which are filled in less than "minDensity" of the elements. The fill ratios of all tags
+    are the lengths of their row indices in the sparse tag matrix, so no column is scanned.
+    Returns the sparse tag matrix without the pruned tags.
+    @param tag_matrix: A dictionary with a tuple (row indices, values) per tag.
+    @param n_rows: The number of elements.
+    @param field_pruning: A dictionary with the items "isEnabled" and "minDensity".
+    @param exempt: The tags, which are never pruned.
+    '''
+    if not field_pruning or field_pruning['isEnabled'] != 'yes' or n_rows == 0:
+        return tag_matrix
+
+    min_density = float(field_pruning['minDensity'])
+    tags = [tag for tag in tag_matrix if tag not in exempt]
+    densities = np.fromiter((len(tag_matrix[tag][0]) for tag in tags), dtype=np.int64, count=len(tags)) / n_rows
+    pruned = [(tag, density) for tag, density in zip(tags, densities.tolist()) if density < min_density]
+    report_pruned_fields(pruned, len(tag_matrix), min_density)
+    pruned_tags = {tag for tag, density in pruned}
+    return {tag: column for tag, column in tag_matrix.items() if tag not in pruned_tags}
+
+
+def parse_timestamps(timestamps):
+    '''
+    Function to parse OSM timestamps in a single vectorized pass, missing timestamps are returned as NaT.
+    Returns a pandas Series of datetimes.
+    @param timestamps: A list of timestamp strings e.g. "2018-01-01T12:00:00Z".
+    '''
+    return pd.to_datetime(pd.Series(timestamps, dtype=object), format='%Y-%m-%dT%H:%M:%SZ', errors='coerce')
+
+
+def get_process_pool():
+    '''
+    Function to get the shared process pool for the geometry construction, the pool is created on first use.
+    Returns the ProcessPoolExecutor.
+    '''
+    global process_pool
+    with process_pool_lock:
+        if process_pool is None:
+            process_pool = ProcessPoolExecutor(max_workers=int(ProcessPool['maxWorkers']))
+        return process_pool
+
+
+def map_batches(func, elements, *args):
+    '''
+    Function to apply a batch function to the elements. If the process pool is enabled, the elements are split into batches
+    of "batchSize" elements, which are processed by worker processes. The results are concatenated in order.
+    Returns a dictionary of result lists.
+    @param func: A top-level function, taking a list of elements and the additional arguments, returning a dictionary of lists.
+    @param elements: A list or an iterator of elements.
+    @param args: Additional arguments of the batch function.
+    '''
+    if ProcessPool['isEnabled'] != 'yes':
+        return func(list(elements), *args)
+
+    pool = get_process_pool()
+    elements = iter(elements)
+    batchsize = int(ProcessPool['batchSize'])
+    futures = deque()
+    result = None
+    while True:
+        # A bounded number of batches is submitted at once, to keep the memory of streamed responses bounded
+        while len(futures) < 2 * int(ProcessPool['maxWorkers']):
+            batch = list(islice(elements, batchsize))
+            if not batch:
+                break
+            futures.append(pool.submit(func, batch, *args))
+        if not futures:
+            break
+        columns = futures.popleft().result()
+        if result is None:
+            result = columns
+        else:
+            for key in result:
+                result[key] += columns[key]
+    return result if result is not None else func([], *args)
+
+
+def build_node_columns(n_list, excludedattributes):
+    '''
+    Function to convert returned OSM point data to columns.
+    Coordinates, ids and timestamps are collected in columnar arrays and the tags in a sparse tag matrix with interned values,
+    see tags_to_matrix, the point geometries are created from the packed coordinates afterwards.
+    Returns a dictionary of columns, see pack_element_columns.
+    @param n_list: The list of OSMNode records.
     @param excludedattributes: The attributes exluded in the configuration file osmconfig.json
     '''
 
-    # Dictionary For Geometries & IDs
-    geo_dict = {"geo": []}
-    val_dict = {'osm_id': [], 'timestamp': []}
+    # Columnar Arrays For Coordinates, IDs & Timestamps
+    lons = array('d')
+    lats = array('d')
+    ids = array('q')
+    timestamps = []
+    tag_list = []
 
-    # Dictionary For Incoming Tags
-    for n in n_list:
-        n_tags = n['tags'].keys()
-        for tag in n_tags:
-            if tag not in val_dict.keys() and tag not in excludedattributes:
-                tagname = tag
-                val_dict[tagname] = []
-    
     print('Constructing points...')                
-    p=0
-    pbar = createpbar(len(n_list))
-    # Build Lists
-    for n in n_list:
+    for n in iter_with_pbar(n_list):
         try:
-            p = updatepbar(p, pbar)
-            # Populate Tags
-            for tag in [key for key in val_dict.keys() if key not in ['osm_id','timestamp'] and key not in excludedattributes]:
-                val_dict[tag].append(n['tags'].get(str(tag),''))
-
-            # Populate Geometries & IDs
-            point = Point({
-                "x": n['lon'],
-                "y": n['lat'],
-                "spatialReference": {"wkid": 4326}
-            })
-            geo_dict['geo'].append(point)
-            val_dict['osm_id'].append(str(n['id']))
-            val_dict['timestamp'].append(dt.strptime(n['timestamp'],'%Y-%m-%dT%H:%M:%SZ'))
+            lon = float(n.lon)
+            lat = float(n.lat)
+            ids.append(n.id)
+            lons.append(lon)
+            lats.append(lat)
+            timestamps.append(n.timestamp)
+            tag_list.append(n.tags)
 
         except Exception as ex:
-            print('Node ID {0} Raised Exception: {1}'.format(n['id'], str(ex)))
+            print('Node ID {0} Raised Exception: {1}'.format(n.id, str(ex)))
 
-    try:
-        val_dict = {k: v for k, v in val_dict.items() if v is not None}
-        return SpatialDataFrame(val_dict, geometry=geo_dict['geo'])
+    # Populate Sparse Tag Matrix With Interned Values
+    tag_matrix = tags_to_matrix(tag_list, excludedattributes)
 
-    except TypeError:
-        raise Exception('Ensure ArcPy is Included in Python Interpreter')
+    # Materialize Points From Packed Coordinates
+    geometry = [{"x": x, "y": y} for x, y in zip(lons, lats)]
+
+    return {'osm_id': np.frombuffer(ids, dtype=np.int64),
+            'osm_type': ['node'] * len(ids),
+            'timestamp': timestamps,
+            'tags': tag_matrix,
+            'geometry': geometry}
 
 
-def build_ways_sdf_topoly(o_response, excludedattributes, o_r_response=None):
+def build_relation_columns(relations, excludedattributes):
     '''
-    Function to convert returned OSM polygon data to Esri SpatialDataFrame.
-    Returns an ESRI SpatialDataFrame.
-    @param o_response: The valid response data from the OSM server containing the way elements
+    Batch function to assemble the rings of multipolygon relations, executed in a worker process if the process pool is enabled.
+    Returns a dictionary with the lists "osm_id", "osm_type", "timestamp", "tags" and "rings", every item of "rings" is a list of packed rings.
+    @param relations: A list of tuples with an OSMRelation record and the list of its way members as tuples (role, coordinates),
+                      the coordinates are None if the geometry of the way was not returned.
     @param excludedattributes: The attributes exluded in the configuration file osmconfig.json
-    @param o_r_response: The optional valid response data from the OSM server containing the relation elements
-    '''
-    # Extract relevant relations and way elements from OSM response
-    if o_r_response:
-        relations = [e for e in o_r_response if e['type'] == 'relation']
-    ways = [e for e in o_response if e['type'] == 'way' and e['nodes'][0] == e['nodes'][-1]]
-
-    # Dictionary for geometries & IDs
-    geo_dict_r = {'geo': []}
-    val_dict_r = {'osm_id': [], 'timestamp': []}
-    geo_dict_w = {'geo': []}    
-    val_dict_w = {'osm_id': [], 'timestamp': []}
-    invalid_rel_idx_list = []
-    for r in range(len(relations)):
-        nodesinrel = []
-        nodesinrel = [relations[r]['members'].index(item) for item in filter(lambda n: n.get('type') == 'node', lget(relations,r)['members'])]
-        if len(nodesinrel) > 0:
-            invalid_rel_idx_list.append(r)
-    
-    relations = [lget(relations,r) for r in range(len(relations)) if r not in invalid_rel_idx_list]
-
-    # Dictionary for incoming relation tags
-    for r in relations:
-        r_tags = r['tags'].keys()
-        for tag in r_tags:
-            if tag not in val_dict_r.keys() and tag not in excludedattributes:
-                tagname = tag
-                val_dict_r[tagname] = []
-    
-    valid_list = []
-    # Build Lists
-    print('Constructing complex polygons...')
-    p=0
-    pbar = createpbar(len(relations))
-    for r in relations:
+    '''
+    excluded = set(excludedattributes)
+    columns = {'osm_id': [], 'osm_type': [], 'timestamp': [], 'tags': [], 'rings': []}
+    for r, members in relations:
         try:
-            p = updatepbar(p, pbar)
-            relation = r["members"]
-            relation = sorted(relation, key=lambda item: item['role'])
-            outerlist = [memb for memb in relation if memb['role'] == 'outer']
-            innerlist = [memb for memb in relation if memb['role'] == 'inner']
-            innerlistgeomtuple = []
-            outerlistgeomtuple = []
-            innerlistgeomtuple2 = []
-            outerlistgeomtuple2 = []
-            rngitn_i = False
-            rngitn_o = False
-            
-            innerlistgeomtuple = [[(x['lon'],x['lat']) for x in ol['geometry']] for ol in innerlist]
-            if len(innerlistgeomtuple) > 1:
-                all_rings_connected_i = checkrings_connected(innerlistgeomtuple,r)
-                if all_rings_connected_i and innerlistgeomtuple:
-                    for ring in innerlistgeomtuple:
-                        innerlistgeomtuple2+=ring
-                    innerlistgeomtuple = []
-                    innerlistgeomtuple.append(l_ordered_remove_duplicates(innerlistgeomtuple2))
-                    innerlistgeomtuple2 = innerlistgeomtuple
-                    innerlistgeomtuple = []
-            all_rings_closed_i = checkrings_closed(innerlistgeomtuple, r)
-            if all_rings_closed_i and innerlistgeomtuple:
-                for ring in innerlistgeomtuple:
-                    innerlistgeomtuple2.append(ring)
-                    innerlistgeomtuple = []
-            innerlistgeomtuple3 = []
-            if innerlistgeomtuple2:
-                all_rings_connected_i = checkrings_connected(innerlistgeomtuple2, r)
-            if not innerlistgeomtuple2:
-                all_rings_connected_i = checkrings_connected(innerlistgeomtuple, r)
-            if innerlistgeomtuple and not all_rings_connected_i:
-                innerlistgeomtuple2 = innerlistgeomtuple                                     
-                innerlistgeomtuple3.append(innerlistgeomtuple2[0])
-                startgeom = innerlistgeomtuple2[0][0]
-                for ridx in range(0,len(innerlistgeomtuple2)):
-                    next_ring = innerlistgeomtuple3[-1][-1]
-                    if next_ring == startgeom and ridx < len(innerlistgeomtuple2)-1:
-                        next_ring = innerlistgeomtuple2[len(innerlistgeomtuple3)][-1]
-                        startgeom = next_ring
-                    idx_next_ring = lfindgetsingleidx(innerlistgeomtuple2, next_ring, ridx)                            
-                    try:
-                        if innerlistgeomtuple2[idx_next_ring[0]] not in innerlistgeomtuple3:
-                            if innerlistgeomtuple2[idx_next_ring[0]][-1] == innerlistgeomtuple3[-1][-1]:
-                                innerlistgeomtuple2[idx_next_ring[0]].reverse()
-                            innerlistgeomtuple3.append(innerlistgeomtuple2[idx_next_ring[0]])    
-                        rngitn_i = True      
-                    except:
-                        continue
-            if rngitn_i:
-                innerlistgeomtuple4 = []
-                innerlistgeomtuple4 = merge_sublist_items(innerlistgeomtuple3)
-                rings = detect_rings(innerlistgeomtuple4)
-                if len(rings) > 1:
-                    rings = [l_ordered_remove_duplicates(rng) for rng in rings]
-                    all_rings_closed_i = checkrings_closed(rings,r)
-                else:
-                    innerlistgeomtuple3 = l_ordered_remove_duplicates(innerlistgeomtuple4)
-                    all_rings_closed_i = checkrings_closed([innerlistgeomtuple3],r)
-            if innerlistgeomtuple and rngitn_i and all_rings_closed_i:
-                innerlistgeomtuple2 = []
-                all_rings_connected_i = True
-                if len(rings) < 2:
-                    innerlistgeomtuple2.append([])
-                    innerlistgeomtuple2[0] = innerlistgeomtuple3
-                else:
-                    innerlistgeomtuple2 = rings
-           
-            outerlistgeomtuple = [[(x['lon'],x['lat']) for x in ol['geometry']] for ol in outerlist]
-            if len(outerlistgeomtuple) > 1:
-                all_rings_connected_o = checkrings_connected(outerlistgeomtuple, r)
-                if all_rings_connected_o:
-                    for ring in outerlistgeomtuple:
-                        outerlistgeomtuple2+=ring
-                    outerlistgeomtuple = []
-                    outerlistgeomtuple.append(l_ordered_remove_duplicates(outerlistgeomtuple2))
-                    outerlistgeomtuple2 = outerlistgeomtuple
-                    outerlistgeomtuple = []
-            all_rings_closed_o = checkrings_closed(outerlistgeomtuple, r)
-            if all_rings_closed_o:
-                for ring in outerlistgeomtuple:
-                    outerlistgeomtuple2.append(ring)
-                    outerlistgeomtuple = []
-            outerlistgeomtuple3 = []
-            if outerlistgeomtuple2:
-                all_rings_connected_o = checkrings_connected(outerlistgeomtuple2, r)
-            if not outerlistgeomtuple2:
-                all_rings_connected_o = checkrings_connected(outerlistgeomtuple, r)
-            if not all_rings_connected_o:
-                outerlistgeomtuple2 = outerlistgeomtuple
-                outerlistgeomtuple3.append(outerlistgeomtuple2[0])
-                startgeom = outerlistgeomtuple2[0][0]
-                for ridx in range(0,len(outerlistgeomtuple2)):
-                    next_ring = outerlistgeomtuple3[-1][-1]
-                    if next_ring == startgeom and ridx < len(outerlistgeomtuple2)-1:
-                        next_ring = outerlistgeomtuple2[len(outerlistgeomtuple3)][-1]
-                        startgeom = next_ring
-                    idx_next_ring = lfindgetsingleidx(outerlistgeomtuple2, next_ring, ridx)
-                    try:
-                        if outerlistgeomtuple2[idx_next_ring[0]] not in outerlistgeomtuple3:
-                            if outerlistgeomtuple2[idx_next_ring[0]][-1] == outerlistgeomtuple3[-1][-1]:
-                                outerlistgeomtuple2[idx_next_ring[0]].reverse()
-                            outerlistgeomtuple3.append(outerlistgeomtuple2[idx_next_ring[0]])    
-                        rngitn_o = True                     
-                    except:
-                        continue
-            if rngitn_o:
-                outerlistgeomtuple4 = []
-                outerlistgeomtuple4 = merge_sublist_items(outerlistgeomtuple3)
-                rings = detect_rings(outerlistgeomtuple4)
-                if len(rings) > 1:
-                    rings = [l_ordered_remove_duplicates(rng) for rng in rings]
-                    all_rings_closed_o = checkrings_closed(rings,r)
-                else:
-                    outerlistgeomtuple3 = outerlistgeomtuple4
-                    outerlistgeomtuple3 = l_ordered_remove_duplicates(outerlistgeomtuple4)
-                    all_rings_closed_o = checkrings_closed([outerlistgeomtuple3],r)
-                if outerlistgeomtuple and rngitn_o and all_rings_closed_o:
-                    outerlistgeomtuple2 = []
-                    all_rings_connected_o = True
-                if len(rings) < 2:
-                    outerlistgeomtuple2.append([])
-                    outerlistgeomtuple2[0] = outerlistgeomtuple3
-                else:
-                    outerlistgeomtuple2 = rings                   
-            
-            if innerlistgeomtuple or innerlistgeomtuple2:
-                innerlistgeomtuple = innerlistgeomtuple2
-            if outerlistgeomtuple2:
-                outerlistgeomtuple = outerlistgeomtuple2   
-            
-            l_polygon_rings = []    
-            for subelement in range(len(outerlistgeomtuple)):
-                ncoordsouter = [(n[0],n[1]) for n in outerlistgeomtuple[subelement]]
-                temppolyarea = Polygon({"rings": [ncoordsouter], "spatialReference": {"wkid": 4326}}).area
-                if temppolyarea < 0.0:
-                    ncoordsouter.reverse()
-                if ncoordsouter:
-                    l_polygon_rings.append(ncoordsouter)           
-            
-            for subelement in range(len(innerlistgeomtuple)):
-                if innerlistgeomtuple[subelement]:
-                    ncoordsinner = [(n[0],n[1]) for n in innerlistgeomtuple[subelement]]
-                    temppolyarea = Polygon({"rings": [ncoordsinner], "spatialReference": {"wkid": 4326}}).area
-                    if temppolyarea > 0.0:
-                        ncoordsinner.reverse()
-                    if ncoordsinner:
-                        l_polygon_rings.append(ncoordsinner)     
-
-            poly = Polygon({"rings": l_polygon_rings, "spatialReference": {"wkid": 4326}})
-            valid_list.append([poly.is_valid,r['id']])
-
-            if poly.is_valid:
-                geo_dict_r['geo'].append(poly)
-                val_dict_r['osm_id'].append(str(r['id']))
-                val_dict_r['timestamp'].append(dt.strptime(r['timestamp'],'%Y-%m-%dT%H:%M:%SZ'))
-
-            # Populate Relation tags
-            for tag in [key for key in val_dict_r.keys() if key not in ['osm_id','timestamp'] and key not in excludedattributes]:
-                val_dict_r[tag].append(r['tags'].get(str(tag),''))
+            # Assemble closed and oriented rings from the member ways, an empty role is treated as outer role
+            outerpaths = [list(map(tuple, coords.tolist())) for role, coords in members if role in ['outer', ''] and coords is not None and len(coords)]
+            innerpaths = [list(map(tuple, coords.tolist())) for role, coords in members if role == 'inner' and coords is not None and len(coords)]
+            outerrings, innerrings = assemble_multipolygon(outerpaths, innerpaths)
+
+            # Only relations with at least one valid outer ring are kept
+            if outerrings:
+                columns['osm_id'].append(r.id)
+                columns['osm_type'].append(r.type)
+                columns['timestamp'].append(r.timestamp)
+                columns['tags'].append({k: v for k, v in r.tags.items() if k not in excluded})
+                columns['rings'].append(outerrings + innerrings)
 
         except Exception as ex:
             tb = traceback.format_exc()
-            print('Relation ID {0} Raised Exception: {1}'.format(r['id'], str(tb)))
-
-    # Dictionary For Incoming Way Tags
-    for w in ways:
-        w_tags = w['tags'].keys()
-        for tag in w_tags:
-            if tag not in val_dict_w.keys() and tag not in excludedattributes:
-                tagname = tag
-                val_dict_w[tagname] = []
-    
-    print('Constructing simple polygons...')
-    p=0
-    pbar = createpbar(len(ways))
-    # Build Lists
-    for w in ways:
-        try:
-            p = updatepbar(p, pbar)
-            # Populate Tags
-            for tag in [key for key in val_dict_w.keys() if key not in ['osm_id','timestamp'] and key not in excludedattributes]:
-                val_dict_w[tag].append(w['tags'].get(str(tag),''))
-            # Populate Geometries & IDs
-            coords = [[e['lon'], e['lat']] for e in w.get('geometry')]
-            poly = Polygon({"rings":  [coords], "spatialReference": {"wkid": 4326}})
-            geo_dict_w['geo'].append(poly)
-            val_dict_w['osm_id'].append(str(w['id']))
-            val_dict_w['timestamp'].append(dt.strptime(w['timestamp'],'%Y-%m-%dT%H:%M:%SZ'))
+            print('Relation ID {0} Raised Exception: {1}'.format(r.id, str(tb)))
+    return columns
+
 
+def build_way_columns(ways, excludedattributes, closed):
+    '''
+    Batch function to pack the coordinates of ways, executed in a worker process if the process pool is enabled.
+    Closed ways are oriented clockwise as outer rings of polygons.
+    Returns a dictionary with the lists "osm_id", "osm_type", "timestamp", "tags" and "paths", every item of "paths" is a packed path.
+    @param ways: A list of tuples with an OSMWay record and its coordinates, a float64 array of shape (n, 2).
+    @param excludedattributes: The attributes exluded in the configuration file osmconfig.json
+    @param closed: Specifies if the ways are polygon rings.
+    '''
+    excluded = set(excludedattributes)
+    columns = {'osm_id': [], 'osm_type': [], 'timestamp': [], 'tags': [], 'paths': []}
+    for w, coords in ways:
+        try:
+            if len(coords) == 0:
+                raise ValueError('Way Has No Geometry')
+            if closed:
+                coords = orient_ring(coords, True)
+            columns['osm_id'].append(w.id)
+            columns['osm_type'].append(w.type)
+            columns['timestamp'].append(w.timestamp)
+            columns['tags'].append({k: v for k, v in w.tags.items() if k not in excluded})
+            columns['paths'].append(coords)
 
         except Exception as ex:
-            print('Way ID {0} Raised Exception: {1}'.format(w['id'], str(ex)))
+            print('Way ID {0} Raised Exception: {1}'.format(w.id, str(ex)))
+    return columns
 
-    try:
-        val_dict = merge_dict_lists(val_dict_r, val_dict_w)
-        val_dict = {k: v for k, v in val_dict.items() if v is not None}
-        geo_dict = geo_dict_r['geo']+geo_dict_w['geo']
-        len(valid_list)
-        return SpatialDataFrame(val_dict, geometry=geo_dict)
 
-    except TypeError:
-        raise Exception('Ensure ArcPy is Included in Python Interpreter')    
+def pack_element_columns(columns, geometry, excludedattributes):
+    '''
+    Function to combine the columnar results of the batch functions with their geometries.
+    Returns a dictionary with the int64 array "osm_id", the list of element types "osm_type", the list of timestamp strings "timestamp",
+    the sparse tag matrix "tags" and the list of Esri JSON geometries "geometry", all in the same row order.
+    @param columns: A dictionary with the lists "osm_id", "osm_type", "timestamp" and "tags".
+    @param geometry: The list of Esri JSON geometries in the order of the columns.
+    @param excludedattributes: The attributes exluded in the configuration file osmconfig.json
+    '''
+    return {'osm_id': np.asarray(columns['osm_id'], dtype=np.int64),
+            'osm_type': columns['osm_type'],
+            'timestamp': columns['timestamp'],
+            'tags': tags_to_matrix(columns['tags'], excludedattributes),
+            'geometry': geometry}
 
-def build_ways_sdf_toline(o_response, excludedattributes):
+
+def build_polygon_columns(o_response, excludedattributes, o_r_response=None):
     '''
-    Function to convert returned OSM polyline data to Esri SpatialDataFrame.
-    Returns an ESRI SpatialDataFrame.
-    @param o_response: The valid response data from the OSM server containing the way elements
+    Function to convert returned OSM polygon data to columns.
+    The rings are assembled in worker processes, if the process pool is enabled.
+    Returns a dictionary of columns, see pack_element_columns.
+    @param o_response: The OSMElements set containing the way elements.
     @param excludedattributes: The attributes exluded in the configuration file osmconfig.json
+    @param o_r_response: The optional OSMElements set containing the relation elements.
     '''
-    # Extract Relevant Way Elements from OSM Response
-    ways = [e for e in o_response if e['type'] == 'way' and e['nodes'][0] != e['nodes'][-1]]
-
-    # Dictionary For Geometries & IDs
-    geo_dict = {'geo': []}
-    val_dict = {'osm_id': [], 'timestamp': []}  
-
-    # Dictionary For Incoming Tags
-    for w in ways:
-        w_tags = w['tags'].keys()
-        for tag in w_tags:
-            if tag not in val_dict.keys() and tag not in excludedattributes:
-                tagname = tag
-                val_dict[tagname] = []
-    
-    print('Constructing lines...')
-    p=0
-    pbar = createpbar(len(ways))
-    # Build Lists
-    for w in ways:
-        try:
-            p = updatepbar(p, pbar)
-            # Populate Tags
-            for tag in [key for key in val_dict.keys() if key not in ['osm_id','timestamp'] and key not in excludedattributes]:
-                val_dict[tag].append(w['tags'].get(str(tag),''))
+    # Extract relevant relations and way elements from OSM response.
+    # The members reference their ways by id, the coordinates are views of the shared coordinate array.
+    relations = get_polygon_relations(o_r_response)
 
-            # Populate Geometries & IDs
-            coords = [[e['lon'], e['lat']] for e in w.get('geometry')]
-            poly = Polyline({"paths": [coords], "spatialReference": {"wkid": 4326}})
+    print('Constructing complex polygons...')
+    columns = map_batches(build_relation_columns,
+                          ((r, [(role, o_r_response.get_member_coords(ref)) for m_type, ref, role in r.members if m_type == 'way']) for r in relations),
+                          excludedattributes)
+    geometry = [{"rings": [ring.tolist() for ring in rings]} for rings in columns.pop('rings')]
 
-            geo_dict['geo'].append(poly)
-            val_dict['osm_id'].append(str(w['id']))
-            val_dict['timestamp'].append(dt.strptime(w['timestamp'],'%Y-%m-%dT%H:%M:%SZ'))
+    # Closed ways consumed as rings by the assembled relations are not emitted again as simple polygons
+    consumed = get_consumed_ways(relations, set(columns['osm_id']), o_response)
+    ways = ((w, o_response.get_way_coords(w)) for w in o_response.ways if w.closed and w.id not in consumed)
+
+    print('Constructing simple polygons...')
+    w_columns = map_batches(build_way_columns, ways, excludedattributes, True)
+    geometry += [{"rings": [ring.tolist()]} for ring in w_columns.pop('paths')]
+
+    for key in columns:
+        columns[key] += w_columns[key]
+    return pack_element_columns(columns, geometry, excludedattributes)
 
-        except Exception as ex:
-            print('Way ID {0} Raised Exception: {1}'.format(w['id'], str(ex)))
 
+def get_polygon_relations(o_r_response):
+    '''
+    Function to select the relations converted to complex polygons, relations with node members are skipped.
+    Returns the list of OSMRelation records.
+    @param o_r_response: The optional OSMElements set containing the relation elements.
+    '''
+    return [r for r in (o_r_response.relations if o_r_response is not None else [])
+            if not any(m_type == 'node' for m_type, ref, role in r.members)]
+
+
+def get_consumed_ways(relations, assembled, o_response):
+    '''
+    Function to collect the ids of the ways consumed by assembled multipolygon relations. Outer member ways are part of the relation polygon,
+    inner member ways are only consumed if their tags are also tags of the relation, otherwise they are features of their own.
+    Returns the set of way ids.
+    @param relations: The list of OSMRelation records.
+    @param assembled: The set of ids of the relations with at least one valid outer ring, see build_relation_columns.
+    @param o_response: The OSMElements set containing the way elements.
+    '''
+    tags = {w.id: w.tags for w in o_response.ways if w.closed}
+    consumed = set()
+    for r in relations:
+        if r.id not in assembled:
+            continue
+        for m_type, ref, role in r.members:
+            if m_type != 'way' or ref not in tags:
+                continue
+            if role in ['outer', ''] or tags[ref].items() <= r.tags.items():
+                consumed.add(ref)
+    if consumed:
+        print('Dropped '+str(len(consumed))+' simple polygons consumed by complex polygons . . .')
+    return consumed
+
+
+def build_line_columns(o_response, excludedattributes):
+    '''
+    Function to convert returned OSM polyline data to columns.
+    The coordinates are packed in worker processes, if the process pool is enabled.
+    Returns a dictionary of columns, see pack_element_columns.
+    @param o_response: The OSMElements set containing the way elements.
+    @param excludedattributes: The attributes exluded in the configuration file osmconfig.json
+    '''
+    # Extract Relevant Way Elements from OSM Response
+    ways = ((w, o_response.get_way_coords(w)) for w in o_response.ways if not w.closed)
+
+    print('Constructing lines...')
+    columns = map_batches(build_way_columns, ways, excludedattributes, False)
+    geometry = [{"paths": [path.tolist()]} for path in columns.pop('paths')]
+    return pack_element_columns(columns, geometry, excludedattributes)
+
+
+def build_sdf_from_columns(columns, geom_type):
+    '''
+    Function to create an Esri SpatialDataFrame from columns, the tag columns are categorical and missing tag values are empty strings.
+    Returns an ESRI SpatialDataFrame.
+    @param columns: A dictionary of columns, see pack_element_columns.
+    @param geom_type: Specifies input geometry. Value must be either "point", "line", or "polygon".
+    '''
+    val_dict = {'osm_id': columns['osm_id'].astype(str).astype(object),
+                'osm_type': pd.Series(columns['osm_type'], dtype=object)}
+    if has_timestamps():
+        val_dict['timestamp'] = parse_timestamps(columns['timestamp'])
+    val_dict.update(build_tag_columns(columns['tags'], len(columns['osm_id'])))
+    geometry_class = {'point': Point, 'line': Polyline, 'polygon': Polygon}[geom_type]
+    sr = {"wkid": 4326}
+    geometry = [geometry_class(dict(g, spatialReference=sr)) for g in columns['geometry']]
     try:
-        geo_dict = geo_dict['geo']
-        val_dict = {k: v for k, v in val_dict.items() if v is not None}
-        return SpatialDataFrame(val_dict, geometry=geo_dict)
+        return SpatialDataFrame(val_dict, geometry=geometry)
 
     except TypeError:
         raise Exception('Ensure ArcPy is Included in Python Interpreter')
-            
 
-def fields_cleaner(b_sdf):
+
+def get_field(name, alias, field_type, length=None):
     '''
-    Optional function to cleanup fields, where 99% of the data contains 'Null' values.
-    Returns an ESRI SpatialDataFrame. Currently not applied in this version of the module.
-    @param b_sdf: The ESRI Spatial DataFrame to be cleaned from 99% empty fields.
+    Function to create an Esri JSON field definition.
+    Returns the field definition.
+    @param name: The name of the field.
+    @param alias: The alias of the field, the OSM name.
+    @param field_type: The Esri field type e.g. "esriFieldTypeString".
+    @param length: The length of the field, only used for string and date fields.
     '''
+    dictField = {}
+    dictField["name"] = name
+    dictField["alias"] = alias
+    dictField["type"] = field_type
+    if length is not None:
+        dictField["length"] = length
+    dictField["sqlType"] = "sqlTypeOther"
+    return dictField
 
-    # Set Cutoff & Collect Field List
-    cutoff = int(len(b_sdf) * .99)
-    f_list = list(b_sdf)
 
-    # Flag Fields Where >= 99% of Data is Null
-    fields = []
-    for f in f_list:
-        try:
-            if b_sdf[f].dtype == 'object' and f != 'SHAPE':
-                null_count = b_sdf[f].value_counts().get('Null', 0)
-                if null_count >= cutoff:
-                    fields.append(f)
-        except:
-            print('Cannot Determine Null Count for Field {0}'.format(str(f)))
-            continue
+def infer_tag_field(values):
+    '''
+    Function to infer the tightest Esri field type of a tag column with vectorized checks over its distinct values.
+    Integers without leading zeros become small integer, integer or double fields depending on their range, decimals without
+    trailing zeros become double fields and ISO dates become date fields, so the values are stored without changing their text,
+    a negative zero like "-0" is kept as a string. All other columns become string fields with the observed maximum length,
+    at least "minStringLength".
+    Returns a tuple with the field type, the field length and the list of converted values.
+    @param values: The list of tag values of the column.
+    '''
+    if Schema['isEnabled'] != 'yes':
+        return 'esriFieldTypeString', 1000, values
 
-    # Drop Flagged Fields & Return
-    if fields:
-        b_sdf.drop(fields, axis=1, inplace=True)
+    # The values are dictionary encoded, so every distinct value is checked and converted only once
+    codes, uniques = pd.factorize(pd.Series(values, dtype=object))
+    series = pd.Series(uniques, dtype=object).astype(str)
+    max_length = int(series.str.len().max())
+
+    if max_length <= 11 and series.str.match(r'(0|-?[1-9][0-9]*)\Z').all():
+        numbers = series.astype(np.int64)
+        if numbers.between(-32768, 32767).all():
+            return 'esriFieldTypeSmallInteger', None, numbers.values[codes].tolist()
+        if numbers.between(-2147483648, 2147483647).all():
+            return 'esriFieldTypeInteger', None, numbers.values[codes].tolist()
+
+    # Doubles represent numbers with up to 15 significant digits exactly
+    if max_length <= 15 and series.str.match(r'(?!-0\Z)-?(0|[1-9][0-9]*)(\.[0-9]*[1-9])?\Z').all():
+        return 'esriFieldTypeDouble', None, series.astype(np.float64).values[codes].tolist()
+
+    if series.str.match(r'[0-9]{4}-[0-9]{2}-[0-9]{2}\Z').all():
+        dates = pd.to_datetime(series, format='%Y-%m-%d', errors='coerce')
+        if not dates.isna().any():
+            return 'esriFieldTypeDate', 20, dates.values.astype('datetime64[ms]').astype(np.int64)[codes].tolist()
+
+    return 'esriFieldTypeString', max(max_length, int(Schema['minStringLength'])), values
+
+
+def has_timestamps():
+    '''
+    Function to check if the elements have timestamps, the Overpass API only returns them with the metadata of the elements.
+    Returns True if the metadata is requested or the elements are read from the local extract.
+    '''
+    return Output['meta'] == 'yes' or Extract['isEnabled'] == 'yes'
+
+
+def emit_esri_featureset(columns, geom_type):
+    '''
+    Function to emit columns as upload-ready Esri JSON features, without the round trip through a SpatialDataFrame and a featureset.
+    The field definitions are computed once per layer: the osm_id and the tags are named "f_<number>" with the OSM names as aliases,
+    the types of the tag fields are inferred from their values, see infer_tag_field, and the timestamp is a date field in epoch milliseconds,
+    which is left out if the elements have no timestamps, see has_timestamps. The element type is stored in the "osm_type" field, the ids of ways and relations are only unique together with their type.
+    Tags missing on an element are left out of its attributes.
+    Returns an Esri JSON featureset dictionary with the items "geometryType", "spatialReference", "fields" and "features".
+    @param columns: A dictionary of columns, see pack_element_columns.
+    @param geom_type: Specifies input geometry. Value must be either "point", "line", or "polygon".
+    '''
+    # The ids are kept as strings of the length of the largest 64 bit integer, so later ids fit as well
+    fields = [get_field('f_1', 'osm_id', 'esriFieldTypeString', 20)]
+    attributes = [{'f_1': osm_id, 'osm_type': osm_type} for osm_id, osm_type in zip(columns['osm_id'].astype(str).tolist(), columns['osm_type'])]
+
+    # The sparse tag matrix is written column by column into the attribute dictionaries, the values are interned by tags_to_matrix
+    # and every distinct value of a field is converted once, see infer_tag_field
+    for number, (tag, (rows, values)) in enumerate(columns['tags'].items(), 2):
+        name = 'f_' + str(number)
+        field_type, length, values = infer_tag_field(values)
+        fields.append(get_field(name, tag, field_type, length))
+        for row, value in zip(rows, values):
+            attributes[row][name] = value
+
+    fields.append(get_field('osm_type', 'osm_type', 'esriFieldTypeString', 8))
+    if has_timestamps():
+        fields.append(get_field('timestamp', 'timestamp', 'esriFieldTypeDate', 20))
+        timestamps = parse_timestamps(columns['timestamp'])
+        missing = timestamps.isna().values
+        milliseconds = timestamps.values.astype('datetime64[ms]').astype(np.int64).tolist()
+        for attrs, value, isna in zip(attributes, milliseconds, missing):
+            attrs['timestamp'] = None if isna else value
+
+    features = [{'geometry': g, 'attributes': a} for g, a in zip(columns['geometry'], attributes)]
+    return {'geometryType': GeometryTypes[geom_type],
+            'spatialReference': {'wkid': 4326},
+            'fields': fields,
+            'features': features}
+
+
+def fields_cleaner(b_sdf, field_pruning=None, exempt=()):
+    '''
+    Optional function to cleanup the tag fields, which are filled in less than "minDensity" of the rows. Missing tags are empty strings,
+    the fill ratios of all tag fields are computed in one pass over a mask of the value matrix.
+    Returns an ESRI SpatialDataFrame.
+    @param b_sdf: The ESRI Spatial DataFrame to be cleaned from sparse fields.
+    @param field_pruning: A dictionary with the items "isEnabled" and "minDensity".
+    @param exempt: The fields, which are never pruned.
+    '''
+    if not field_pruning or field_pruning['isEnabled'] != 'yes' or len(b_sdf) == 0:
         return b_sdf
 
-    else:
+    min_density = float(field_pruning['minDensity'])
+    fields = [f for f in b_sdf.columns if f not in ('SHAPE', 'osm_id', 'osm_type', 'timestamp')
+              and (isinstance(b_sdf[f].dtype, pd.CategoricalDtype) or pd.api.types.is_string_dtype(b_sdf[f].dtype))]
+    if not fields:
         return b_sdf
+
+    values = b_sdf[fields]
+    densities = (values.ne('') & values.notna()).mean(axis=0).values
+    pruned = [(f, density) for f, density in zip(fields, densities.tolist()) if density < min_density and f not in exempt]
+    report_pruned_fields(pruned, len(fields), min_density)
+
+    # Drop Flagged Fields & Return
+    if pruned:
+        b_sdf.drop([f for f, density in pruned], axis=1, inplace=True)
+    return b_sdf
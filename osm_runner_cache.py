@@ -0,0 +1,124 @@
+__version__ = "0.0.2"
+'''
+__author__ = "Jeffrey Scarmazzi, Lukas Bug"
+__copyright__ = "Copyright 2018, Jeffrey Scarmazzi, Esri Deutschland GmbH"
+__license__ = "Apache-2.0"
+__version__ = "0.0.2"
+__email__ = "lukas.bug@aol.de"
+The module "osm_runner" was written by Jeffrey Scarmazzi (Jwmazzi) and all copyright belongs to him.
+The original module can be found using the following URL: https://github.com/Jwmazzi/osm_runner
+This module provides a persistent, compressed cache for responses of the Overpass API, used by osm_runner.py.
+Responses are stored content-addressed by the normalized query, expire after a configurable time to live and
+the least recently used responses are evicted, if the cache exceeds its configured size.
+'''
+
+from osm_runner_utils import Cache
+import hashlib,json,gzip,os,time,tempfile,shutil
+
+def get_cache_key(osm_query):
+    '''
+    Function to compute the cache key of a query, whitespace differences do not change the key.
+    Returns the hexadecimal SHA-256 digest of the normalized query.
+    @param osm_query: Specifies the OSM query as returned by the get_query function.
+    '''
+    normalized = ' '.join(osm_query.split())
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+def get_cache_path(osm_query):
+    '''
+    Function to get the file path of a cached query response.
+    Returns the file path.
+    @param osm_query: Specifies the OSM query as returned by the get_query function.
+    '''
+    return os.path.join(Cache['directory'], get_cache_key(osm_query) + '.json.gz')
+
+def open_cached_response(osm_query):
+    '''
+    Function to open a cached response for reading, expired responses are removed and reused responses are logged with their age.
+    Returns a binary file object with the decompressed response body or None, if the query is not cached or the cache is disabled.
+    @param osm_query: Specifies the OSM query as returned by the get_query function.
+    '''
+    if Cache['isEnabled'] != 'yes':
+        return None
+    path = get_cache_path(osm_query)
+    try:
+        stat = os.stat(path)
+        if time.time() - stat.st_mtime > float(Cache['ttlMinutes']) * 60:
+            os.remove(path)
+            return None
+        f = gzip.open(path, 'rb')
+        print('Using cached OSM response from '+time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(stat.st_mtime))+' ('+str(int((time.time() - stat.st_mtime) // 60))+' minutes old) . . .')
+        # The access time marks the entry as recently used, the modification time keeps the time of creation.
+        os.utime(path, (time.time(), stat.st_mtime))
+        return f
+    except OSError:
+        return None
+
+def read_cached_response(osm_query):
+    '''
+    Function to read a cached response, expired responses are removed.
+    Returns the decoded response or None, if the query is not cached or the cache is disabled.
+    @param osm_query: Specifies the OSM query as returned by the get_query function.
+    '''
+    f = open_cached_response(osm_query)
+    if f is None:
+        return None
+    try:
+        with f:
+            return json.loads(f.read().decode('utf-8'))
+    except (OSError, ValueError):
+        return None
+
+def write_cached_response(osm_query, content, compressed=False):
+    '''
+    Function to store the raw response body of a query compressed in the cache and to evict old responses afterwards.
+    @param osm_query: Specifies the OSM query as returned by the get_query function.
+    @param content: The raw response body in bytes or a binary file object positioned at the start of the body.
+    @param compressed: Specifies if the content is already gzip compressed, it is stored without compressing it again.
+    '''
+    if Cache['isEnabled'] != 'yes':
+        return
+    os.makedirs(Cache['directory'], exist_ok=True)
+    path = get_cache_path(osm_query)
+    fd, tmppath = tempfile.mkstemp(dir=Cache['directory'], suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as raw:
+            if compressed:
+                f = raw
+            else:
+                f = gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6)
+            if isinstance(content, bytes):
+                f.write(content)
+            else:
+                shutil.copyfileobj(content, f)
+            if not compressed:
+                f.close()
+        os.replace(tmppath, path)
+    except OSError:
+        if os.path.exists(tmppath):
+            os.remove(tmppath)
+        return
+    evict_cached_responses()
+
+def evict_cached_responses():
+    '''
+    Function to remove the least recently used responses, until the cache does not exceed its maximum size.
+    '''
+    entries = []
+    for name in os.listdir(Cache['directory']):
+        if name.endswith('.json.gz'):
+            try:
+                stat = os.stat(os.path.join(Cache['directory'], name))
+                entries.append((stat.st_atime, stat.st_size, name))
+            except OSError:
+                continue
+    total = sum(entry[1] for entry in entries)
+    maxsize = float(Cache['maxSizeMB']) * 1024 * 1024
+    for atime, size, name in sorted(entries):
+        if total <= maxsize:
+            break
+        try:
+            os.remove(os.path.join(Cache['directory'], name))
+            total -= size
+        except OSError:
+            continue
@@ -0,0 +1,183 @@
+__version__ = "0.0.2"
+'''
+__author__ = "Jeffrey Scarmazzi, Lukas Bug"
+__copyright__ = "Copyright 2018, Jeffrey Scarmazzi, Esri Deutschland GmbH"
+__license__ = "Apache-2.0"
+__version__ = "0.0.2"
+__email__ = "lukas.bug@aol.de"
+The module "osm_runner" was written by Jeffrey Scarmazzi (Jwmazzi) and all copyright belongs to him.
+The original module can be found using the following URL: https://github.com/Jwmazzi/osm_runner
+This module provides the shared client for requests to the Overpass API, used by osm_runner.py.
+All requests pass a central token bucket, reuse pooled keep-alive connections, wait for free slots reported by
+the status endpoint of the server, back off exponentially with jitter and fail over to the next configured endpoint.
+'''
+
+from osm_runner_utils import Overpass
+from requests.adapters import HTTPAdapter
+import requests,threading,time,random,re
+
+client = None
+client_lock = threading.Lock()
+
+def get_client():
+    '''
+    Function to get the shared Overpass client, the client is created with the current settings on first use.
+    Returns the OverpassClient.
+    '''
+    global client
+    with client_lock:
+        if client is None:
+            client = OverpassClient(Overpass['endpoints'], float(Overpass['requestsPerMinute']), int(Overpass['maxRetries']),
+                                    float(Overpass['backoffSeconds']), float(Overpass['maxBackoffSeconds']), float(Overpass['timeout']),
+                                    int(Overpass['poolSize']))
+        return client
+
+class TokenBucket(object):
+    '''
+    Token bucket to limit the rate of requests of all threads.
+    '''
+    def __init__(self, rate, capacity):
+        '''
+        @param rate: The number of tokens added per second.
+        @param capacity: The maximum number of tokens in the bucket.
+        '''
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        '''
+        Function to take a token from the bucket, blocks until a token is available.
+        '''
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class OverpassClient(object):
+    '''
+    Client for the Overpass API with pooled sessions, rate limiting, backoff and endpoint failover.
+    '''
+    def __init__(self, endpoints, requests_per_minute, max_retries, backoff_seconds, max_backoff_seconds, timeout, pool_size):
+        '''
+        @param endpoints: The list of interpreter URLs, the first endpoint is used until it fails.
+        @param requests_per_minute: The maximum number of requests per minute of all threads.
+        @param max_retries: The maximum number of retries of a request.
+        @param backoff_seconds: The initial waiting time after a failed request.
+        @param max_backoff_seconds: The maximum waiting time after a failed request.
+        @param timeout: The timeout of a request in seconds.
+        @param pool_size: The maximum number of keep-alive connections per endpoint.
+        '''
+        self.endpoints = list(endpoints)
+        self.bucket = TokenBucket(requests_per_minute / 60.0, max(1.0, requests_per_minute / 60.0))
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.timeout = timeout
+        self.current = 0
+        self.lock = threading.Lock()
+        self.sessions = {}
+        for endpoint in self.endpoints:
+            session = requests.Session()
+            # The responses are requested gzip compressed and spooled to disk without decoding them, see osm_runner.spool_response
+            session.headers['Accept-Encoding'] = 'gzip'
+            session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+            session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+            self.sessions[endpoint] = session
+
+    def get_endpoint(self):
+        '''
+        Function to get the currently used endpoint.
+        Returns the interpreter URL.
+        '''
+        with self.lock:
+            return self.endpoints[self.current]
+
+    def failover(self, endpoint):
+        '''
+        Function to switch to the next endpoint, if the failed endpoint is still the current one.
+        @param endpoint: The interpreter URL, which failed.
+        '''
+        with self.lock:
+            if self.endpoints[self.current] == endpoint and len(self.endpoints) > 1:
+                self.current = (self.current + 1) % len(self.endpoints)
+                print('Overpass endpoint '+endpoint+' failed, switching to '+self.endpoints[self.current]+' . . .')
+
+    def get_backoff(self, attempt):
+        '''
+        Function to compute the waiting time before the next retry, exponential with full jitter.
+        Returns the waiting time in seconds.
+        @param attempt: The number of the failed attempt, starting with 0.
+        '''
+        return random.uniform(0, min(self.max_backoff_seconds, self.backoff_seconds * 2 ** attempt))
+
+    def get_slot_wait(self, endpoint):
+        '''
+        Function to read the slot availability from the status endpoint of the server.
+        Returns the waiting time in seconds until the next slot is available, 0 if a slot is available
+        or None if the status cannot be read.
+        @param endpoint: The interpreter URL.
+        '''
+        try:
+            r = self.sessions[endpoint].get(endpoint.rsplit('/', 1)[0] + '/status', timeout=30)
+            if r.status_code != 200:
+                return None
+            if re.search(r'(\d+) slots? available now', r.text):
+                return 0
+            waits = [int(w) for w in re.findall(r'in (\d+) seconds', r.text)]
+            if waits:
+                return min(waits)
+        except requests.RequestException:
+            return None
+        return None
+
+    def request(self, osm_query, stream=False):
+        '''
+        Function to send a query to the Overpass API. Requests exceeding the rate limit are retried after the next slot
+        is available, failed connections and server errors are retried with the next endpoint.
+        Returns the last response of the server.
+        @param osm_query: Specifies the OSM query as returned by the get_query function.
+        @param stream: Specifies if the response body is streamed.
+        '''
+        r = None
+        for attempt in range(self.max_retries + 1):
+            endpoint = self.get_endpoint()
+            self.bucket.acquire()
+            try:
+                r = self.sessions[endpoint].post(endpoint, data=osm_query.encode('utf-8'), stream=stream, timeout=self.timeout)
+            except requests.RequestException as ex:
+                if attempt == self.max_retries:
+                    raise ConnectionRefusedError('Overpass endpoint {0} is not reachable: {1}'.format(endpoint, str(ex)))
+                self.failover(endpoint)
+                time.sleep(self.get_backoff(attempt))
+                continue
+
+            if r.status_code == 429:
+                if attempt == self.max_retries:
+                    return r
+                r.close()
+                wait = self.get_slot_wait(endpoint)
+                if wait is None:
+                    wait = self.get_backoff(attempt)
+                print('OSM Request Limit Reached. We are waiting '+str(int(wait))+' seconds and retry afterwards...')
+                time.sleep(wait + random.uniform(0, 1))
+                continue
+
+            if r.status_code in [500, 502, 503]:
+                if attempt == self.max_retries:
+                    return r
+                r.close()
+                self.failover(endpoint)
+                time.sleep(self.get_backoff(attempt))
+                continue
+
+            return r
+        return r
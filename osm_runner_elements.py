@@ -0,0 +1,258 @@
+__version__ = "0.0.2"
+'''
+__author__ = "Jeffrey Scarmazzi, Lukas Bug"
+__copyright__ = "Copyright 2018, Jeffrey Scarmazzi, Esri Deutschland GmbH"
+__license__ = "Apache-2.0"
+__version__ = "0.0.2"
+__email__ = "lukas.bug@aol.de"
+The module "osm_runner" was written by Jeffrey Scarmazzi (Jwmazzi) and all copyright belongs to him.
+The original module can be found using the following URL: https://github.com/Jwmazzi/osm_runner
+This module provides the compact element model of osm_runner.py. The decoded elements of the Overpass API are converted into
+node, way and relation records with fixed slots. The coordinates of all ways are stored in a single contiguous float64 array,
+a way only keeps the offsets of its vertices. Relation members reference their ways by id, so the geometry of a way is stored once,
+even if it is returned as a member of several relations.
+'''
+
+from array import array
+import numpy as np
+
+EMPTY_TAGS = {}
+
+class OSMNode(object):
+    '''
+    A node with its coordinates.
+    '''
+    __slots__ = ('id', 'timestamp', 'tags', 'lon', 'lat')
+    type = 'node'
+
+    def __init__(self, id, timestamp, tags, lon, lat):
+        self.id = id
+        self.timestamp = timestamp
+        self.tags = tags
+        self.lon = lon
+        self.lat = lat
+
+
+class OSMWay(object):
+    '''
+    A way with the offsets of its vertices in the coordinate array of the element set.
+    '''
+    __slots__ = ('id', 'timestamp', 'tags', 'closed', 'start', 'end')
+    type = 'way'
+
+    def __init__(self, id, timestamp, tags, closed, start, end):
+        self.id = id
+        self.timestamp = timestamp
+        self.tags = tags
+        self.closed = closed
+        self.start = start
+        self.end = end
+
+
+class OSMRelation(object):
+    '''
+    A relation with its members as tuples (type, ref, role).
+    '''
+    __slots__ = ('id', 'timestamp', 'tags', 'members')
+    type = 'relation'
+
+    def __init__(self, id, timestamp, tags, members):
+        self.id = id
+        self.timestamp = timestamp
+        self.tags = tags
+        self.members = members
+
+
+class OSMElements(object):
+    '''
+    A set of node, way and relation records sharing one coordinate array, see load_elements.
+    '''
+    __slots__ = ('nodes', 'ways', 'relations', 'coords', 'offsets')
+
+    def __init__(self, nodes, ways, relations, coords, offsets):
+        self.nodes = nodes
+        self.ways = ways
+        self.relations = relations
+        self.coords = coords
+        self.offsets = offsets
+
+    def __iter__(self):
+        yield from self.nodes
+        yield from self.ways
+        yield from self.relations
+
+    def __len__(self):
+        return len(self.nodes) + len(self.ways) + len(self.relations)
+
+    def get_records(self, osm_el):
+        '''
+        Function to get the records of an element type.
+        Returns the list of records.
+        @param osm_el: Specifies the OpenStreetMap element. Valid values are "node", "way" or "relation"
+        '''
+        return {'node': self.nodes, 'way': self.ways, 'relation': self.relations}[osm_el]
+
+    def select(self, osm_el, records):
+        '''
+        Function to create an element set with a selection of records of one element type, the coordinates are shared.
+        Returns the new element set.
+        @param osm_el: Specifies the OpenStreetMap element. Valid values are "node", "way" or "relation"
+        @param records: The selected records.
+        '''
+        selected = {'node': [], 'way': [], 'relation': []}
+        selected[osm_el] = records
+        return OSMElements(selected['node'], selected['way'], selected['relation'], self.coords, self.offsets)
+
+    def get_way_coords(self, way):
+        '''
+        Function to get the vertices of a way.
+        Returns a (n, 2) float64 array of lon/lat pairs, a view of the shared coordinate array.
+        @param way: An OSMWay record.
+        '''
+        return self.coords[way.start:way.end]
+
+    def get_member_coords(self, ref):
+        '''
+        Function to get the vertices of a way referenced by a relation member.
+        Returns a (n, 2) float64 array of lon/lat pairs or None, if the geometry of the way was not returned.
+        @param ref: The id of the way.
+        '''
+        offset = self.offsets.get(ref)
+        if offset is None:
+            return None
+        return self.coords[offset[0]:offset[1]]
+
+
+class ElementLoader(object):
+    '''
+    Loader to convert decoded elements into records, elements with a type and id already loaded are skipped.
+    '''
+
+    def __init__(self):
+        self.nodes = []
+        self.ways = []
+        self.relations = []
+        self.coords = array('d')
+        self.offsets = {}
+        self.loaded = set()
+
+    def add_geometry(self, ref, geometry):
+        '''
+        Function to append the vertices of a way to the coordinate array, the vertices of a way are stored once.
+        Returns a tuple with the start and end offset of the vertices.
+        @param ref: The id of the way.
+        @param geometry: The list of vertices e.g. [{"lat": 48.1, "lon": 11.5}, ...].
+        '''
+        offset = self.offsets.get(ref)
+        if offset is None:
+            start = len(self.coords) // 2
+            for vertex in geometry:
+                self.coords.append(float(vertex['lon']))
+                self.coords.append(float(vertex['lat']))
+            offset = self.offsets[ref] = (start, len(self.coords) // 2)
+        return offset
+
+    def add_coords(self, ref, coords):
+        '''
+        Function to append the vertices of a way given as an array to the coordinate array, the vertices of a way are stored once.
+        Returns a tuple with the start and end offset of the vertices.
+        @param ref: The id of the way.
+        @param coords: A float64 array of shape (n, 2) with lon/lat pairs.
+        '''
+        offset = self.offsets.get(ref)
+        if offset is None:
+            start = len(self.coords) // 2
+            self.coords.frombytes(np.ascontiguousarray(coords, dtype=np.float64).tobytes())
+            offset = self.offsets[ref] = (start, len(self.coords) // 2)
+        return offset
+
+    def get_coords(self, ref):
+        '''
+        Function to get the vertices of a way added before, while the loading is not completed.
+        Returns a float64 array of shape (n, 2) or None, if the way was not added.
+        @param ref: The id of the way.
+        '''
+        offset = self.offsets.get(ref)
+        if offset is None:
+            return None
+        return np.array(self.coords[2 * offset[0]:2 * offset[1]], dtype=np.float64).reshape(-1, 2)
+
+    def add_node(self, id, timestamp, tags, lon, lat):
+        '''
+        Function to add a node record.
+        @param id: The id of the node.
+        @param timestamp: The timestamp of the node e.g. "2018-06-01T00:00:00Z".
+        @param tags: The tag dictionary of the node.
+        @param lon: The longitude of the node.
+        @param lat: The latitude of the node.
+        '''
+        self.nodes.append(OSMNode(id, timestamp, tags or EMPTY_TAGS, lon, lat))
+
+    def add_way(self, id, timestamp, tags, closed, start, end):
+        '''
+        Function to add a way record, the vertices are added before with add_geometry or add_coords.
+        @param id: The id of the way.
+        @param timestamp: The timestamp of the way e.g. "2018-06-01T00:00:00Z".
+        @param tags: The tag dictionary of the way.
+        @param closed: Specifies if the first and the last node of the way are the same.
+        @param start: The offset of the first vertex.
+        @param end: The offset after the last vertex.
+        '''
+        self.ways.append(OSMWay(id, timestamp, tags or EMPTY_TAGS, closed, start, end))
+
+    def add_relation(self, id, timestamp, tags, members):
+        '''
+        Function to add a relation record, the vertices of the member ways are added with add_geometry or add_coords.
+        @param id: The id of the relation.
+        @param timestamp: The timestamp of the relation e.g. "2018-06-01T00:00:00Z".
+        @param tags: The tag dictionary of the relation.
+        @param members: A tuple of members as tuples (type, ref, role).
+        '''
+        self.relations.append(OSMRelation(id, timestamp, tags or EMPTY_TAGS, members))
+
+    def add(self, e):
+        '''
+        Function to convert a decoded element into a record.
+        @param e: An element as decoded from the response of the Overpass API.
+        '''
+        key = (e['type'], e['id'])
+        if key in self.loaded:
+            return
+        self.loaded.add(key)
+        tags = e.get('tags')
+        if e['type'] == 'node':
+            # Untagged nodes are only vertices of ways, their coordinates are part of the way geometry
+            if tags:
+                self.add_node(e['id'], e.get('timestamp'), tags, float(e['lon']), float(e['lat']))
+        elif e['type'] == 'way':
+            nodes = e.get('nodes')
+            closed = bool(nodes) and nodes[0] == nodes[-1]
+            start, end = self.add_geometry(e['id'], e.get('geometry') or [])
+            self.add_way(e['id'], e.get('timestamp'), tags, closed, start, end)
+        elif e['type'] == 'relation':
+            members = []
+            for m in e.get('members', []):
+                if m.get('type') == 'way' and m.get('geometry'):
+                    self.add_geometry(m['ref'], m['geometry'])
+                members.append((m.get('type'), m.get('ref'), m.get('role', '')))
+            self.add_relation(e['id'], e.get('timestamp'), tags, tuple(members))
+
+    def finish(self):
+        '''
+        Function to complete the loading, no element can be added afterwards.
+        Returns the element set.
+        '''
+        coords = np.frombuffer(self.coords, dtype=np.float64).reshape(-1, 2)
+        return OSMElements(self.nodes, self.ways, self.relations, coords, self.offsets)
+
+
+def load_elements(elements):
+    '''
+    Function to convert decoded elements into the compact element model.
+    Returns an OSMElements set.
+    @param elements: A list or an iterator of elements as decoded from the response of the Overpass API.
+    '''
+    loader = ElementLoader()
+    for e in elements:
+        loader.add(e)
+    return loader.finish()
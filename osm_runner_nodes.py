@@ -0,0 +1,156 @@
+__version__ = "0.0.2"
+'''
+__author__ = "Jeffrey Scarmazzi, Lukas Bug"
+__copyright__ = "Copyright 2018, Jeffrey Scarmazzi, Esri Deutschland GmbH"
+__license__ = "Apache-2.0"
+__version__ = "0.0.2"
+__email__ = "lukas.bug@aol.de"
+The module "osm_runner" was written by Jeffrey Scarmazzi (Jwmazzi) and all copyright belongs to him.
+The original module can be found using the following URL: https://github.com/Jwmazzi/osm_runner
+This module provides the node location store of osm_runner.py, used to resolve the node references of ways read from an extract.
+The locations are stored as int32 fixed-point coordinates with the precision of OpenStreetMap (1e-7 degrees) in memory-mapped
+temporary files, so the memory of the process stays bounded independent of the number of nodes. The "dense" store is an array
+indexed by the node id, suited for country extracts, the "sparse" store keeps the sorted ids and is searched, suited for small extracts.
+'''
+
+from array import array
+import numpy as np
+import tempfile
+
+# Fixed-point scale of the coordinates
+Scale = 10000000
+
+# The latitude is stored with this offset, so every stored latitude is positive and 0 marks a missing node in the dense store
+LatOffset = 90 * Scale + 1
+
+
+class NodeLocationStore(object):
+    '''
+    Store of node locations in memory-mapped temporary files. The nodes are added in ascending order of their ids,
+    the locations are buffered and written block by block.
+    '''
+
+    def __init__(self, mode='sparse', directory=None, buffer_size=65536):
+        '''
+        @param mode: "dense" to index the locations by node id or "sparse" to store the sorted ids with the locations.
+        @param directory: The folder of the temporary files, the default temporary folder if None or empty.
+        @param buffer_size: The number of nodes buffered before they are written.
+        '''
+        if mode not in ['dense', 'sparse']:
+            raise ValueError('Node Store Mode "{0}" Does Not Match Input Options: dense|sparse'.format(mode))
+        self.mode = mode
+        self.directory = directory or None
+        self.buffer_size = buffer_size
+        self.ids = array('q')
+        self.coords = array('i')
+        self.last_id = None
+        self.count = 0
+        self.capacity = 0
+        self.id_file = None
+        self.coord_file = tempfile.TemporaryFile(dir=self.directory)
+        if mode == 'sparse':
+            self.id_file = tempfile.TemporaryFile(dir=self.directory)
+        self.mapped = None
+
+    def add(self, node_id, lon, lat):
+        '''
+        Function to add the location of a node.
+        @param node_id: The id of the node, not negative and larger than the ids added before.
+        @param lon: The longitude of the node.
+        @param lat: The latitude of the node.
+        '''
+        self.add_many(np.array([node_id], dtype=np.int64), np.array([lon]), np.array([lat]))
+
+    def add_many(self, ids, lons, lats):
+        '''
+        Function to add the locations of a block of nodes at once, e.g. of a DenseNodes message.
+        @param ids: The int64 array of the node ids, not negative, ascending and larger than the ids added before.
+        @param lons: The float64 array of the longitudes.
+        @param lats: The float64 array of the latitudes.
+        '''
+        if not len(ids):
+            return
+        # Negative ids are only used by editors for new elements, the dense store would wrap them to the end of the array
+        if ids[0] < 0:
+            raise ValueError('PBF Extract Contains Negative Node Id {0}'.format(int(ids[0])))
+        if self.mapped is not None or (self.last_id is not None and ids[0] <= self.last_id) or np.any(np.diff(ids) <= 0):
+            raise ValueError('PBF Extract Is Not Sorted By Type And Id')
+        self.last_id = int(ids[-1])
+        coords = np.empty((len(ids), 2), dtype=np.int32)
+        coords[:, 0] = np.rint(np.asarray(lons) * Scale)
+        coords[:, 1] = np.rint(np.asarray(lats) * Scale) + LatOffset
+        self.ids.frombytes(np.asarray(ids, dtype=np.int64).tobytes())
+        self.coords.frombytes(coords.tobytes())
+        if len(self.ids) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        '''
+        Function to write the buffered locations to the temporary files.
+        '''
+        if not self.ids:
+            return
+        ids = np.frombuffer(self.ids, dtype=np.int64)
+        coords = np.frombuffer(self.coords, dtype=np.int32).reshape(-1, 2)
+        if self.mode == 'sparse':
+            self.id_file.write(ids.tobytes())
+            self.coord_file.write(coords.tobytes())
+        else:
+            # The file of the dense store is grown sparsely, so pages without nodes do not use disk space
+            if ids[-1] >= self.capacity:
+                self.capacity = max(int(ids[-1]) + 1, 2 * self.capacity)
+                self.coord_file.truncate(self.capacity * 8)
+            mapped = np.memmap(self.coord_file, dtype=np.int32, mode='r+', shape=(self.capacity, 2))
+            mapped[ids] = coords
+            mapped.flush()
+            del mapped
+        self.count += len(ids)
+        self.ids = array('q')
+        self.coords = array('i')
+
+    def open(self):
+        '''
+        Function to complete the writing and to map the temporary files for lookups.
+        '''
+        self.flush()
+        if self.mode == 'sparse':
+            self.id_file.flush()
+            self.coord_file.flush()
+            ids = np.memmap(self.id_file, dtype=np.int64, mode='r', shape=(self.count,)) if self.count else np.zeros(0, dtype=np.int64)
+            coords = np.memmap(self.coord_file, dtype=np.int32, mode='r', shape=(self.count, 2)) if self.count else np.zeros((0, 2), dtype=np.int32)
+            self.mapped = (ids, coords)
+        else:
+            coords = np.memmap(self.coord_file, dtype=np.int32, mode='r', shape=(self.capacity, 2)) if self.capacity else np.zeros((0, 2), dtype=np.int32)
+            self.mapped = (None, coords)
+
+    def lookup(self, refs):
+        '''
+        Function to get the locations of a list of nodes with a single vectorized lookup.
+        Returns a tuple with a float64 array of shape (n, 2) with lon/lat pairs and a boolean array, which is False for unknown nodes.
+        @param refs: The list or array of node ids.
+        '''
+        if self.mapped is None:
+            self.open()
+        ids, coords = self.mapped
+        refs = np.asarray(refs, dtype=np.int64)
+        if len(coords) == 0:
+            return np.zeros((len(refs), 2)), np.zeros(len(refs), dtype=bool)
+        if ids is None:
+            pos = np.clip(refs, 0, len(coords) - 1)
+            fixed = np.asarray(coords[pos], dtype=np.int64)
+            found = (refs >= 0) & (refs < len(coords)) & (fixed[:, 1] != 0)
+        else:
+            pos = np.minimum(np.searchsorted(ids, refs), len(ids) - 1)
+            fixed = np.asarray(coords[pos], dtype=np.int64)
+            found = ids[pos] == refs
+        fixed[:, 1] -= LatOffset
+        return fixed / Scale, found
+
+    def close(self):
+        '''
+        Function to unmap and remove the temporary files.
+        '''
+        self.mapped = None
+        for f in [self.id_file, self.coord_file]:
+            if f is not None:
+                f.close()
@@ -0,0 +1,493 @@
+__version__ = "0.0.2"
+'''
+__author__ = "Jeffrey Scarmazzi, Lukas Bug"
+__copyright__ = "Copyright 2018, Jeffrey Scarmazzi, Esri Deutschland GmbH"
+__license__ = "Apache-2.0"
+__version__ = "0.0.2"
+__email__ = "lukas.bug@aol.de"
+The module "osm_runner" was written by Jeffrey Scarmazzi (Jwmazzi) and all copyright belongs to him.
+The original module can be found using the following URL: https://github.com/Jwmazzi/osm_runner
+This module provides an offline backend of osm_runner.py, reading the elements of the categories from a local .osm.pbf extract
+(e.g. from Geofabrik) instead of requesting them from the Overpass API. The blocks of the extract are decoded one by one with a
+small protocol buffer decoder, so no further package is needed. Specification: https://wiki.openstreetmap.org/wiki/PBF_Format
+'''
+
+from osm_runner_elements import ElementLoader
+from osm_runner_nodes import NodeLocationStore
+from itertools import accumulate
+import numpy as np
+import re,struct,time,zlib
+
+# The features of an extract, which can be decoded by this module
+SupportedFeatures = {'OsmSchema-V0.6', 'DenseNodes', 'HistoricalInformation'}
+
+# The member types of relations
+MemberTypes = {0: 'node', 1: 'way', 2: 'relation'}
+
+
+def read_varint(buf, pos):
+    '''
+    Function to decode a protocol buffer varint.
+    Returns a tuple with the unsigned value and the position after the varint.
+    @param buf: A bytes-like object.
+    @param pos: The position of the varint.
+    '''
+    result = 0
+    shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        result |= (b & 0x7f) << shift
+        if not b & 0x80:
+            return result, pos
+        shift += 7
+
+
+def to_signed(value):
+    '''
+    Function to convert an unsigned varint of an int32 or int64 field to a signed value, returns the value.
+    @param value: The unsigned value.
+    '''
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def to_zigzag(value):
+    '''
+    Function to convert an unsigned varint of a sint32 or sint64 field to a signed value, returns the value.
+    @param value: The unsigned value.
+    '''
+    return (value >> 1) ^ -(value & 1)
+
+
+def iter_fields(buf):
+    '''
+    Generator to decode the fields of a protocol buffer message.
+    Yields tuples (field number, value), the value is an integer for varints and a memoryview for all other wire types.
+    @param buf: A bytes-like object with the encoded message.
+    '''
+    buf = memoryview(buf)
+    pos = 0
+    end = len(buf)
+    while pos < end:
+        key, pos = read_varint(buf, pos)
+        wire = key & 7
+        if wire == 0:
+            value, pos = read_varint(buf, pos)
+        elif wire == 2:
+            length, pos = read_varint(buf, pos)
+            value = buf[pos:pos + length]
+            pos += length
+        elif wire == 1:
+            value = buf[pos:pos + 8]
+            pos += 8
+        elif wire == 5:
+            value = buf[pos:pos + 4]
+            pos += 4
+        else:
+            raise ValueError('Unsupported Protocol Buffer Wire Type {0}'.format(wire))
+        yield key >> 3, value
+
+
+def read_packed(buf):
+    '''
+    Function to decode a packed repeated varint field.
+    Returns the list of unsigned values.
+    @param buf: A bytes-like object with the packed values.
+    '''
+    values = []
+    pos = 0
+    end = len(buf)
+    while pos < end:
+        value, pos = read_varint(buf, pos)
+        values.append(value)
+    return values
+
+
+def read_packed_sint(buf, delta=False):
+    '''
+    Function to decode a packed repeated sint32 or sint64 field.
+    Returns the list of signed values.
+    @param buf: A bytes-like object with the packed values.
+    @param delta: Specifies if the values are delta coded.
+    '''
+    values = [to_zigzag(value) for value in read_packed(buf)]
+    if delta:
+        values = list(accumulate(values))
+    return values
+
+
+def read_packed_array(buf):
+    '''
+    Function to decode a packed repeated varint field with NumPy, all varints are decoded at once.
+    Returns a uint64 array of the unsigned values.
+    @param buf: A bytes-like object with the packed values.
+    '''
+    data = np.frombuffer(buf, dtype=np.uint8)
+    # Every varint ends with a byte without the continuation bit
+    ends = np.flatnonzero(data < 0x80)
+    if not len(ends):
+        return np.zeros(0, dtype=np.uint64)
+    data = data[:ends[-1] + 1]
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    shifts = 7 * (np.arange(len(data)) - np.repeat(starts, ends - starts + 1))
+    parts = (data & 0x7f).astype(np.uint64) << shifts.astype(np.uint64)
+    # The 7-bit groups of a varint do not overlap, so their sum equals the combined value
+    return np.add.reduceat(parts, starts)
+
+
+def read_packed_sint_array(buf, delta=False):
+    '''
+    Function to decode a packed repeated sint32 or sint64 field with NumPy.
+    Returns an int64 array of the signed values.
+    @param buf: A bytes-like object with the packed values.
+    @param delta: Specifies if the values are delta coded.
+    '''
+    values = read_packed_array(buf)
+    values = (values >> np.uint64(1)).astype(np.int64) ^ -(values & np.uint64(1)).astype(np.int64)
+    if delta:
+        values = np.cumsum(values)
+    return values
+
+
+def format_timestamp(seconds):
+    '''
+    Function to format a timestamp like the Overpass API.
+    Returns the timestamp e.g. "2018-06-01T00:00:00Z" or None, if the timestamp is missing.
+    @param seconds: The seconds since the epoch.
+    '''
+    if not seconds:
+        return None
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(seconds))
+
+
+def iter_blobs(f):
+    '''
+    Generator to read the blobs of an extract.
+    Yields tuples with the blob type e.g. "OSMData" and the decompressed data.
+    @param f: A binary file object of the extract.
+    '''
+    while True:
+        head = f.read(4)
+        if len(head) < 4:
+            return
+        header = dict(iter_fields(f.read(struct.unpack('>I', head)[0])))
+        blob = dict(iter_fields(f.read(header.get(3, 0))))
+        if 1 in blob:
+            data = bytes(blob[1])
+        elif 3 in blob:
+            data = zlib.decompress(blob[3])
+        else:
+            raise ValueError('Unsupported PBF Blob Compression, only raw and zlib blobs are supported')
+        yield bytes(header[1]).decode('utf-8'), data
+
+
+def check_header(data):
+    '''
+    Function to check that the features required by an extract are supported, raises a ValueError otherwise.
+    @param data: The decompressed data of the OSMHeader blob.
+    '''
+    required = {bytes(value).decode('utf-8') for number, value in iter_fields(data) if number == 4}
+    if required - SupportedFeatures:
+        raise ValueError('Unsupported PBF Features: {0}'.format(', '.join(sorted(required - SupportedFeatures))))
+
+
+def get_tags(keys, vals, strings):
+    '''
+    Function to resolve the tags of an element from the string table.
+    Returns the tag dictionary.
+    @param keys: The list of string indices of the keys.
+    @param vals: The list of string indices of the values.
+    @param strings: The string table of the block.
+    '''
+    return {strings[k]: strings[v] for k, v in zip(keys, vals)}
+
+
+def get_info_timestamp(buf, date_granularity):
+    '''
+    Function to decode the timestamp of an Info message.
+    Returns the timestamp string or None.
+    @param buf: The encoded Info message.
+    @param date_granularity: The granularity of timestamps in milliseconds.
+    '''
+    for number, value in iter_fields(buf):
+        if number == 2:
+            return format_timestamp(to_signed(value) * date_granularity // 1000)
+    return None
+
+
+def get_dense_tag_ranges(keys_vals, count):
+    '''
+    Function to find the tags of the nodes of a DenseNodes message, the keys and values of all nodes are concatenated
+    and the tags of every node end with 0.
+    Returns a tuple with the start and end positions of the tags of every node in the keys and values, or None if no node has tags.
+    @param keys_vals: The uint64 array of the string indices of the keys and values.
+    @param count: The number of nodes.
+    '''
+    if not len(keys_vals):
+        return None
+    ends = np.flatnonzero(keys_vals == 0)
+    if len(ends) != count:
+        # A value refers to the empty string 0, the ends are found pair by pair
+        ends = []
+        pos = 0
+        while pos < len(keys_vals):
+            if keys_vals[pos] == 0:
+                ends.append(pos)
+                pos += 1
+            else:
+                pos += 2
+        ends = np.array(ends, dtype=np.int64)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    return starts, ends
+
+
+def iter_dense_nodes(buf, block):
+    '''
+    Generator to decode the nodes of a DenseNodes message. The ids, coordinates and timestamps are decoded as arrays,
+    tag dictionaries are only built for the nodes with tags.
+    Yields a tuple ("locations", ids, lons, lats) with the arrays of all nodes first, then tuples ("node", id, timestamp, tags, lon, lat)
+    of the nodes with tags.
+    @param buf: The encoded DenseNodes message.
+    @param block: A dictionary with the string table and the granularities of the block.
+    '''
+    ids = lats = lons = np.zeros(0, dtype=np.int64)
+    keys_vals = np.zeros(0, dtype=np.uint64)
+    timestamps = None
+    for number, value in iter_fields(buf):
+        if number == 1:
+            ids = read_packed_sint_array(value, True)
+        elif number == 5:
+            for info_number, info_value in iter_fields(value):
+                if info_number == 2:
+                    timestamps = read_packed_sint_array(info_value, True)
+        elif number == 8:
+            lats = read_packed_sint_array(value, True)
+        elif number == 9:
+            lons = read_packed_sint_array(value, True)
+        elif number == 10:
+            keys_vals = read_packed_array(value)
+
+    granularity = block['granularity']
+    lons = (block['lon_offset'] + granularity * lons) / 1e9
+    lats = (block['lat_offset'] + granularity * lats) / 1e9
+    yield ('locations', ids, lons, lats)
+
+    ranges = get_dense_tag_ranges(keys_vals, len(ids))
+    if ranges is None:
+        return
+    strings = block['strings']
+    starts, ends = ranges
+    for idx in np.flatnonzero(ends > starts):
+        kv = keys_vals[starts[idx]:ends[idx]].tolist()
+        tags = {strings[k]: strings[v] for k, v in zip(kv[0::2], kv[1::2])}
+        timestamp = format_timestamp(int(timestamps[idx]) * block['date_granularity'] // 1000) if timestamps is not None and len(timestamps) else None
+        yield ('node', int(ids[idx]), timestamp, tags, float(lons[idx]), float(lats[idx]))
+
+
+def iter_group_elements(buf, block, skip_nodes=False):
+    '''
+    Generator to decode the elements of a PrimitiveGroup message.
+    Yields tuples ("locations", ids, lons, lats) with the arrays of the locations of all nodes, ("node", id, timestamp, tags, lon, lat)
+    for nodes with tags, ("way", id, timestamp, tags, refs) or ("relation", id, timestamp, tags, members), the members are tuples (type, ref, role).
+    @param buf: The encoded PrimitiveGroup message.
+    @param block: A dictionary with the string table and the granularities of the block.
+    @param skip_nodes: Specifies if nodes and ways are skipped without decoding them.
+    '''
+    strings = block['strings']
+    for number, value in iter_fields(buf):
+        if number in (1, 2, 3) and skip_nodes:
+            continue
+        if number == 2:
+            yield from iter_dense_nodes(value, block)
+            continue
+        if number not in (1, 3, 4):
+            continue
+        element_id = 0
+        keys = vals = []
+        timestamp = None
+        lat = lon = 0
+        refs = roles = memids = types = []
+        for field, fvalue in iter_fields(value):
+            if field == 1:
+                element_id = to_zigzag(fvalue) if number == 1 else to_signed(fvalue)
+            elif field == 2:
+                keys = read_packed(fvalue)
+            elif field == 3:
+                vals = read_packed(fvalue)
+            elif field == 4:
+                timestamp = get_info_timestamp(fvalue, block['date_granularity'])
+            elif field == 8:
+                if number == 1:
+                    lat = to_zigzag(fvalue)
+                elif number == 3:
+                    refs = read_packed_sint(fvalue, True)
+                else:
+                    roles = read_packed(fvalue)
+            elif field == 9:
+                if number == 1:
+                    lon = to_zigzag(fvalue)
+                else:
+                    memids = read_packed_sint(fvalue, True)
+            elif field == 10 and number == 4:
+                types = read_packed(fvalue)
+        tags = get_tags(keys, vals, strings)
+        if number == 1:
+            granularity = block['granularity']
+            lon = (block['lon_offset'] + granularity * lon) / 1e9
+            lat = (block['lat_offset'] + granularity * lat) / 1e9
+            yield ('locations', np.array([element_id], dtype=np.int64), np.array([lon]), np.array([lat]))
+            if tags:
+                yield ('node', element_id, timestamp, tags, lon, lat)
+        elif number == 3:
+            yield ('way', element_id, timestamp, tags, refs)
+        else:
+            members = tuple((MemberTypes[t], ref, strings[role]) for t, ref, role in zip(types, memids, roles))
+            yield ('relation', element_id, timestamp, tags, members)
+
+
+def iter_block_elements(data, skip_nodes=False):
+    '''
+    Generator to decode the elements of a PrimitiveBlock message.
+    Yields the elements, see iter_group_elements.
+    @param data: The decompressed data of an OSMData blob.
+    @param skip_nodes: Specifies if nodes and ways are skipped without decoding them.
+    '''
+    block = {'strings': [], 'granularity': 100, 'lat_offset': 0, 'lon_offset': 0, 'date_granularity': 1000}
+    groups = []
+    for number, value in iter_fields(data):
+        if number == 1:
+            block['strings'] = [bytes(s).decode('utf-8') for n, s in iter_fields(value) if n == 1]
+        elif number == 2:
+            groups.append(value)
+        elif number == 17:
+            block['granularity'] = value
+        elif number == 18:
+            block['date_granularity'] = value
+        elif number == 19:
+            block['lat_offset'] = to_signed(value)
+        elif number == 20:
+            block['lon_offset'] = to_signed(value)
+    for group in groups:
+        yield from iter_group_elements(group, block, skip_nodes)
+
+
+def iter_pbf_elements(path, skip_nodes=False):
+    '''
+    Generator to decode all elements of an extract block by block.
+    Yields the elements, see iter_group_elements.
+    @param path: The path of the .osm.pbf extract.
+    @param skip_nodes: Specifies if nodes and ways are skipped without decoding them.
+    '''
+    with open(path, 'rb') as f:
+        for blob_type, data in iter_blobs(f):
+            if blob_type == 'OSMHeader':
+                check_header(data)
+            elif blob_type == 'OSMData':
+                yield from iter_block_elements(data, skip_nodes)
+
+
+def get_clause_matchers(clauses):
+    '''
+    Function to compile the tag filters of the categories like the Overpass API, the values are matched with a regular expression.
+    Returns a dictionary with a list of tuples (o_tag, pattern) per element type, the pattern is None if every value matches.
+    @param clauses: A list of tuples (osm_el, o_tag, filters), o_tag is None if every element matches.
+    '''
+    matchers = {'node': [], 'way': [], 'relation': []}
+    for osm_el, o_tag, filters in clauses:
+        pattern = re.compile('|'.join([f.lower() for f in filters])) if filters else None
+        matchers[osm_el].append((o_tag.lower() if o_tag else None, pattern))
+    return matchers
+
+
+def match_tags(tags, matchers):
+    '''
+    Function to check if the tags of an element match one of the tag filters, returns the boolean values True or False.
+    @param tags: The tag dictionary of the element.
+    @param matchers: A list of tuples (o_tag, pattern), see get_clause_matchers.
+    '''
+    for o_tag, pattern in matchers:
+        if o_tag is None:
+            return True
+        value = tags.get(o_tag)
+        if value is not None and (pattern is None or pattern.search(value)):
+            return True
+    return False
+
+
+def in_bbox(coords, b_box):
+    '''
+    Function to check if one of the coordinates lies within a bounding box, returns the boolean values True or False.
+    @param coords: A float64 array of shape (n, 2) with lon/lat pairs.
+    @param b_box: A tuple (minLat, minLon, maxLat, maxLon).
+    '''
+    s, w, n, e = b_box
+    lons = coords[:, 0]
+    lats = coords[:, 1]
+    return bool(np.any((lons >= w) & (lons <= e) & (lats >= s) & (lats <= n)))
+
+
+def read_pbf_elements(path, b_box, clauses, node_store='sparse', store_directory=None):
+    '''
+    Function to read the elements of categories from an extract, like a union query of the Overpass API. Nodes are selected, if they match
+    a tag filter and lie within the bounding box, ways and relations, if they match a tag filter and have a vertex within the bounding box.
+    The vertices of ways are resolved through a memory-mapped store of all node locations, relations are read first in a separate pass,
+    so the geometries of their member ways can be stored when the ways are read. Ways with nodes missing in the extract are skipped.
+    Returns an OSMElements set, see osm_runner_elements.
+    @param path: The path of the .osm.pbf extract.
+    @param b_box: A tuple (minLat, minLon, maxLat, maxLon).
+    @param clauses: A list of tuples (osm_el, o_tag, filters), o_tag is None if every element matches.
+    @param node_store: The mode of the node location store, "dense" or "sparse", see NodeLocationStore.
+    @param store_directory: The folder of the temporary files of the node location store.
+    '''
+    matchers = get_clause_matchers(clauses)
+    loader = ElementLoader()
+
+    # Pass 1: The relations of the categories and their member ways
+    relations = []
+    member_ways = set()
+    if matchers['relation']:
+        for element in iter_pbf_elements(path, True):
+            if element[0] == 'relation' and match_tags(element[3], matchers['relation']):
+                relations.append(element)
+                member_ways.update(ref for m_type, ref, role in element[4] if m_type == 'way')
+
+    # Pass 2: The node locations, the nodes and the ways of the categories
+    locations = NodeLocationStore(node_store, store_directory)
+    incomplete = 0
+    try:
+        for element in iter_pbf_elements(path):
+            if element[0] == 'locations':
+                kind, ids, lons, lats = element
+                locations.add_many(ids, lons, lats)
+            elif element[0] == 'node':
+                kind, node_id, timestamp, tags, lon, lat = element
+                if matchers['node'] and match_tags(tags, matchers['node']):
+                    s, w, n, e = b_box
+                    if s <= lat <= n and w <= lon <= e:
+                        loader.add_node(node_id, timestamp, tags, lon, lat)
+            elif element[0] == 'way':
+                kind, way_id, timestamp, tags, refs = element
+                selected = bool(matchers['way']) and match_tags(tags, matchers['way'])
+                if not refs or not (selected or way_id in member_ways):
+                    continue
+                coords, found = locations.lookup(refs)
+                if not found.all():
+                    incomplete += 1
+                    continue
+                if selected and in_bbox(coords, b_box):
+                    start, end = loader.add_coords(way_id, coords)
+                    loader.add_way(way_id, timestamp, tags, refs[0] == refs[-1], start, end)
+                elif way_id in member_ways:
+                    loader.add_coords(way_id, coords)
+    finally:
+        locations.close()
+
+    if incomplete:
+        print('Skipped '+str(incomplete)+' ways with nodes missing in the extract '+path)
+
+    for kind, relation_id, timestamp, tags, members in relations:
+        member_coords = [loader.get_coords(ref) for m_type, ref, role in members if m_type == 'way']
+        if any(coords is not None and len(coords) and in_bbox(coords, b_box) for coords in member_coords):
+            loader.add_relation(relation_id, timestamp, tags, members)
+
+    return loader.finish()
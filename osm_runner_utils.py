@@ -19,11 +19,18 @@ Format = '[out:json]'
 
 # Period: http://wiki.openstreetmap.org/wiki/Overpass_API/Overpass_QL
 # Section 5 / 5.1
-Output = '(._;>;);out meta geom qt;'
+# Output: The leanest output profile of each element type is requested, the geometries of ways and relation members are returned inline,
+# so the untagged nodes of ways are not requested. Version, timestamp, changeset and user are only requested if "meta" is "yes",
+# the settings are overwritten by osmconfig.json.
+Output = {"meta": "no"}
+OutputProfiles = {
+    "body": {"node": "out body qt;", "way": "out geom qt;", "relation": "out body geom qt;"},
+    "meta": {"node": "out meta qt;", "way": "out meta geom qt;", "relation": "out meta geom qt;"},
+}
 
 # OSM Features: http://wiki.openstreetmap.org/wiki/Map_Features
 # E.G. "highway" = ["primary", "residential"]
-# E.G. [out:json];way["highway"~"primary|residential"](bounding_box);(._;>;);out geom qt;
+# E.G. [out:json];way["highway"~"primary|residential"](bounding_box);out geom qt;
 Filters = {
     "aerialway": [],
     "aeroway": [],
@@ -55,3 +62,41 @@ Filters = {
 
 # OSM Element Types
 Elements = {"point": "node", "line": "way", "polygon": "way"}
+
+# Esri Geometry Types of the emitted features
+GeometryTypes = {"point": "esriGeometryPoint", "line": "esriGeometryPolyline", "polygon": "esriGeometryPolygon"}
+
+# Tiling: The bounding box is split into a quadtree of tiles with an area (in square degrees) below "maxTileArea".
+# A tile is split again, if the OSM server times out or runs out of memory, but not more than "maxDepth" times.
+# Tiles are requested simultaneously by "maxWorkers" threads, the settings are overwritten by osmconfig.json.
+Tiling = {"isEnabled": "no", "maxTileArea": 1.7, "maxDepth": 4, "maxWorkers": 4}
+
+# Cache: Responses of the OSM server are stored compressed in "directory" and reused for "ttlMinutes" minutes.
+# The least recently used responses are removed, if the cache exceeds "maxSizeMB", the settings are overwritten by osmconfig.json.
+Cache = {"isEnabled": "no", "directory": "osm_cache", "ttlMinutes": 60, "maxSizeMB": 512}
+
+# Streaming: Responses of the OSM server are written compressed in chunks of "chunkSize" bytes to a spool file in the "spoolDirectory"
+# and their elements are decoded one by one, the spool files are kept for replays if "keepSpool" is "yes",
+# the settings are overwritten by osmconfig.json.
+Streaming = {"isEnabled": "no", "chunkSize": 65536, "spoolDirectory": "", "keepSpool": "no"}
+
+# Overpass: Requests are sent to the first of the "endpoints", the next one is used if an endpoint fails.
+# All threads share a limit of "requestsPerMinute", failed requests are retried up to "maxRetries" times with
+# an exponential backoff starting at "backoffSeconds". Every endpoint keeps up to "poolSize" connections alive,
+# the settings are overwritten by osmconfig.json.
+Overpass = {"endpoints": ["https://lz4.overpass-api.de/api/interpreter", "https://z.overpass-api.de/api/interpreter"],
+            "requestsPerMinute": 20, "maxRetries": 5, "backoffSeconds": 5, "maxBackoffSeconds": 300, "timeout": 900, "poolSize": 8}
+
+# Extract: The elements are read from the local .osm.pbf extract "file" instead of requesting them from the Overpass API.
+# The node locations are stored in memory-mapped files in "nodeStoreDirectory" (the temporary folder if empty), either "dense"
+# indexed by node id or "sparse" with sorted ids, the settings are overwritten by osmconfig.json.
+Extract = {"isEnabled": "no", "file": "", "nodeStore": "sparse", "nodeStoreDirectory": ""}
+
+# ProcessPool: The geometries are constructed by "maxWorkers" worker processes in batches of "batchSize" elements,
+# the settings are overwritten by osmconfig.json.
+ProcessPool = {"isEnabled": "no", "maxWorkers": 4, "batchSize": 500}
+
+# Schema: The tightest Esri field type of every tag field is inferred from its values, string fields get the observed
+# maximum length, but at least "minStringLength" characters. Otherwise all tags are strings of 1000 characters,
+# the settings are overwritten by osmconfig.json.
+Schema = {"isEnabled": "yes", "minStringLength": 1}
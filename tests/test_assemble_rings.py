@@ -0,0 +1,103 @@
+'''
+Tests of the ring assembly of multipolygon relations in osm_runner.py.
+Run with the following command from the folder of the repository: python -m unittest discover tests
+'''
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from osm_runner import assemble_rings, assemble_multipolygon, ring_signed_area
+
+# A square split into three member ways, the ways are connected end to start
+SQUARE_PATHS = [[(0, 0), (0, 10), (10, 10)], [(10, 10), (10, 0)], [(10, 0), (0, 0)]]
+
+
+def ring_key(ring):
+    '''
+    Function to describe a closed ring independent of its start vertex and orientation.
+    Returns the sorted tuple of its undirected edges.
+    @param ring: A closed ring, a list of coordinate tuples or a packed coordinate array.
+    '''
+    ring = [tuple(float(c) for c in v) for v in ring]
+    return tuple(sorted(tuple(sorted(edge)) for edge in zip(ring[:-1], ring[1:])))
+
+
+class AssembleRingsTest(unittest.TestCase):
+
+    def assertSquare(self, rings):
+        self.assertEqual(len(rings), 1)
+        self.assertEqual(rings[0][0], rings[0][-1])
+        self.assertEqual(ring_key(rings[0]), ring_key([(0, 0), (0, 10), (10, 10), (10, 0), (0, 0)]))
+
+    def test_forward_order(self):
+        self.assertSquare(assemble_rings(SQUARE_PATHS))
+
+    def test_reversed_members(self):
+        # Every second way is digitized in the opposite direction
+        paths = [SQUARE_PATHS[0], list(reversed(SQUARE_PATHS[1])), SQUARE_PATHS[2]]
+        self.assertSquare(assemble_rings(paths))
+        self.assertSquare(assemble_rings([list(reversed(path)) for path in SQUARE_PATHS]))
+
+    def test_rotated_member_order(self):
+        self.assertSquare(assemble_rings(SQUARE_PATHS[1:] + SQUARE_PATHS[:1]))
+        self.assertSquare(assemble_rings([SQUARE_PATHS[2], SQUARE_PATHS[0], SQUARE_PATHS[1]]))
+
+    def test_closed_member(self):
+        ring = [(0, 0), (0, 1), (1, 1), (0, 0)]
+        self.assertEqual(assemble_rings([ring]), [ring])
+
+    def test_several_rings(self):
+        other = [[(20, 20), (20, 21), (21, 21)], [(21, 21), (20, 20)]]
+        rings = assemble_rings([other[1], SQUARE_PATHS[0], other[0], SQUARE_PATHS[2], SQUARE_PATHS[1]])
+        self.assertEqual(len(rings), 2)
+
+    def test_unclosed_chain(self):
+        self.assertEqual(assemble_rings(SQUARE_PATHS[:2]), [])
+        self.assertEqual(assemble_rings([[(0, 0), (1, 1)]]), [])
+
+    def test_unclosed_chain_next_to_ring(self):
+        rings = assemble_rings(SQUARE_PATHS + [[(20, 20), (20, 21), (21, 21)]])
+        self.assertSquare(rings)
+
+
+class AssembleMultipolygonTest(unittest.TestCase):
+
+    def test_orientation(self):
+        # The outer ring is digitized counterclockwise and the inner ring clockwise, both are turned
+        outer = [[(0, 0), (10, 0), (10, 10)], [(10, 10), (0, 10), (0, 0)]]
+        inner = [[(2, 2), (2, 4), (4, 4), (4, 2), (2, 2)]]
+        outerrings, innerrings = assemble_multipolygon(outer, inner)
+        self.assertEqual(len(outerrings), 1)
+        self.assertEqual(len(innerrings), 1)
+        self.assertLess(ring_signed_area(outerrings[0]), 0)
+        self.assertGreater(ring_signed_area(innerrings[0]), 0)
+
+    def test_orientation_kept(self):
+        outer = [[(0, 0), (0, 10), (10, 10), (10, 0), (0, 0)]]
+        inner = [[(2, 2), (4, 2), (4, 4), (2, 4), (2, 2)]]
+        outerrings, innerrings = assemble_multipolygon(outer, inner)
+        self.assertEqual(outerrings[0].tolist(), [list(map(float, v)) for v in outer[0]])
+        self.assertEqual(innerrings[0].tolist(), [list(map(float, v)) for v in inner[0]])
+
+    def test_unclosed_chains_dropped(self):
+        outerrings, innerrings = assemble_multipolygon(SQUARE_PATHS[:2], [[(2, 2), (2, 4), (4, 4)]])
+        self.assertEqual(outerrings, [])
+        self.assertEqual(innerrings, [])
+
+    def test_bowtie_dropped(self):
+        bowtie = [(0, 0), (10, 10), (10, 0), (0, 10), (0, 0)]
+        outerrings, innerrings = assemble_multipolygon([bowtie, [(20, 20), (20, 21), (21, 21), (20, 20)]], [bowtie])
+        self.assertEqual(len(outerrings), 1)
+        self.assertEqual(ring_key(outerrings[0]), ring_key([(20, 20), (20, 21), (21, 21), (20, 20)]))
+        self.assertEqual(innerrings, [])
+
+    def test_degenerate_ring_dropped(self):
+        outerrings, innerrings = assemble_multipolygon([[(0, 0), (1, 1), (2, 2), (0, 0)]], [])
+        self.assertEqual(outerrings, [])
+
+
+if __name__ == '__main__':
+    unittest.main()